@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import contextlib
 import inspect
 import logging
 import os
@@ -7,8 +8,13 @@ import pickle
 import re
 import sys
 import warnings
-from typing import Literal
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import chain
+from multiprocessing import Lock, Pool
+from typing import TYPE_CHECKING, Literal
 
+import dill
 import h5py
 import matplotlib.pyplot as plt
 import numpy as np
@@ -22,10 +28,262 @@ from deeprank2.domain import edgestorage as Efeat
 from deeprank2.domain import gridstorage
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.domain import targetstorage as targets
+from deeprank2.utils.datasetindex import load_index, read_graph_sizes
+from deeprank2.utils.graph import get_feature_names, read_features
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from numpy.typing import NDArray
+
+    from deeprank2.utils.datasetindex import DatasetIndex
 
 _log = logging.getLogger(__name__)
 
 
+# maximum number of hdf5 files kept open for reading by the datasets, per process
+MAX_OPEN_HDF5_FILES = 128
+
+
+class _HDF5FilePool:
+    """Keeps hdf5 files open for reading, such that loading a dataset item does not need to open and close its file.
+
+    The least recently used files are closed when more than `max_open_files` are open, and files that were modified
+    since they were opened are reopened. File handles are never shared between processes: after a fork (e.g. into
+    DataLoader workers), the child process opens its own.
+    """
+
+    def __init__(self, max_open_files: int):
+        self._max_open_files = max_open_files
+        self._files: OrderedDict[str, tuple[h5py.File, int]] = OrderedDict()
+        self._pid = os.getpid()
+
+    @contextmanager
+    def open(self, hdf5_path: str) -> Iterator[h5py.File]:
+        """Get an open handle to an hdf5 file, which stays open after use."""
+        if self._pid != os.getpid():
+            # inherited from the parent process, these handles must not be used here
+            self._files = OrderedDict()
+            self._pid = os.getpid()
+
+        mtime = os.stat(hdf5_path).st_mtime_ns
+        hdf5_file, opened_mtime = self._files.get(hdf5_path, (None, None))
+        if hdf5_file is None or not hdf5_file.id.valid or opened_mtime != mtime:
+            self.close(hdf5_path)
+            hdf5_file = h5py.File(hdf5_path, "r")
+            self._files[hdf5_path] = (hdf5_file, mtime)
+            while len(self._files) > self._max_open_files:
+                _, (oldest_file, _) = self._files.popitem(last=False)
+                oldest_file.close()
+        else:
+            self._files.move_to_end(hdf5_path)
+
+        yield hdf5_file
+
+    def close(self, hdf5_path: str | None = None) -> None:
+        """Close the given file, or all files if None, if they are open in the current process."""
+        hdf5_paths = list(self._files) if hdf5_path is None else [hdf5_path]
+        for path in hdf5_paths:
+            if path in self._files:
+                hdf5_file, _ = self._files.pop(path)
+                if self._pid == os.getpid():
+                    hdf5_file.close()
+
+
+_hdf5_files = _HDF5FilePool(MAX_OPEN_HDF5_FILES)
+
+
+def close_hdf5_files(hdf5_path: str | None = None) -> None:
+    """Close the hdf5 files that the datasets keep open for reading in the current process.
+
+    This is needed before a file can be written to by the same process.
+
+    Args:
+        hdf5_path: Path to the file to close. If None, all files are closed. Defaults to None.
+    """
+    _hdf5_files.close(hdf5_path)
+
+
+class _SharedItemCache:
+    """Keeps prepared dataset items in shared memory, such that they are loaded from disk once for all epochs and processes.
+
+    Items are pickled into a buffer of `max_size` bytes, which is allocated in shared memory when the cache is created. The
+    buffer and its bookkeeping are shared with the processes that load items from the dataset, e.g. DataLoader workers,
+    either by forking or by pickling the dataset when the process is started. The buffer is used as a ring: when it is
+    full, the items that were stored first are evicted to make room. Copies of the dataset (e.g. the training and validation
+    splits made by :class:`deeprank2.trainer.Trainer`) share the cache, because items are addressed by file and entry name.
+
+    Args:
+        keys: (file path, entry name) of all items that can be cached.
+        max_size: Size of the buffer, in bytes.
+    """
+
+    def __init__(self, keys: list[tuple[str, str]], max_size: int):
+        self.max_size = max_size
+        self._slots = {key: slot for slot, key in enumerate(keys)}
+        self._buffer = torch.empty(max_size, dtype=torch.uint8).share_memory_()
+        # offset of each item in the buffer, or -1 if it is not cached
+        self._offsets = torch.full((len(keys),), -1, dtype=torch.int64).share_memory_()
+        self._sizes = torch.zeros(len(keys), dtype=torch.int64).share_memory_()
+        # write position, number of hits, number of misses
+        self._state = torch.zeros(3, dtype=torch.int64).share_memory_()
+        self._lock = Lock()
+
+    def __deepcopy__(self, memo: dict) -> _SharedItemCache:
+        # the cache is shared by all copies of a dataset
+        return self
+
+    @property
+    def hits(self) -> int:
+        """Number of items that were loaded from the cache, by all processes."""
+        return int(self._state[1])
+
+    @property
+    def misses(self) -> int:
+        """Number of items that were loaded from disk, by all processes."""
+        return int(self._state[2])
+
+    def get(self, key: tuple[str, str], load: Callable[[str, str], Data]) -> Data:
+        """Gets an item from the cache, or loads and caches it.
+
+        Args:
+            key: (file path, entry name) of the item.
+            load: Function that loads the item from the file path and entry name.
+
+        Returns:
+            :class:`torch_geometric.data.data.Data`: The item.
+        """
+        slot = self._slots.get(key)
+        if slot is None:
+            return load(*key)
+
+        payload = None
+        with self._lock:
+            offset = int(self._offsets[slot])
+            if offset >= 0:
+                # copied while locked, such that the item cannot be evicted while it is read
+                payload = self._buffer[offset : offset + self._sizes[slot]].numpy().tobytes()
+                self._state[1] += 1
+            else:
+                self._state[2] += 1
+        if payload is not None:
+            return pickle.loads(payload)  # noqa: S301
+
+        item = load(*key)
+        payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) <= self.max_size:
+            with self._lock:
+                if self._offsets[slot] < 0:  # not cached by another process in the meantime
+                    self._store(slot, payload)
+        return item
+
+    def _store(self, slot: int, payload: bytes) -> None:
+        start = int(self._state[0])
+        if start + len(payload) > self.max_size:
+            start = 0
+        end = start + len(payload)
+        evicted = (self._offsets >= 0) & (self._offsets < end) & (self._offsets + self._sizes > start)
+        self._offsets[evicted] = -1
+        self._buffer.numpy()[start:end] = np.frombuffer(payload, dtype=np.uint8)
+        self._offsets[slot] = start
+        self._sizes[slot] = len(payload)
+        self._state[0] = end
+
+
+# number of entries whose values are accumulated at once when computing feature statistics
+STATISTICS_BATCH_SIZE = 256
+
+
+class _FeatureStatistics:
+    """Running count, mean and sum of squared deviations of the values of one feature channel, ignoring NaNs.
+
+    Batches of values are combined with the parallel variant of Welford's algorithm, such that the statistics of all entries
+    are computed in one pass and statistics of separate files can be merged.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.nan_count = 0
+
+    def update(self, values: NDArray) -> None:
+        """Adds a batch of values."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        nans = np.isnan(values)
+        self.nan_count += int(np.count_nonzero(nans))
+        values = values[~nans]
+        if values.size > 0:
+            other = _FeatureStatistics()
+            other.count = values.size
+            other.mean = np.mean(values)
+            other.m2 = np.sum((values - other.mean) ** 2)
+            self.merge(other)
+
+    def merge(self, other: _FeatureStatistics) -> None:
+        """Adds the values of another :class:`_FeatureStatistics`."""
+        self.nan_count += other.nan_count
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def std(self) -> float:
+        """Population standard deviation of the values."""
+        return np.sqrt(self.m2 / self.count) if self.count > 0 else np.nan
+
+
+def _get_feature_statistics(  # noqa: C901
+    fname: str,
+    features_dict: dict[str, list[str]],
+    features_transform: bytes,
+    subset: list[str] | None,
+) -> dict[str, _FeatureStatistics]:
+    """Computes the statistics of each feature channel of the entries in one hdf5 file, reading each feature once.
+
+    The channels and transformations are the same as in :meth:`DeeprankDataset.hdf5_to_pandas`.
+    `features_transform` is serialized with dill, so that it can contain lambda functions when running in a separate process.
+    """
+    features_transform = dill.loads(features_transform)  # noqa: S301
+    subset = None if subset is None else set(subset)
+    statistics = {}
+    with h5py.File(fname, "r") as f:
+        entry_name = next(iter(f.keys()))
+        entry_names = [entry for entry in f if subset is None or entry in subset]
+
+        for feat_type, feats in features_dict.items():
+            transforms = []
+            for feat in feats:
+                transform = None
+                if features_transform:
+                    transform = features_transform.get("all", {}).get("transform")
+                    if (transform is None) and (feat in features_transform):
+                        transform = features_transform.get(feat, {}).get("transform")
+                transforms.append(transform)
+            # the number of channels is taken from the first entry of the file
+            shapes = [vals.shape for vals in read_features(f[entry_name][feat_type], feats)]
+            cols = [[f"{feat}_{i}" for i in range(shape[1])] if len(shape) == 2 else [feat] for feat, shape in zip(feats, shapes, strict=True)]  # noqa: PLR2004
+            for col in chain.from_iterable(cols):
+                statistics.setdefault(col, _FeatureStatistics())
+
+            for batch_start in range(0, len(entry_names), STATISTICS_BATCH_SIZE):
+                batch = {col: [] for col in chain.from_iterable(cols)}
+                for entry in entry_names[batch_start : batch_start + STATISTICS_BATCH_SIZE]:
+                    entry_values = read_features(f[entry][feat_type], feats)
+                    for feat_cols, shape, transform, vals in zip(cols, shapes, transforms, entry_values, strict=True):
+                        channels = vals.T if len(shape) == 2 else [vals]  # noqa: PLR2004
+                        for col, channel in zip(feat_cols, channels, strict=True):
+                            batch[col].append(np.ravel(transform(channel) if transform else channel))
+                for col, values in batch.items():
+                    if len(values) > 0:
+                        statistics[col].update(np.concatenate(values))
+    return statistics
+
+
 class DeeprankDataset(Dataset):
     """Parent class of :class:`GridDataset` and :class:`GraphDataset`.
 
@@ -82,6 +340,8 @@ class DeeprankDataset(Dataset):
         self.train_means = None
         self.train_devs = None
 
+        self._item_cache = None
+
         # get the device
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -233,11 +493,17 @@ class DeeprankDataset(Dataset):
             if self.use_tqdm:
                 hdf5_path_iterator.set_postfix(entry_name=os.path.basename(hdf5_path))
             try:
+                index = load_index(hdf5_path)
+                if index is not None:
+                    self.index_entries += [(hdf5_path, entry_name) for entry_name in self._get_indexed_entry_names(index)]
+                    continue
+
                 with h5py.File(hdf5_path, "r") as hdf5_file:
                     if self.subset is None:
                         entry_names = list(hdf5_file.keys())
                     else:
-                        entry_names = [entry_name for entry_name in self.subset if entry_name in list(hdf5_file.keys())]
+                        present_entry_names = set(hdf5_file.keys())
+                        entry_names = [entry_name for entry_name in self.subset if entry_name in present_entry_names]
 
                     # skip self._filter_targets when target_filter is None, improve performance using list comprehension.
                     if self.target_filter is None:
@@ -248,6 +514,17 @@ class DeeprankDataset(Dataset):
             except Exception:  # noqa: BLE001
                 _log.exception(f"on {hdf5_path}")
 
+    def _get_indexed_entry_names(self, index: DatasetIndex) -> list[str]:
+        """Selects the entries of one .HDF5 file from its sidecar index, without opening the file."""
+        entry_names = index.entry_names
+        if self.target_filter is not None:
+            entry_names = entry_names[index.filter_targets(self.target_filter)]
+        entry_names = entry_names.tolist()
+        if self.subset is None:
+            return entry_names
+        selected_entry_names = set(entry_names)
+        return [entry_name for entry_name in self.subset if entry_name in selected_entry_names]
+
     def _filter_targets(self, grp: h5py.Group) -> bool:
         """Filters the entry according to a dictionary.
 
@@ -296,6 +573,58 @@ class DeeprankDataset(Dataset):
         """
         return len(self.index_entries)
 
+    def enable_cache(self, max_size: int) -> None:
+        """Keeps the items of the dataset in shared memory once they are loaded, for up to `max_size` bytes.
+
+        Loaded items are then reused in later epochs and by all DataLoader workers, such that each item is read from disk and
+        transformed once if the dataset fits within `max_size`. Otherwise, the items that were cached first are evicted to make
+        room for new ones. The memory is allocated when this method is called. Copies of the dataset share its cache, so it can be
+        enabled before the dataset is split into training and validation sets by :class:`deeprank2.trainer.Trainer`.
+
+        Note that cached items are not updated when the .HDF5 files are modified; call this method again to empty the cache.
+
+        Args:
+            max_size: Size of the cache, in bytes.
+        """
+        if max_size <= 0:
+            msg = f"`max_size` must be positive, but was given as {max_size}"
+            raise ValueError(msg)
+        self._item_cache = _SharedItemCache(self.index_entries, max_size)
+
+    def get_target_values(self) -> NDArray:
+        """Gets the value of the target of each item, without loading the items.
+
+        The values are read from the index of the .HDF5 files if it is up to date (see :func:`deeprank2.utils.datasetindex.build_index`),
+        or else one scalar per entry is read from the files. The `target_transform` is not applied.
+
+        Returns:
+            NDArray: Value of the target of each item, in the order of the items, or NaN for items that lack the target.
+        """
+        target_values = np.full(len(self.index_entries), np.nan)
+        if self.target is None:
+            return target_values
+
+        positions_per_file = {}
+        for position, (hdf5_path, entry_name) in enumerate(self.index_entries):
+            positions_per_file.setdefault(hdf5_path, []).append((position, entry_name))
+
+        for hdf5_path, positions in positions_per_file.items():
+            index = load_index(hdf5_path)
+            if index is not None:
+                if self.target in index.target_values:
+                    index_positions = {entry_name: index_position for index_position, entry_name in enumerate(index.entry_names.tolist())}
+                    index_values = index.target_values[self.target]
+                    for position, entry_name in positions:
+                        target_values[position] = index_values[index_positions[entry_name]]
+                continue
+
+            with _hdf5_files.open(hdf5_path) as hdf5_file:
+                for position, entry_name in positions:
+                    target_path = f"{entry_name}/{targets.VALUES}/{self.target}"
+                    if target_path in hdf5_file:
+                        target_values[position] = hdf5_file[target_path][()]
+        return target_values
+
     def hdf5_to_pandas(  # noqa: C901
         self,
     ) -> pd.DataFrame:
@@ -319,8 +648,11 @@ class DeeprankDataset(Dataset):
                 df_dict = {}
                 df_dict["id"] = entry_names
 
-                for feat_type in self.features_dict:
-                    for feat in self.features_dict[feat_type]:
+                for feat_type, feats in self.features_dict.items():
+                    # read all features of this type at once per entry
+                    entries_values = [read_features(f[entry][feat_type], feats) for entry in entry_names]
+                    first_values = read_features(f[entry_name][feat_type], feats)
+                    for feat_idx, feat in enumerate(feats):
                         # reset transform for each feature
                         transform = None
                         if self.features_transform:
@@ -328,24 +660,21 @@ class DeeprankDataset(Dataset):
                             if (transform is None) and (feat in self.features_transform):
                                 transform = self.features_transform.get(feat, {}).get("transform")
                         # Check the number of channels the features have
-                        if f[entry_name][feat_type][feat][()].ndim == 2:  # noqa:PLR2004
-                            for i in range(f[entry_name][feat_type][feat][:].shape[1]):
-                                df_dict[feat + "_" + str(i)] = [f[entry_name][feat_type][feat][:][:, i] for entry_name in entry_names]
+                        if first_values[feat_idx].ndim == 2:  # noqa:PLR2004
+                            for i in range(first_values[feat_idx].shape[1]):
+                                df_dict[feat + "_" + str(i)] = [entry_values[feat_idx][:, i] for entry_values in entries_values]
                                 # apply transformation for each channel in this feature
                                 if transform:
                                     df_dict[feat + "_" + str(i)] = [transform(row) for row in df_dict[feat + "_" + str(i)]]
                         else:
-                            df_dict[feat] = [
-                                f[entry_name][feat_type][feat][:] if f[entry_name][feat_type][feat][()].ndim == 1 else f[entry_name][feat_type][feat][()]
-                                for entry_name in entry_names
-                            ]
+                            df_dict[feat] = [entry_values[feat_idx] for entry_values in entries_values]
                             # apply transformation
                             if transform:
                                 df_dict[feat] = [transform(row) for row in df_dict[feat]]
 
                 df_temp = pd.DataFrame(data=df_dict)
-            df_concat = pd.concat([df_final, df_temp])
-        self.df = df_concat.reset_index(drop=True)
+            df_final = pd.concat([df_final, df_temp])
+        self.df = df_final.reset_index(drop=True)
         return self.df
 
     def save_hist(  # noqa: C901
@@ -445,21 +774,30 @@ class DeeprankDataset(Dataset):
             fig.savefig(fname)
             plt.close(fig)
 
-    def _compute_mean_std(self) -> None:
-        means = {
-            col: round(np.nanmean(np.concatenate(self.df[col].values)), 1)
-            if isinstance(self.df[col].to_numpy()[0], np.ndarray)
-            else round(np.nanmean(self.df[col].to_numpy()), 1)
-            for col in self.df.columns[1:]
-        }
-        devs = {
-            col: round(np.nanstd(np.concatenate(self.df[col].to_numpy())), 1)
-            if isinstance(self.df[col].to_numpy()[0], np.ndarray)
-            else round(np.nanstd(self.df[col].to_numpy()), 1)
-            for col in self.df.columns[1:]
-        }
-        self.means = means
-        self.devs = devs
+    def _compute_mean_std(self, cpu_count: int = 1) -> None:
+        """Computes the mean and standard deviation of each feature channel, ignoring NaNs, in one pass over the hdf5 files.
+
+        The features are transformed as in :meth:`hdf5_to_pandas`. If `cpu_count` is larger than 1, multiple files are
+        processed in parallel by that many processes, capped by the number of files and of CPUs.
+        """
+        args = [(fname, self.features_dict, dill.dumps(self.features_transform), self.subset) for fname in self.hdf5_paths]
+        cpu_count = min(cpu_count, len(args), os.cpu_count() or 1)
+        if cpu_count > 1:
+            with Pool(cpu_count) as pool:
+                files_statistics = pool.starmap(_get_feature_statistics, args)
+        else:
+            files_statistics = [_get_feature_statistics(*arg) for arg in args]
+
+        statistics = {}
+        for file_statistics in files_statistics:
+            for col, col_statistics in file_statistics.items():
+                statistics.setdefault(col, _FeatureStatistics()).merge(col_statistics)
+
+        for col, col_statistics in statistics.items():
+            if col_statistics.nan_count > 0:
+                _log.warning(f"{col_statistics.nan_count} NaN values of {col} are ignored for computing its mean and standard deviation.")
+        self.means = {col: round(np.float64(col_statistics.mean), 1) if col_statistics.count > 0 else np.nan for col, col_statistics in statistics.items()}
+        self.devs = {col: round(np.float64(col_statistics.std), 1) for col, col_statistics in statistics.items()}
 
 
 # Grid features are stored per dimension and named accordingly.
@@ -659,6 +997,8 @@ class GridDataset(DeeprankDataset):
             :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, entry_names.
         """
         file_path, entry_name = self.index_entries[idx]
+        if self._item_cache is not None:
+            return self._item_cache.get((file_path, entry_name), self.load_one_grid)
         return self.load_one_grid(file_path, entry_name)
 
     def load_one_grid(self, hdf5_path: str, entry_name: str) -> Data:
@@ -671,7 +1011,7 @@ class GridDataset(DeeprankDataset):
         Returns:
             :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, entry_names.
         """
-        with h5py.File(hdf5_path, "r") as hdf5_file:
+        with _hdf5_files.open(hdf5_path) as hdf5_file:
             grp = hdf5_file[entry_name]
 
             mapped_features_group = grp[gridstorage.MAPPED_FEATURES]
@@ -707,6 +1047,107 @@ class GridDataset(DeeprankDataset):
         return data
 
 
+class _FeatureTransformPlan:
+    """Transformations and standardization of the node or edge features of a :class:`GraphDataset`.
+
+    The settings of each feature are resolved once from `features_transform`, `means` and `devs`, such that loading an entry
+    only applies the transformations and standardizes all features at once on the stacked feature matrix.
+
+    Args:
+        features: Names of the features, in the order in which they are stacked. Metafeatures (starting with "_") are ignored.
+        features_transform: Transformations and/or standardization per feature, see :class:`GraphDataset`.
+        means: Mean value per feature (or per channel for multi-channel features), used for standardization.
+        devs: Standard deviation per feature (or per channel for multi-channel features), used for standardization.
+    """
+
+    def __init__(
+        self,
+        features: list[str],
+        features_transform: dict | None,
+        means: dict[str, float] | None,
+        devs: dict[str, float] | None,
+    ):
+        self.features = [feat for feat in features if feat[0] != "_"]
+        self._transforms = []
+        self._scaling = []
+        for idx, feat in enumerate(self.features):
+            transform = None
+            standard = None
+            if features_transform is not None:
+                transform = features_transform.get("all", {}).get("transform")
+                standard = features_transform.get("all", {}).get("standardize")
+                # if no transformation or standardization is set for all features, check if one is set for the current feature
+                if (transform is None) and (feat in features_transform):
+                    transform = features_transform.get(feat, {}).get("transform")
+                if (standard is None) and (feat in features_transform):
+                    standard = features_transform.get(feat, {}).get("standardize")
+
+            if transform:
+                self._transforms.append((idx, feat, transform))
+            if standard:
+                # single-channel features use their own entry, multi-channel features all entries containing their name
+                self._scaling.append(
+                    (
+                        means.get(feat),
+                        devs.get(feat),
+                        [mean_value for mean_key, mean_value in means.items() if feat in mean_key],
+                        [dev_value for dev_key, dev_value in devs.items() if feat in dev_key],
+                    ),
+                )
+            else:
+                self._scaling.append(None)
+
+        self.standardize = any(scaling is not None for scaling in self._scaling)
+        # mean and std vectors of the stacked feature matrix, per shape of the features
+        self._scaling_vectors = {}
+
+    def apply(self, feature_values: list[NDArray], entry_name: str, fname: str) -> NDArray:
+        """Transforms, stacks and standardizes the values of the features of one entry.
+
+        Args:
+            feature_values: Values of each feature, in the order of `features`.
+            entry_name: Name of the entry, for error messages.
+            fname: .HDF5 file name, for error messages.
+
+        Returns:
+            NDArray: Matrix of the features, with one column per feature channel.
+        """
+        for idx, feat, transform in self._transforms:
+            with warnings.catch_warnings(record=True) as w:
+                feature_values[idx] = transform(feature_values[idx])
+                if len(w) > 0:
+                    msg = (
+                        f"Invalid value occurs in {entry_name}, file {fname}, when applying {transform} for feature {feat}.\n\t"
+                        f"Please change the transformation function for {feat}."
+                    )
+                    raise ValueError(msg)
+
+        matrix = np.hstack([vals.reshape(-1, 1) if vals.ndim == 1 else vals for vals in feature_values])
+        if self.standardize:
+            shapes = tuple(vals.shape[1:] for vals in feature_values)
+            if shapes not in self._scaling_vectors:
+                self._scaling_vectors[shapes] = self._get_scaling_vectors(shapes)
+            mean, dev = self._scaling_vectors[shapes]
+            matrix = (matrix - mean) / dev
+        return matrix
+
+    def _get_scaling_vectors(self, shapes: tuple[tuple[int, ...], ...]) -> tuple[NDArray, NDArray]:
+        means = []
+        devs = []
+        for shape, scaling in zip(shapes, self._scaling, strict=True):
+            n_channels = shape[0] if len(shape) > 0 else 1
+            if scaling is None:
+                means.append(np.zeros(n_channels))
+                devs.append(np.ones(n_channels))
+            elif len(shape) == 0:
+                means.append([scaling[0]])
+                devs.append([scaling[1]])
+            else:
+                means.append(scaling[2])
+                devs.append(scaling[3])
+        return np.concatenate(means), np.concatenate(devs)
+
+
 class GraphDataset(DeeprankDataset):
     """Class to load the .HDF5 files data into graphs.
 
@@ -771,6 +1212,8 @@ class GraphDataset(DeeprankDataset):
         use_tqdm: Show progress bar. Defaults to True.
         root: Root directory where the dataset should be saved. Defaults to "./".
         check_integrity: Whether to check the integrity of the hdf5 files. Defaults to True.
+        cpu_count: The number of processes used to compute the means and standard deviations of the features for standardization,
+            each reading one .HDF5 file at a time. Defaults to 1, which computes them in the main process.
     """
 
     def __init__(  # noqa: C901
@@ -790,6 +1233,7 @@ class GraphDataset(DeeprankDataset):
         use_tqdm: bool = True,
         root: str = "./",
         check_integrity: bool = True,
+        cpu_count: int = 1,
     ):
         super().__init__(
             hdf5_path,
@@ -861,13 +1305,14 @@ class GraphDataset(DeeprankDataset):
 
         if standardize and (train_source is None):
             if self.means or self.devs is None:
-                if self.df is None:
-                    self.hdf5_to_pandas()
-                self._compute_mean_std()
+                self._compute_mean_std(cpu_count)
         elif standardize and (train_source is not None):
             self.means = self.train_means
             self.devs = self.train_devs
 
+        self._node_features_plan = _FeatureTransformPlan(self.node_features, self.features_transform, self.means, self.devs)
+        self._edge_features_plan = _FeatureTransformPlan(self.edge_features, self.features_transform, self.means, self.devs)
+
     def get(self, idx: int) -> Data:
         """Gets one graph item from its unique index.
 
@@ -878,8 +1323,32 @@ class GraphDataset(DeeprankDataset):
             :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, edge_index, edge_attr, pos, entry_names.
         """
         fname, mol = self.index_entries[idx]
+        if self._item_cache is not None:
+            return self._item_cache.get((fname, mol), self.load_one_graph)
         return self.load_one_graph(fname, mol)
 
+    def get_graph_sizes(self) -> tuple[NDArray, NDArray]:
+        """Gets the number of nodes and edges of each graph, without loading the graphs.
+
+        The sizes are read from the index of the .HDF5 files if it is up to date (see :func:`deeprank2.utils.datasetindex.build_index`),
+        or else from the shapes of the datasets in the files.
+
+        Returns:
+            tuple[NDArray, NDArray]: Number of nodes and number of edges of each item, in the order of the items. Edges are counted
+                in both directions, as in the `edge_index` of the items.
+        """
+        positions_per_file = {}
+        for position, (fname, entry_name) in enumerate(self.index_entries):
+            positions_per_file.setdefault(fname, ([], []))
+            positions_per_file[fname][0].append(position)
+            positions_per_file[fname][1].append(entry_name)
+
+        node_counts = np.zeros(len(self.index_entries), dtype=np.int64)
+        edge_counts = np.zeros(len(self.index_entries), dtype=np.int64)
+        for fname, (positions, entry_names) in positions_per_file.items():
+            node_counts[positions], edge_counts[positions] = read_graph_sizes(fname, entry_names)
+        return node_counts, 2 * edge_counts
+
     def load_one_graph(self, fname: str, entry_name: str) -> Data:  # noqa: PLR0915, C901
         """Loads one graph.
 
@@ -890,51 +1359,13 @@ class GraphDataset(DeeprankDataset):
         Returns:
             :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, edge_index, edge_attr, pos, entry_names.
         """
-        with h5py.File(fname, "r") as f5:
+        with _hdf5_files.open(fname) as f5:
             grp = f5[entry_name]
 
             # node features
             if len(self.node_features) > 0:
-                node_data = ()
-                for feat in self.node_features:
-                    # resetting transformation and standardization for each feature
-                    transform = None
-                    standard = None
-
-                    if feat[0] != "_":  # ignore metafeatures
-                        vals = grp[f"{Nfeat.NODE}/{feat}"][()]
-                        # get feat transformation and standardization
-                        if self.features_transform is not None:
-                            transform = self.features_transform.get("all", {}).get("transform")
-                            standard = self.features_transform.get("all", {}).get("standardize")
-                            # if no transformation is set for all features, check if one is set for the current feature
-                            if (transform is None) and (feat in self.features_transform):
-                                transform = self.features_transform.get(feat, {}).get("transform")
-                            # if no standardization is set for all features, check if one is set for the current feature
-                            if (standard is None) and (feat in self.features_transform):
-                                standard = self.features_transform.get(feat, {}).get("standardize")
-
-                        # apply transformation
-                        if transform:
-                            with warnings.catch_warnings(record=True) as w:
-                                vals = transform(vals)
-                                if len(w) > 0:
-                                    msg = (
-                                        f"Invalid value occurs in {entry_name}, file {fname},when applying {transform} for feature {feat}.\n\t"
-                                        f"Please change the transformation function for {feat}."
-                                    )
-                                    raise ValueError(msg)
-
-                        if vals.ndim == 1:  # features with only one channel
-                            vals = vals.reshape(-1, 1)
-                            if standard:
-                                vals = (vals - self.means[feat]) / self.devs[feat]
-                        elif standard:
-                            reshaped_mean = [mean_value for mean_key, mean_value in self.means.items() if feat in mean_key]
-                            reshaped_dev = [dev_value for dev_key, dev_value in self.devs.items() if feat in dev_key]
-                            vals = (vals - reshaped_mean) / reshaped_dev
-                        node_data += (vals,)
-                x = torch.tensor(np.hstack(node_data), dtype=torch.float)
+                node_data = read_features(grp[Nfeat.NODE], self._node_features_plan.features)
+                x = torch.tensor(self._node_features_plan.apply(node_data, entry_name, fname), dtype=torch.float)
             else:
                 x = None
                 _log.warning("No node features set.")
@@ -952,46 +1383,8 @@ class GraphDataset(DeeprankDataset):
             # edge feature
             # we have to have all the edges i.e : (i,j) and (j,i)
             if len(self.edge_features) > 0:
-                edge_data = ()
-                for feat in self.edge_features:
-                    # resetting transformation and standardization for each feature
-                    transform = None
-                    standard = None
-
-                    if feat[0] != "_":  # ignore metafeatures
-                        vals = grp[f"{Efeat.EDGE}/{feat}"][()]
-                        # get feat transformation and standardization
-                        if self.features_transform is not None:
-                            transform = self.features_transform.get("all", {}).get("transform")
-                            standard = self.features_transform.get("all", {}).get("standardize")
-                            # if no transformation is set for all features, check if one is set for the current feature
-                            if (transform is None) and (feat in self.features_transform):
-                                transform = self.features_transform.get(feat, {}).get("transform")
-                            # if no standardization is set for all features, check if one is set for the current feature
-                            if (standard is None) and (feat in self.features_transform):
-                                standard = self.features_transform.get(feat, {}).get("standardize")
-
-                        # apply transformation
-                        if transform:
-                            with warnings.catch_warnings(record=True) as w:
-                                vals = transform(vals)
-                                if len(w) > 0:
-                                    msg = (
-                                        f"Invalid value occurs in {entry_name}, file {fname}, when applying {transform} for feature {feat}.\n\t"
-                                        f"Please change the transformation function for {feat}."
-                                    )
-                                    raise ValueError(msg)
-
-                        if vals.ndim == 1:
-                            vals = vals.reshape(-1, 1)
-                            if standard:
-                                vals = (vals - self.means[feat]) / self.devs[feat]
-                        elif standard:
-                            reshaped_mean = [mean_value for mean_key, mean_value in self.means.items() if feat in mean_key]
-                            reshaped_dev = [dev_value for dev_key, dev_value in self.devs.items() if feat in dev_key]
-                            vals = (vals - reshaped_mean) / reshaped_dev
-                        edge_data += (vals,)
-                edge_data = np.hstack(edge_data)
+                edge_data = read_features(grp[Efeat.EDGE], self._edge_features_plan.features)
+                edge_data = self._edge_features_plan.apply(edge_data, entry_name, fname)
                 edge_data = np.vstack((edge_data, edge_data))
                 edge_attr = torch.tensor(edge_data, dtype=torch.float).contiguous()
             else:
@@ -1057,11 +1450,11 @@ class GraphDataset(DeeprankDataset):
         mol_key = next(iter(f.keys()))
 
         # read available node features
-        self.available_node_features = list(f[f"{mol_key}/{Nfeat.NODE}/"].keys())
+        self.available_node_features = get_feature_names(f[f"{mol_key}/{Nfeat.NODE}/"])
         self.available_node_features = [key for key in self.available_node_features if key[0] != "_"]  # ignore metafeatures
 
         # read available edge features
-        self.available_edge_features = list(f[f"{mol_key}/{Efeat.EDGE}/"].keys())
+        self.available_edge_features = get_feature_names(f[f"{mol_key}/{Efeat.EDGE}/"])
         self.available_edge_features = [key for key in self.available_edge_features if key[0] != "_"]  # ignore metafeatures
 
         f.close()
@@ -1122,6 +1515,238 @@ class GraphDataset(DeeprankDataset):
             raise ValueError(msg)
 
 
+# files of the packed graph format, see `pack_graph_dataset`
+PACKED_METADATA_FILE = "metadata.pkl"
+PACKED_ENTRY_NAMES_FILE = "entry_names.npy"
+# arrays with one row per node, per edge or per depth_1 cluster, stored as flat binary files, with the offsets of each entry
+_PACKED_ARRAYS = {
+    "x": ("node", np.float32),
+    "pos": ("node", np.float32),
+    "cluster0": ("node", np.int64),
+    "edge_index": ("edge", np.int64),
+    "edge_attr": ("edge", np.float32),
+    "cluster1": ("cluster1", np.int64),
+}
+
+
+def pack_graph_dataset(dataset: GraphDataset, packed_path: str) -> str:
+    """Converts a :class:`GraphDataset` to the packed format, which is loaded by :class:`PackedGraphDataset`.
+
+    The packed format stores the prepared graphs (i.e. after transformation and standardization of the features) of all
+    entries in a directory. The node features, positions, edge indices and edge features of all entries are each concatenated
+    into one flat binary file, and the offsets of every entry in these files are stored as .npy files, like in the CSR format.
+    The files can be memory-mapped, such that loading a graph only takes slicing, and DataLoader workers share the same pages.
+
+    The graphs are written in one pass, without holding the dataset in memory.
+
+    Args:
+        dataset: The dataset to convert. Its entries, features, transformations and target are packed as they are set.
+        packed_path: Directory to write the packed dataset to. It is created if it does not exist.
+
+    Returns:
+        str: The path to the packed dataset.
+    """
+    os.makedirs(packed_path, exist_ok=True)
+    offsets = {row_type: [0] for row_type in ("node", "edge", "cluster1")}
+    shapes = {}
+    targets_values = []
+    entry_names = []
+    has_clusters = None
+    with contextlib.ExitStack() as stack:
+        files = {name: stack.enter_context(open(os.path.join(packed_path, f"{name}.bin"), "wb")) for name in _PACKED_ARRAYS}
+        iterator = tqdm(range(len(dataset)), desc="   packing graphs", file=sys.stdout) if dataset.use_tqdm else range(len(dataset))
+        for idx in iterator:
+            data = dataset.get(idx)
+            entry_names.append(data.entry_names)
+            targets_values.append(np.nan if data.y is None else data.y.item())
+
+            num_nodes = data.pos.shape[0]
+            num_edges = data.edge_index.shape[1]
+            # clusters that are None are not stored by Data
+            cluster0 = getattr(data, "cluster0", None)
+            cluster1 = getattr(data, "cluster1", None)
+            num_clusters1 = 0 if cluster1 is None else cluster1.shape[0]
+            arrays = {
+                "x": torch.empty((num_nodes, 0)) if data.x is None else data.x,
+                "pos": data.pos,
+                "cluster0": torch.empty(0, dtype=torch.long) if cluster0 is None else cluster0,
+                "edge_index": data.edge_index.T,
+                "edge_attr": data.edge_attr,
+                "cluster1": torch.empty(0, dtype=torch.long) if cluster1 is None else cluster1,
+            }
+            if has_clusters is None:
+                has_clusters = cluster0 is not None
+            elif has_clusters != (cluster0 is not None):
+                msg = f"Entry {data.entry_names} cannot be packed, because the clusters are set for some entries only."
+                raise ValueError(msg)
+            for name, tensor in arrays.items():
+                array = np.ascontiguousarray(tensor.numpy(), dtype=_PACKED_ARRAYS[name][1])
+                shapes.setdefault(name, array.shape[1:])
+                if array.shape[1:] != shapes[name]:
+                    msg = f"Entry {data.entry_names} cannot be packed, because its {name} has shape {array.shape}, unlike the previous entries."
+                    raise ValueError(msg)
+                files[name].write(array.tobytes())
+
+            offsets["node"].append(offsets["node"][-1] + num_nodes)
+            offsets["edge"].append(offsets["edge"][-1] + num_edges)
+            offsets["cluster1"].append(offsets["cluster1"][-1] + num_clusters1)
+
+    np.save(os.path.join(packed_path, PACKED_ENTRY_NAMES_FILE), np.array(entry_names, dtype=str))
+    for row_type, row_offsets in offsets.items():
+        np.save(os.path.join(packed_path, f"{row_type}_offsets.npy"), np.array(row_offsets, dtype=np.int64))
+    np.save(os.path.join(packed_path, "y.npy"), np.array(targets_values, dtype=np.float32))
+
+    metadata = {
+        "shapes": shapes,
+        "has_clusters": bool(has_clusters),
+        **{param: getattr(dataset, param) for param in PackedGraphDataset.dataset_params},
+    }
+    with open(os.path.join(packed_path, PACKED_METADATA_FILE), "wb") as f:
+        # dill, because the feature transformations can be lambda functions
+        dill.dump(metadata, f)
+    return packed_path
+
+
+class PackedGraphDataset(GraphDataset):
+    """Class to load graphs from the packed format written by :func:`pack_graph_dataset`.
+
+    It yields the same :class:`torch_geometric.data.data.Data` objects as the :class:`GraphDataset` that was packed, and it has the same
+    parameters (features, transformations, means and standard deviations, target, task, classes), such that it can be used in the same
+    way, e.g. as `train_source` or by :class:`deeprank2.trainer.Trainer`. Graphs are read from memory-mapped files, which each process
+    (e.g. each DataLoader worker) maps once, so the data is read from disk once and shared between the processes.
+
+    Args:
+        packed_path: Path to the packed dataset.
+        subset: List of keys from the packed dataset to be included. If None, all entries are included. Defaults to None.
+        train_source: Training dataset that this (validation or testing) dataset belongs to, used by :class:`deeprank2.trainer.Trainer`
+            to check that the datasets match. The transformations and standardization have already been applied when the dataset
+            was packed, so they are not inherited. Defaults to None.
+        use_tqdm: Show progress bar. Defaults to True.
+    """
+
+    # parameters of the packed GraphDataset, which are restored as attributes
+    dataset_params = (
+        "node_features",
+        "edge_features",
+        "features_transform",
+        "means",
+        "devs",
+        "clustering_method",
+        "target",
+        "target_transform",
+        "task",
+        "classes",
+        "classes_to_index",
+    )
+
+    def __init__(
+        self,
+        packed_path: str,
+        subset: list[str] | None = None,
+        train_source: PackedGraphDataset | GraphDataset | None = None,
+        use_tqdm: bool = True,
+    ):
+        Dataset.__init__(self, "./")
+        self.packed_path = packed_path
+        self.hdf5_paths = []
+        self.subset = subset
+        self.train_source = train_source
+        self.target_filter = None
+        self.use_tqdm = use_tqdm
+        self.inherited_params = None
+        self.df = None
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+        with open(os.path.join(packed_path, PACKED_METADATA_FILE), "rb") as f:
+            self._metadata = dill.load(f)  # noqa: S301
+        for param in self.dataset_params:
+            setattr(self, param, self._metadata[param])
+        self.train_means = self.means
+        self.train_devs = self.devs
+
+        entry_names = np.load(os.path.join(packed_path, PACKED_ENTRY_NAMES_FILE)).tolist()
+        self._entry_positions = {entry_name: position for position, entry_name in enumerate(entry_names)}
+        if subset is not None:
+            entry_names = [entry_name for entry_name in subset if entry_name in self._entry_positions]
+        self.index_entries = [(packed_path, entry_name) for entry_name in entry_names]
+
+        self._offsets = {row_type: np.load(os.path.join(packed_path, f"{row_type}_offsets.npy")) for row_type in ("node", "edge", "cluster1")}
+        self._y = np.load(os.path.join(packed_path, "y.npy"))
+        self._arrays = None
+        self._item_cache = None
+
+    def __getstate__(self) -> dict:
+        # the memory maps are opened again by every process that unpickles the dataset
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def _get_arrays(self) -> dict[str, np.memmap]:
+        if self._arrays is None:
+            self._arrays = {}
+            for name, (row_type, dtype) in _PACKED_ARRAYS.items():
+                if name.startswith("cluster") and not self._metadata["has_clusters"]:
+                    continue
+                shape = (int(self._offsets[row_type][-1]), *self._metadata["shapes"][name])
+                path = os.path.join(self.packed_path, f"{name}.bin")
+                # empty files cannot be memory-mapped
+                self._arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=shape) if shape[0] > 0 else np.empty(shape, dtype=dtype)
+        return self._arrays
+
+    def get_target_values(self) -> NDArray:
+        """Gets the value of the target of each item, without loading the items.
+
+        Returns:
+            NDArray: Value of the target of each item, in the order of the items, or NaN for items that lack the target.
+        """
+        positions = np.array([self._entry_positions[entry_name] for _, entry_name in self.index_entries], dtype=np.int64)
+        return self._y[positions].astype(np.float64)
+
+    def get_graph_sizes(self) -> tuple[NDArray, NDArray]:
+        """Gets the number of nodes and edges of each graph, without loading the graphs.
+
+        Returns:
+            tuple[NDArray, NDArray]: Number of nodes and number of edges of each item, in the order of the items. Edges are counted
+                in both directions, as in the `edge_index` of the items.
+        """
+        positions = np.array([self._entry_positions[entry_name] for _, entry_name in self.index_entries], dtype=np.int64)
+        return np.diff(self._offsets["node"])[positions], np.diff(self._offsets["edge"])[positions]
+
+    def load_one_graph(self, fname: str, entry_name: str) -> Data:  # noqa: ARG002
+        """Loads one graph.
+
+        Args:
+            fname: Path to the packed dataset, which is ignored.
+            entry_name: Name of the entry.
+
+        Returns:
+            :class:`torch_geometric.data.data.Data`: item with tensors x, y if present, edge_index, edge_attr, pos, entry_names.
+        """
+        arrays = self._get_arrays()
+        position = self._entry_positions[entry_name]
+        node_start, node_end = self._offsets["node"][position : position + 2]
+        edge_start, edge_end = self._offsets["edge"][position : position + 2]
+
+        x = torch.tensor(arrays["x"][node_start:node_end]) if len(self.node_features) > 0 else None
+        edge_index = torch.tensor(arrays["edge_index"][edge_start:edge_end].T).contiguous()
+        edge_attr = torch.tensor(arrays["edge_attr"][edge_start:edge_end]).contiguous()
+        y = None if np.isnan(self._y[position]) else torch.tensor([self._y[position]], dtype=torch.float).contiguous()
+        pos = torch.tensor(arrays["pos"][node_start:node_end]).contiguous()
+
+        data = Data(x=x, edge_index=edge_index, edge_attr=edge_attr, y=y, pos=pos)
+
+        data.cluster0 = None
+        data.cluster1 = None
+        if self._metadata["has_clusters"]:
+            cluster1_start, cluster1_end = self._offsets["cluster1"][position : position + 2]
+            data.cluster0 = torch.tensor(arrays["cluster0"][node_start:node_end])
+            data.cluster1 = torch.tensor(arrays["cluster1"][cluster1_start:cluster1_end])
+
+        data.entry_names = entry_name
+
+        return data
+
+
 def save_hdf5_keys(
     f_src_path: str,
     src_ids: list[str],
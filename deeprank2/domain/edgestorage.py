@@ -4,6 +4,7 @@ EDGE = "edge_features"
 ## metafeatures
 NAME = "_name"
 INDEX = "_index"
+FEATURE_MATRIX = "_feature_matrix"  # all edge features in one matrix, in the consolidated layout
 
 ## generic features
 DISTANCE = "distance"  # float; former FEATURENAME_EDGEDISTANCE
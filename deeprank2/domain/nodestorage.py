@@ -5,6 +5,7 @@ NODE = "node_features"
 NAME = "_name"
 CHAINID = "_chain_id"  # str; former FEATURENAME_CHAIN (was not assigned, but supposedly numeric, now a str)
 POSITION = "_position"  # list[3xfloat]; former FEATURENAME_POSITION
+FEATURE_MATRIX = "_feature_matrix"  # all node features in one matrix, in the consolidated layout
 
 ## atom core features
 ATOMTYPE = "atom_type"
@@ -3,61 +3,64 @@ import logging
 import numpy as np
 
 from deeprank2.domain import nodestorage as Nfeat
-from deeprank2.molstruct.atom import Atom
-from deeprank2.molstruct.residue import Residue, SingleResidueVariant
+from deeprank2.molstruct.residue import SingleResidueVariant
+from deeprank2.utils.featurecolumns import FeatureColumns, GraphArrays, add_feature_columns, select_values
 from deeprank2.utils.graph import Graph
 from deeprank2.utils.parsing import atomic_forcefield
 
 _log = logging.getLogger(__name__)
 
 
-def add_features(  # noqa:D103
+def get_feature_columns(  # noqa:D103
     pdb_path: str,  # noqa: ARG001
+    graph_arrays: GraphArrays,
+    single_amino_acid_variant: SingleResidueVariant | None = None,
+) -> FeatureColumns:
+    features = {}
+    if graph_arrays.node_type == "atom":
+        features[Nfeat.ATOMTYPE] = select_values([element.onehot for element in graph_arrays.elements], graph_arrays.atom_elements)
+        features[Nfeat.PDBOCCUPANCY] = graph_arrays.atom_occupancies
+        features[Nfeat.ATOMCHARGE] = atomic_forcefield.get_charges(graph_arrays.atoms)
+
+    # the properties of each amino acid are looked up once, rather than for every node
+    amino_acids = graph_arrays.amino_acids
+    node_amino_acids = graph_arrays.node_amino_acids
+    features[Nfeat.RESTYPE] = select_values([amino_acid.onehot for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.RESCHARGE] = select_values([amino_acid.charge for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.POLARITY] = select_values([amino_acid.polarity.onehot for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.RESSIZE] = select_values([amino_acid.size for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.RESMASS] = select_values([amino_acid.mass for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.RESPI] = select_values([amino_acid.pI for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.HBDONORS] = select_values([amino_acid.hydrogen_bond_donors for amino_acid in amino_acids], node_amino_acids)
+    features[Nfeat.HBACCEPTORS] = select_values([amino_acid.hydrogen_bond_acceptors for amino_acid in amino_acids], node_amino_acids)
+
+    if single_amino_acid_variant is not None:
+        wildtype = single_amino_acid_variant.wildtype_amino_acid
+        variant = single_amino_acid_variant.variant_amino_acid
+
+        # index 1 for the nodes of the variant residue, which get the differences between variant and wildtype, and 0 for all other nodes
+        is_variant = graph_arrays.get_residue_mask(single_amino_acid_variant.residue)[graph_arrays.node_residues].astype(np.int64)
+        features[Nfeat.VARIANTRES] = select_values(
+            [amino_acid.onehot for amino_acid in amino_acids] + [variant.onehot],
+            np.where(is_variant, len(amino_acids), node_amino_acids),
+        )
+        features[Nfeat.DIFFCHARGE] = select_values([0, variant.charge - wildtype.charge], is_variant)
+        features[Nfeat.DIFFPOLARITY] = select_values(
+            [np.zeros(wildtype.polarity.onehot.shape), variant.polarity.onehot - wildtype.polarity.onehot],
+            is_variant,
+        )
+        features[Nfeat.DIFFSIZE] = select_values([0, variant.size - wildtype.size], is_variant)
+        features[Nfeat.DIFFMASS] = select_values([0, variant.mass - wildtype.mass], is_variant)
+        features[Nfeat.DIFFPI] = select_values([0, variant.pI - wildtype.pI], is_variant)
+        features[Nfeat.DIFFHBDONORS] = select_values([0, variant.hydrogen_bond_donors - wildtype.hydrogen_bond_donors], is_variant)
+        features[Nfeat.DIFFHBACCEPTORS] = select_values([0, variant.hydrogen_bond_acceptors - wildtype.hydrogen_bond_acceptors], is_variant)
+
+    return FeatureColumns(node_features=features)
+
+
+def add_features(  # noqa:D103
+    pdb_path: str,
     graph: Graph,
     single_amino_acid_variant: SingleResidueVariant | None = None,
 ) -> None:
-    for node in graph.nodes:
-        if isinstance(node.id, Residue):
-            residue = node.id
-        elif isinstance(node.id, Atom):
-            atom = node.id
-            residue = atom.residue
-
-            node.features[Nfeat.ATOMTYPE] = atom.element.onehot
-            node.features[Nfeat.PDBOCCUPANCY] = atom.occupancy
-            node.features[Nfeat.ATOMCHARGE] = atomic_forcefield.get_charge(atom)
-        else:
-            msg = f"Unexpected node type: {type(node.id)}"
-            raise TypeError(msg)
-
-        node.features[Nfeat.RESTYPE] = residue.amino_acid.onehot
-        node.features[Nfeat.RESCHARGE] = residue.amino_acid.charge
-        node.features[Nfeat.POLARITY] = residue.amino_acid.polarity.onehot
-        node.features[Nfeat.RESSIZE] = residue.amino_acid.size
-        node.features[Nfeat.RESMASS] = residue.amino_acid.mass
-        node.features[Nfeat.RESPI] = residue.amino_acid.pI
-        node.features[Nfeat.HBDONORS] = residue.amino_acid.hydrogen_bond_donors
-        node.features[Nfeat.HBACCEPTORS] = residue.amino_acid.hydrogen_bond_acceptors
-
-        if single_amino_acid_variant is not None:
-            wildtype = single_amino_acid_variant.wildtype_amino_acid
-            variant = single_amino_acid_variant.variant_amino_acid
-
-            if residue == single_amino_acid_variant.residue:
-                node.features[Nfeat.VARIANTRES] = variant.onehot
-                node.features[Nfeat.DIFFCHARGE] = variant.charge - wildtype.charge
-                node.features[Nfeat.DIFFPOLARITY] = variant.polarity.onehot - wildtype.polarity.onehot
-                node.features[Nfeat.DIFFSIZE] = variant.size - wildtype.size
-                node.features[Nfeat.DIFFMASS] = variant.mass - wildtype.mass
-                node.features[Nfeat.DIFFPI] = variant.pI - wildtype.pI
-                node.features[Nfeat.DIFFHBDONORS] = variant.hydrogen_bond_donors - wildtype.hydrogen_bond_donors
-                node.features[Nfeat.DIFFHBACCEPTORS] = variant.hydrogen_bond_acceptors - wildtype.hydrogen_bond_acceptors
-            else:
-                node.features[Nfeat.VARIANTRES] = residue.amino_acid.onehot
-                node.features[Nfeat.DIFFCHARGE] = 0
-                node.features[Nfeat.DIFFPOLARITY] = np.zeros(residue.amino_acid.polarity.onehot.shape)
-                node.features[Nfeat.DIFFSIZE] = 0
-                node.features[Nfeat.DIFFMASS] = 0
-                node.features[Nfeat.DIFFPI] = 0
-                node.features[Nfeat.DIFFHBDONORS] = 0
-                node.features[Nfeat.DIFFHBACCEPTORS] = 0
+    add_feature_columns(graph, get_feature_columns(pdb_path, GraphArrays.from_graph(graph), single_amino_acid_variant))
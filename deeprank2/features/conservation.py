@@ -2,41 +2,45 @@ import numpy as np
 
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.domain.aminoacidlist import amino_acids
-from deeprank2.molstruct.atom import Atom
-from deeprank2.molstruct.residue import Residue, SingleResidueVariant
+from deeprank2.molstruct.residue import SingleResidueVariant
+from deeprank2.utils.featurecolumns import FeatureColumns, GraphArrays, add_feature_columns, select_values
 from deeprank2.utils.graph import Graph
 
 
-def add_features(  # noqa:D103
+def get_feature_columns(  # noqa:D103
     pdb_path: str,  # noqa: ARG001
-    graph: Graph,
+    graph_arrays: GraphArrays,
     single_amino_acid_variant: SingleResidueVariant | None = None,
-) -> None:
+) -> FeatureColumns:
     profile_amino_acid_order = sorted(amino_acids, key=lambda aa: aa.three_letter_code)
 
-    for node in graph.nodes:
-        if isinstance(node.id, Residue):
-            residue = node.id
-        elif isinstance(node.id, Atom):
-            atom = node.id
-            residue = atom.residue
-        else:
-            msg = f"Unexpected node type: {type(node.id)}"
-            raise TypeError(msg)
-
-        pssm_row = residue.get_pssm()
-        profile = np.array([pssm_row.get_conservation(amino_acid) for amino_acid in profile_amino_acid_order])
-        node.features[Nfeat.PSSM] = profile
-        node.features[Nfeat.INFOCONTENT] = pssm_row.information_content
-
-        if single_amino_acid_variant is not None:
-            if residue == single_amino_acid_variant.residue:
-                # only the variant residue can have a variant and wildtype amino acid
-                conservation_wildtype = pssm_row.get_conservation(single_amino_acid_variant.wildtype_amino_acid)
-                conservation_variant = pssm_row.get_conservation(single_amino_acid_variant.variant_amino_acid)
-                node.features[Nfeat.CONSERVATION] = conservation_wildtype
-                node.features[Nfeat.DIFFCONSERVATION] = conservation_variant - conservation_wildtype
-            else:
-                # all nodes must have the same features, so set them to zero here
-                node.features[Nfeat.CONSERVATION] = 0.0
-                node.features[Nfeat.DIFFCONSERVATION] = 0.0
+    # the pssm of each residue is read once, also when the residue has several atom nodes
+    pssm_rows = [residue.get_pssm() for residue in graph_arrays.residues]
+    profiles = [np.array([pssm_row.get_conservation(amino_acid) for amino_acid in profile_amino_acid_order]) for pssm_row in pssm_rows]
+    features = {
+        Nfeat.PSSM: select_values(profiles, graph_arrays.node_residues),
+        Nfeat.INFOCONTENT: select_values([pssm_row.information_content for pssm_row in pssm_rows], graph_arrays.node_residues),
+    }
+
+    if single_amino_acid_variant is not None:
+        # only the variant residue can have a variant and wildtype amino acid, all others are set to zero
+        is_variant = graph_arrays.get_residue_mask(single_amino_acid_variant.residue)
+        conservation = [0.0] * len(pssm_rows)
+        diff_conservation = [0.0] * len(pssm_rows)
+        for residue_index in np.flatnonzero(is_variant).tolist():
+            conservation_wildtype = pssm_rows[residue_index].get_conservation(single_amino_acid_variant.wildtype_amino_acid)
+            conservation_variant = pssm_rows[residue_index].get_conservation(single_amino_acid_variant.variant_amino_acid)
+            conservation[residue_index] = conservation_wildtype
+            diff_conservation[residue_index] = conservation_variant - conservation_wildtype
+        features[Nfeat.CONSERVATION] = select_values(conservation, graph_arrays.node_residues)
+        features[Nfeat.DIFFCONSERVATION] = select_values(diff_conservation, graph_arrays.node_residues)
+
+    return FeatureColumns(node_features=features)
+
+
+def add_features(  # noqa:D103
+    pdb_path: str,
+    graph: Graph,
+    single_amino_acid_variant: SingleResidueVariant | None = None,
+) -> None:
+    add_feature_columns(graph, get_feature_columns(pdb_path, GraphArrays.from_graph(graph), single_amino_acid_variant))
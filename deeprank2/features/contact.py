@@ -3,13 +3,13 @@ import warnings
 
 import numpy as np
 from numpy.typing import NDArray
-from scipy.spatial import distance_matrix
+from scipy.spatial import minkowski_distance
 
 from deeprank2.domain import edgestorage as Efeat
 from deeprank2.molstruct.atom import Atom
 from deeprank2.molstruct.pair import AtomicContact, ResidueContact
 from deeprank2.molstruct.residue import SingleResidueVariant
-from deeprank2.utils.graph import Graph
+from deeprank2.utils.graph import Edge, Graph
 from deeprank2.utils.parsing import atomic_forcefield
 
 _log = logging.getLogger(__name__)
@@ -24,46 +24,55 @@ COULOMB_CONSTANT = 332.0636
 
 def _get_nonbonded_energy(
     atoms: list[Atom],
+    atom_pairs: NDArray[np.int64],
     distances: NDArray[np.float64],
 ) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
-    """Calculates all pairwise electrostatic (Coulomb) and Van der Waals (Lennard Jones) potential energies between all atoms in the structure.
+    """Calculates the electrostatic (Coulomb) and Van der Waals (Lennard Jones) potential energies between pairs of atoms.
+
+    Only the requested pairs are calculated, rather than all pairwise combinations of `atoms`.
 
     Warning: there's no distance cutoff here. The radius of influence is assumed to infinite.
     However, the potential tends to 0 at large distance.
 
     Args:
-        atoms: list of all atoms in the structure
-        distances: matrix of pairwise distances between all atoms in the structure
-            in the format that is the output of scipy.spatial's distance_matrix (i.e. a diagonally symmetric matrix)
+        atoms: list of all atoms that occur in `atom_pairs`
+        atom_pairs: (M, 2) array of indices in `atoms` of the atom pairs to calculate the energies for
+        distances: (M,) array of distances between the atoms of each pair in `atom_pairs`
 
     Returns:
-        Tuple [NDArray[np.float64], NDArray[np.float64]]: matrices in same format as `distances` containing
-            all pairwise electrostatic potential energies and all pairwise Van der Waals potential energies
+        Tuple [NDArray[np.float64], NDArray[np.float64]]: arrays in same format as `distances` containing
+            the electrostatic potential energies and the Van der Waals potential energies of each pair
     """
+    index1 = atom_pairs[:, 0]
+    index2 = atom_pairs[:, 1]
+
     # ELECTROSTATIC POTENTIAL
-    charges = [atomic_forcefield.get_charge(atom) for atom in atoms]
-    E_elec = np.expand_dims(charges, axis=1) * np.expand_dims(charges, axis=0) * COULOMB_CONSTANT / (EPSILON0 * distances)
+    charges = atomic_forcefield.get_charges(atoms)
+    E_elec = charges[index1] * charges[index2] * COULOMB_CONSTANT / (EPSILON0 * distances)
 
     # VAN DER WAALS POTENTIAL
+    vdw_parameters = atomic_forcefield.get_vanderwaals_parameter_arrays(atoms)
+
     # calculate main vdw energies
-    sigmas = [atomic_forcefield.get_vanderwaals_parameters(atom).sigma_main for atom in atoms]
-    epsilons = [atomic_forcefield.get_vanderwaals_parameters(atom).epsilon_main for atom in atoms]
-    mean_sigmas = 0.5 * np.add.outer(sigmas, sigmas)
-    geomean_eps = np.sqrt(np.multiply.outer(epsilons, epsilons))  # sqrt(eps1*eps2)
+    sigmas = vdw_parameters.sigma_main
+    epsilons = vdw_parameters.epsilon_main
+    mean_sigmas = 0.5 * (sigmas[index1] + sigmas[index2])
+    geomean_eps = np.sqrt(epsilons[index1] * epsilons[index2])  # sqrt(eps1*eps2)
     E_vdw = 4.0 * geomean_eps * ((mean_sigmas / distances) ** 12 - (mean_sigmas / distances) ** 6)
 
     # calculate vdw energies for 1-4 pairs
-    sigmas = [atomic_forcefield.get_vanderwaals_parameters(atom).sigma_14 for atom in atoms]
-    epsilons = [atomic_forcefield.get_vanderwaals_parameters(atom).epsilon_14 for atom in atoms]
-    mean_sigmas = 0.5 * np.add.outer(sigmas, sigmas)
-    geomean_eps = np.sqrt(np.multiply.outer(epsilons, epsilons))  # sqrt(eps1*eps2)
+    sigmas = vdw_parameters.sigma_14
+    epsilons = vdw_parameters.epsilon_14
+    mean_sigmas = 0.5 * (sigmas[index1] + sigmas[index2])
+    geomean_eps = np.sqrt(epsilons[index1] * epsilons[index2])  # sqrt(eps1*eps2)
     E_vdw_14pairs = 4.0 * geomean_eps * ((mean_sigmas / distances) ** 12 - (mean_sigmas / distances) ** 6)
 
     # Fix energies for close contacts on same chain
-    chains = [atom.residue.chain.id for atom in atoms]
-    chain_matrix = [[chain_1 == chain_2 for chain_2 in chains] for chain_1 in chains]
-    pair_14 = np.logical_and(distances < cutoff_14, chain_matrix)
-    pair_13 = np.logical_and(distances < cutoff_13, chain_matrix)
+    chain_ids = {}
+    chains = np.array([chain_ids.setdefault(atom.residue.chain.id, len(chain_ids)) for atom in atoms])
+    same_chain = chains[index1] == chains[index2]
+    pair_14 = np.logical_and(distances < cutoff_14, same_chain)
+    pair_13 = np.logical_and(distances < cutoff_13, same_chain)
 
     E_vdw[pair_14] = E_vdw_14pairs[pair_14]
     E_vdw[pair_13] = 0
@@ -72,64 +81,86 @@ def _get_nonbonded_energy(
     return E_elec, E_vdw
 
 
+def _get_atom_pairs(edges: list[Edge]) -> tuple[list[Atom], NDArray[np.int64], NDArray[np.int64]]:
+    """Lists the atom pairs for which energies are needed, grouped per edge.
+
+    For atomic contacts, each edge holds a single atom pair.
+    For residue contacts, each edge holds all combinations of an atom from the first residue with an atom from the second residue.
+
+    Args:
+        edges: list of edges, all of which must hold the same type of contact.
+
+    Returns:
+        tuple[list[Atom], NDArray[np.int64], NDArray[np.int64]]:
+            the atoms involved in any edge,
+            a (M, 2) array of indices in these atoms for all pairs,
+            and the index of the first pair of each edge (pairs of the same edge are consecutive).
+    """
+    if isinstance(edges[0].id, AtomicContact):
+        atom_indices = {}
+        atom_pairs = np.array(
+            [[atom_indices.setdefault(atom, len(atom_indices)) for atom in (edge.id.atom1, edge.id.atom2)] for edge in edges],
+            dtype=np.int64,
+        )
+        return list(atom_indices), atom_pairs, np.arange(len(edges))
+
+    if isinstance(edges[0].id, ResidueContact):
+        atoms = []
+        residue_atom_indices = {}
+        pairs1 = []
+        pairs2 = []
+        for edge in edges:
+            for residue in (edge.id.residue1, edge.id.residue2):
+                if residue not in residue_atom_indices:
+                    residue_atom_indices[residue] = np.arange(len(atoms), len(atoms) + len(residue.atoms))
+                    atoms.extend(residue.atoms)
+            atom_indices1 = residue_atom_indices[edge.id.residue1]
+            atom_indices2 = residue_atom_indices[edge.id.residue2]
+            pairs1.append(np.repeat(atom_indices1, len(atom_indices2)))
+            pairs2.append(np.tile(atom_indices2, len(atom_indices1)))
+        edge_starts = np.cumsum([0] + [len(pairs) for pairs in pairs1[:-1]])
+        return atoms, np.stack((np.concatenate(pairs1), np.concatenate(pairs2)), axis=1), edge_starts
+
+    msg = f"Unexpected edge type: {type(edges[0].id)}"
+    raise TypeError(msg)
+
+
 def add_features(  # noqa:D103
     pdb_path: str,  # noqa: ARG001
     graph: Graph,
     single_amino_acid_variant: SingleResidueVariant | None = None,  # noqa: ARG001
 ) -> None:
-    # assign each atoms (from all edges) a unique index
-    all_atoms = set()
-    if isinstance(graph.edges[0].id, AtomicContact):
-        for edge in graph.edges:
-            contact = edge.id
-            all_atoms.add(contact.atom1)
-            all_atoms.add(contact.atom2)
-    elif isinstance(graph.edges[0].id, ResidueContact):
-        for edge in graph.edges:
-            contact = edge.id
-            for atom in contact.residue1.atoms + contact.residue2.atoms:
-                all_atoms.add(atom)
-    else:
-        msg = f"Unexpected edge type: {type(graph.edges[0].id)}"
-        raise TypeError(msg)
-
-    all_atoms = list(all_atoms)
-    atom_dict = {atom: i for i, atom in enumerate(all_atoms)}
-
-    # make pairwise calculations between all atoms in the set
+    edges = graph.edges
+    atoms, atom_pairs, edge_starts = _get_atom_pairs(edges)
+
+    # make pairwise calculations only for the atom pairs that belong to an edge
     with warnings.catch_warnings(record=RuntimeWarning):
         warnings.simplefilter("ignore")
-        positions = [atom.position for atom in all_atoms]
-        interatomic_distances = distance_matrix(positions, positions)
+        positions = np.array([atom.position for atom in atoms])
+        interatomic_distances = minkowski_distance(positions[atom_pairs[:, 0]], positions[atom_pairs[:, 1]], p=2)
         (
             interatomic_electrostatic_energy,
             interatomic_vanderwaals_energy,
-        ) = _get_nonbonded_energy(all_atoms, interatomic_distances)
+        ) = _get_nonbonded_energy(atoms, atom_pairs, interatomic_distances)
+
+    # aggregate the atom pairs per edge (for atomic contacts, each edge has exactly one pair)
+    edge_distances = np.minimum.reduceat(interatomic_distances, edge_starts)
+    edge_electrostatic_energy = np.add.reduceat(interatomic_electrostatic_energy, edge_starts)
+    edge_vanderwaals_energy = np.add.reduceat(interatomic_vanderwaals_energy, edge_starts)
 
     # assign features
-    for edge in graph.edges:
+    for edge_index, edge in enumerate(edges):
         contact = edge.id
 
         if isinstance(contact, AtomicContact):
-            ## find the indices
-            atom1_index = atom_dict[contact.atom1]
-            atom2_index = atom_dict[contact.atom2]
-            ## set features
             edge.features[Efeat.SAMERES] = float(contact.atom1.residue == contact.atom2.residue)
             edge.features[Efeat.SAMECHAIN] = float(contact.atom1.residue.chain == contact.atom1.residue.chain)
-            edge.features[Efeat.DISTANCE] = interatomic_distances[atom1_index, atom2_index]
-            edge.features[Efeat.ELEC] = interatomic_electrostatic_energy[atom1_index, atom2_index]
-            edge.features[Efeat.VDW] = interatomic_vanderwaals_energy[atom1_index, atom2_index]
-
         elif isinstance(contact, ResidueContact):
-            ## find the indices
-            atom1_indices = [atom_dict[atom] for atom in contact.residue1.atoms]
-            atom2_indices = [atom_dict[atom] for atom in contact.residue2.atoms]
-            ## set features
             edge.features[Efeat.SAMECHAIN] = float(contact.residue1.chain == contact.residue2.chain)
-            edge.features[Efeat.DISTANCE] = np.min([[interatomic_distances[a1, a2] for a1 in atom1_indices] for a2 in atom2_indices])
-            edge.features[Efeat.ELEC] = np.sum([[interatomic_electrostatic_energy[a1, a2] for a1 in atom1_indices] for a2 in atom2_indices])
-            edge.features[Efeat.VDW] = np.sum([[interatomic_vanderwaals_energy[a1, a2] for a1 in atom1_indices] for a2 in atom2_indices])
+
+        edge.features[Efeat.DISTANCE] = edge_distances[edge_index]
+        edge.features[Efeat.ELEC] = edge_electrostatic_energy[edge_index]
+        edge.features[Efeat.VDW] = edge_vanderwaals_energy[edge_index]
 
         # Calculate irrespective of node type
         edge.features[Efeat.COVALENT] = float(edge.features[Efeat.DISTANCE] < covalent_cutoff and edge.features[Efeat.SAMECHAIN])
@@ -7,12 +7,15 @@ from typing import NoReturn
 import numpy as np
 from Bio.PDB.Atom import PDBConstructionWarning
 from Bio.PDB.HSExposure import HSExposureCA
+from Bio.PDB.Model import Model
 from Bio.PDB.PDBParser import PDBParser
 from Bio.PDB.ResidueDepth import get_surface, residue_depth
+from numpy.typing import NDArray
 
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.molstruct.atom import Atom
 from deeprank2.molstruct.residue import Residue, SingleResidueVariant
+from deeprank2.utils.cache import disk_cache, file_lru_cache
 from deeprank2.utils.graph import Graph
 
 _log = logging.getLogger(__name__)
@@ -34,30 +37,49 @@ def space_if_none(value: str) -> str:  # noqa:D103
     return value
 
 
-def add_features(  # noqa:D103
-    pdb_path: str,
-    graph: Graph,
-    single_amino_acid_variant: SingleResidueVariant | None = None,  # noqa: ARG001
-) -> None:
-    signal.signal(signal.SIGINT, handle_sigint)
-    signal.signal(signal.SIGALRM, handle_timeout)
-
+@file_lru_cache
+def _get_bio_model(pdb_path: str) -> Model:
     with warnings.catch_warnings(record=PDBConstructionWarning):
         parser = PDBParser()
         structure = parser.get_structure("_tmp", pdb_path)
-    bio_model = structure[0]
+    return structure[0]
+
 
+@file_lru_cache
+@disk_cache("msms")
+def _get_surface(pdb_path: str) -> NDArray[np.float64]:
+    """Calculate the molecular surface of a pdb file, using biopython and MSMS."""
     try:
         signal.alarm(20)
-        surface = get_surface(bio_model)
+        surface = get_surface(_get_bio_model(pdb_path))
         signal.alarm(0)
     except TimeoutError as e:
         msg = "Bio.PDB.ResidueDepth.get_surface timed out."
         raise TimeoutError(msg) from e
+    return surface
+
+
+@file_lru_cache
+@disk_cache("hse_ca")
+def _get_hse(pdb_path: str) -> dict[tuple, tuple[int, int, float]]:
+    """Calculate the half sphere exposure of the residues in a pdb file, using biopython."""
+    return dict(HSExposureCA(_get_bio_model(pdb_path)).property_dict)
+
+
+def add_features(  # noqa:D103
+    pdb_path: str,
+    graph: Graph,
+    single_amino_acid_variant: SingleResidueVariant | None = None,  # noqa: ARG001
+) -> None:
+    signal.signal(signal.SIGINT, handle_sigint)
+    signal.signal(signal.SIGALRM, handle_timeout)
+
+    bio_model = _get_bio_model(pdb_path)
+    surface = _get_surface(pdb_path)
+    hse = _get_hse(pdb_path)
 
     # These can only be calculated per residue, not per atom.
     # So for atomic graphs, every atom gets its residue's value.
-    hse = HSExposureCA(bio_model)
     for node in graph.nodes:
         if isinstance(node.id, Residue):
             residue = node.id
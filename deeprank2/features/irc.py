@@ -1,13 +1,14 @@
 import logging
 from itertools import combinations_with_replacement as combinations
 
+import numpy as np
 import pdb2sql
 
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.domain.aminoacidlist import amino_acids_by_code
 from deeprank2.molstruct.aminoacid import Polarity
-from deeprank2.molstruct.atom import Atom
-from deeprank2.molstruct.residue import Residue, SingleResidueVariant
+from deeprank2.molstruct.residue import SingleResidueVariant
+from deeprank2.utils.featurecolumns import FeatureColumns, GraphArrays, add_feature_columns, select_values
 from deeprank2.utils.graph import Graph
 
 _log = logging.getLogger(__name__)
@@ -101,45 +102,45 @@ def get_IRCs(pdb_path: str, chains: list[str], cutoff: float = 5.5) -> dict[str,
     return residue_contacts
 
 
-def add_features(  # noqa: C901, D103
+def get_feature_columns(  # noqa:D103
+    pdb_path: str,
+    graph_arrays: GraphArrays,
+    single_amino_acid_variant: SingleResidueVariant | None = None,
+) -> FeatureColumns:
+    if single_amino_acid_variant:  # VariantQueries do not use this feature
+        return FeatureColumns()
+
+    polarity_pairs = list(combinations(Polarity, 2))
+    polarity_pair_string = [f"irc_{x[0].name.lower()}_{x[1].name.lower()}" for x in polarity_pairs]
+
+    residue_contacts = get_IRCs(pdb_path, graph_arrays.get_all_chains())
+
+    # the counts of each residue, which remain 0 for residues without contact residues
+    residue_features = {IRC_type: [0] * len(graph_arrays.residues) for IRC_type in Nfeat.IRC_FEATURES}
+    has_contacts = np.zeros(len(graph_arrays.residues), dtype=bool)
+    for residue_index, residue in enumerate(graph_arrays.residues):
+        contact_id = residue.chain.id + residue.number_string  # reformat id to be in line with residue_contacts keys
+        if contact_id not in residue_contacts:
+            continue
+
+        residue_features[Nfeat.IRCTOTAL][residue_index] = residue_contacts[contact_id].densities["total"]
+        for i, pair in enumerate(polarity_pairs):
+            if residue_contacts[contact_id].polarity == pair[0]:
+                residue_features[polarity_pair_string[i]][residue_index] = residue_contacts[contact_id].densities[pair[1]]
+            elif residue_contacts[contact_id].polarity == pair[1]:
+                residue_features[polarity_pair_string[i]][residue_index] = residue_contacts[contact_id].densities[pair[0]]
+        has_contacts[residue_index] = True
+
+    total_contacts = int(has_contacts[graph_arrays.node_residues].sum())
+    if total_contacts < SAFE_MIN_CONTACTS:
+        _log.warning(f"Few ({total_contacts}) contacts detected for {pdb_path}.")
+
+    return FeatureColumns(node_features={IRC_type: select_values(values, graph_arrays.node_residues) for IRC_type, values in residue_features.items()})
+
+
+def add_features(  # noqa:D103
     pdb_path: str,
     graph: Graph,
     single_amino_acid_variant: SingleResidueVariant | None = None,
 ) -> None:
-    if not single_amino_acid_variant:  # VariantQueries do not use this feature
-        polarity_pairs = list(combinations(Polarity, 2))
-        polarity_pair_string = [f"irc_{x[0].name.lower()}_{x[1].name.lower()}" for x in polarity_pairs]
-
-        total_contacts = 0
-        residue_contacts = get_IRCs(pdb_path, graph.get_all_chains())
-
-        for node in graph.nodes:
-            if isinstance(node.id, Residue):
-                residue = node.id
-            elif isinstance(node.id, Atom):
-                atom = node.id
-                residue = atom.residue
-            else:
-                msg = f"Unexpected node type: {type(node.id)}"
-                raise TypeError(msg)
-
-            contact_id = residue.chain.id + residue.number_string  # reformat id to be in line with residue_contacts keys
-
-            # initialize all IRC features to 0
-            for IRC_type in Nfeat.IRC_FEATURES:
-                node.features[IRC_type] = 0
-
-            # load correct values to IRC features
-            try:
-                node.features[Nfeat.IRCTOTAL] = residue_contacts[contact_id].densities["total"]
-                for i, pair in enumerate(polarity_pairs):
-                    if residue_contacts[contact_id].polarity == pair[0]:
-                        node.features[polarity_pair_string[i]] = residue_contacts[contact_id].densities[pair[1]]
-                    elif residue_contacts[contact_id].polarity == pair[1]:
-                        node.features[polarity_pair_string[i]] = residue_contacts[contact_id].densities[pair[0]]
-                total_contacts += 1
-            except KeyError:  # node has no contact residues and all counts remain 0
-                pass
-
-        if total_contacts < SAFE_MIN_CONTACTS:
-            _log.warning(f"Few ({total_contacts}) contacts detected for {pdb_path}.")
+    add_feature_columns(graph, get_feature_columns(pdb_path, GraphArrays.from_graph(graph), single_amino_acid_variant))
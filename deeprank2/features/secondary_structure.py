@@ -7,8 +7,9 @@ from Bio.PDB.DSSP import DSSP
 from numpy.typing import NDArray
 
 from deeprank2.domain import nodestorage as Nfeat
-from deeprank2.molstruct.atom import Atom
-from deeprank2.molstruct.residue import Residue, SingleResidueVariant
+from deeprank2.molstruct.residue import SingleResidueVariant
+from deeprank2.utils.cache import disk_cache, file_lru_cache
+from deeprank2.utils.featurecolumns import FeatureColumns, GraphArrays, add_feature_columns, select_values
 from deeprank2.utils.graph import Graph
 
 
@@ -96,8 +97,15 @@ def _get_secstructure(pdb_path: str) -> dict:
     Returns:
         dict: A dictionary containing secondary structure information for each chain and residue.
     """
-    # Execute DSSP and read the output
+    # fix the pdb first, so that the cached DSSP output belongs to the fixed file
     _check_pdb(pdb_path)
+    return _run_dssp(pdb_path)
+
+
+@file_lru_cache
+@disk_cache("dssp")
+def _run_dssp(pdb_path: str) -> dict:
+    # Execute DSSP and read the output
     p = PDBParser(QUIET=True)
     model = p.get_structure(Path(pdb_path).stem, pdb_path)[0]
 
@@ -127,28 +135,28 @@ def _get_secstructure(pdb_path: str) -> dict:
     return sec_structure_dict
 
 
-def add_features(  # noqa:D103
+def get_feature_columns(  # noqa:D103
     pdb_path: str,
-    graph: Graph,
+    graph_arrays: GraphArrays,
     single_amino_acid_variant: SingleResidueVariant | None = None,  # noqa: ARG001
-) -> None:
+) -> FeatureColumns:
     sec_structure_features = _get_secstructure(pdb_path)
 
-    for node in graph.nodes:
-        if isinstance(node.id, Residue):
-            residue = node.id
-        elif isinstance(node.id, Atom):
-            atom = node.id
-            residue = atom.residue
-        else:
-            msg = f"Unexpected node type: {type(node.id)}"
-            raise TypeError(msg)
+    # the secondary structure of each residue is classified once, also when the residue has several atom nodes
+    residue_onehots = []
+    for chain_id, res_num in zip(graph_arrays.residue_chain_ids.tolist(), graph_arrays.residue_numbers.tolist(), strict=True):
+        sec_structure = _classify_secstructure(sec_structure_features[chain_id][res_num])
+        if sec_structure is None:
+            msg = f"Unknown secondary structure type ({sec_structure_features[chain_id][res_num]}) detected on chain {chain_id} residues {res_num}."
+            raise ValueError(msg)
+        residue_onehots.append(sec_structure.onehot)
 
-        chain_id = residue.chain.id
-        res_num = residue.number
+    return FeatureColumns(node_features={Nfeat.SECSTRUCT: select_values(residue_onehots, graph_arrays.node_residues)})
 
-        try:
-            node.features[Nfeat.SECSTRUCT] = _classify_secstructure(sec_structure_features[chain_id][res_num]).onehot
-        except AttributeError as e:
-            msg = f"Unknown secondary structure type ({sec_structure_features[chain_id][res_num]}) detected on chain {chain_id} residues {res_num}."
-            raise ValueError(msg) from e
+
+def add_features(  # noqa:D103
+    pdb_path: str,
+    graph: Graph,
+    single_amino_acid_variant: SingleResidueVariant | None = None,
+) -> None:
+    add_feature_columns(graph, get_feature_columns(pdb_path, GraphArrays.from_graph(graph), single_amino_acid_variant))
@@ -6,27 +6,49 @@ import numpy as np
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.molstruct.atom import Atom
 from deeprank2.molstruct.residue import Residue, SingleResidueVariant
+from deeprank2.utils.cache import disk_cache, file_lru_cache
 from deeprank2.utils.graph import Graph
 
 freesasa.setVerbosity(freesasa.nowarnings)
 logging.getLogger(__name__)
 
 
-def add_sasa(pdb_path: str, graph: Graph) -> None:  # noqa:D103
+@file_lru_cache
+@disk_cache("freesasa")
+def _get_sasa(pdb_path: str) -> tuple[dict[tuple[str, str], float], dict[tuple[str, str, str], float]]:
+    """Calculate the solvent accessible surface areas of all residues and atoms in a pdb file.
+
+    Returns:
+        The areas per residue, keyed by chain id and residue number string,
+        and the areas per atom, keyed by chain id, residue number string and atom name.
+    """
     structure = freesasa.Structure(pdb_path)
     result = freesasa.calc(structure)
 
+    residue_areas = {}
+    atom_areas = {}
+    for index in range(structure.nAtoms()):
+        residue_key = (structure.chainLabel(index), structure.residueNumber(index).strip())
+        atom_key = (*residue_key, structure.atomName(index).strip())
+        area = result.atomArea(index)
+        residue_areas[residue_key] = residue_areas.get(residue_key, 0.0) + area
+        atom_areas[atom_key] = atom_areas.get(atom_key, 0.0) + area
+
+    return residue_areas, atom_areas
+
+
+def add_sasa(pdb_path: str, graph: Graph) -> None:  # noqa:D103
+    residue_areas, atom_areas = _get_sasa(pdb_path)
+
     for node in graph.nodes:
         if isinstance(node.id, Residue):
             residue = node.id
-            selection = (f"residue, (resi {residue.number_string}) and (chain {residue.chain.id})",)
-            area = freesasa.selectArea(selection, structure, result)["residue"]
+            area = residue_areas.get((residue.chain.id, residue.number_string), 0.0)
 
         elif isinstance(node.id, Atom):
             atom = node.id
             residue = atom.residue
-            selection = (f"atom, (name {atom.name}) and (resi {residue.number_string}) and (chain {residue.chain.id})",)
-            area = freesasa.selectArea(selection, structure, result)["atom"]
+            area = atom_areas.get((residue.chain.id, residue.number_string, atom.name), 0.0)
 
         else:
             msg = f"Unexpected node type: {type(node.id)}"
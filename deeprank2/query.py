@@ -1,19 +1,25 @@
 from __future__ import annotations
 
+import copy
 import importlib
+import io
 import logging
 import os
 import pickle
 import pkgutil
 import re
+import threading
+import time
 import warnings
+from collections import OrderedDict
+from collections.abc import Sized
 from dataclasses import MISSING, dataclass, field, fields
-from functools import partial
+from datetime import timedelta
 from glob import glob
 from multiprocessing import Pool
 from random import randrange
 from types import ModuleType
-from typing import TYPE_CHECKING, Literal
+from typing import TYPE_CHECKING, BinaryIO, Literal, TextIO, TypeVar
 
 import h5py
 import numpy as np
@@ -23,13 +29,16 @@ import deeprank2.features
 from deeprank2.domain.aminoacidlist import convert_aa_nomenclature
 from deeprank2.features import components, conservation, contact
 from deeprank2.molstruct.residue import Residue, SingleResidueVariant
-from deeprank2.utils.buildgraph import get_contact_atoms, get_structure, get_surrounding_residues
+from deeprank2.utils.buildgraph import get_contact_atoms, get_surrounding_residues, load_structure
+from deeprank2.utils.cache import FILE_CACHE_SIZE
+from deeprank2.utils.datasetindex import build_index
+from deeprank2.utils.featurecolumns import GraphArrays, add_feature_columns
 from deeprank2.utils.graph import Graph
 from deeprank2.utils.grid import Augmentation, GridSettings, MapMethod
 from deeprank2.utils.parsing.pssm import parse_pssm
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Iterable, Iterator
 
     from deeprank2.molstruct.aminoacid import AminoAcid
     from deeprank2.molstruct.structure import PDBStructure
@@ -38,6 +47,25 @@ _log = logging.getLogger(__name__)
 
 VALID_RESOLUTIONS = ["atom", "residue"]
 
+# structures parsed by the most recent queries in this process, see `Query._load_structure`
+_structure_cache: OrderedDict[tuple, PDBStructure] = OrderedDict()
+
+# number of queries written to the combined hdf5 file between flushes
+HDF5_FLUSH_INTERVAL = 100
+# minimum number of seconds between two progress reports while processing queries
+PROGRESS_LOG_INTERVAL = 30
+
+_T = TypeVar("_T")
+
+
+def _get_pssm_key(query: Query) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted(query.pssm_paths.items()))
+
+
+def _get_group_key(query: Query) -> tuple[str, tuple[tuple[str, str], ...]]:
+    """Queries with the same key are built from the same pdb and pssm files, and can share the per-structure calculations."""
+    return query.pdb_path, _get_pssm_key(query)
+
 
 @dataclass(repr=False, kw_only=True)
 class Query:
@@ -84,16 +112,29 @@ class Query:
             graph.targets[target_name] = target_data
 
     def _load_structure(self) -> PDBStructure:
-        """Build PDBStructure objects from pdb and pssm data."""
-        pdb = pdb2sql.pdb2sql(self.pdb_path)
-        try:
-            structure = get_structure(pdb, self.model_id)
-        finally:
-            pdb._close()  # noqa: SLF001
+        """Build PDBStructure objects from pdb and pssm data.
+
+        Structures are cached per process, so queries on the same pdb (and pssm) files share the parsed structure.
+        The parsed atoms are also stored in the disk cache, if it is enabled (see :mod:`deeprank2.utils.cache`).
+        """
+        cache_key = (
+            self.pdb_path,
+            os.path.getmtime(self.pdb_path),
+            self.model_id,
+            self._pssm_required and (_get_pssm_key(self), self.suppress_pssm_errors),
+        )
+        if cache_key in _structure_cache:
+            _structure_cache.move_to_end(cache_key)
+            return _structure_cache[cache_key]
+
+        structure = load_structure(self.pdb_path, self.model_id)
         # read the pssm
         if self._pssm_required:
             self._load_pssm_data(structure)
 
+        _structure_cache[cache_key] = structure
+        if len(_structure_cache) > FILE_CACHE_SIZE:
+            _structure_cache.popitem(last=False)
         return structure
 
     def _load_pssm_data(self, structure: PDBStructure) -> None:
@@ -191,10 +232,15 @@ class Query:
         self._pssm_required = conservation in feature_modules
         graph = self._build_helper()
 
-        # add target and feature data to the graph
+        # add target and feature data to the graph, using the column-wise function of a feature module when it has one
         self._set_graph_targets(graph)
+        graph_arrays = None
         for feature_module in feature_modules:
-            feature_module.add_features(self.pdb_path, graph, self.variant)
+            if hasattr(feature_module, "get_feature_columns"):
+                graph_arrays = graph_arrays or GraphArrays.from_graph(graph)
+                add_feature_columns(graph, feature_module.get_feature_columns(self.pdb_path, graph_arrays, self.variant))
+            else:
+                feature_module.add_features(self.pdb_path, graph, self.variant)
 
         return graph
 
@@ -376,6 +422,79 @@ class ProteinProteinInterfaceQuery(Query):
         return graph
 
 
+class _QueryDispatcher:
+    """Feeds queries to a process pool and keeps track of the results coming back.
+
+    At most `max_in_flight` queries are handed to the pool before their results have been received,
+    so that the queries do not all need to be pickled (or even created) up front.
+    Progress, throughput and the estimated remaining time are logged while the results come in.
+    """
+
+    def __init__(self, queries: Iterable[Query], max_in_flight: int):
+        self._queries = queries
+        self._n_queries = len(queries) if isinstance(queries, Sized) else None
+        self._in_flight = threading.Semaphore(max_in_flight)
+        self._stopped = threading.Event()
+
+    def queries(self) -> Iterator[Query]:
+        """Yield the queries, waiting while `max_in_flight` of them are being processed."""
+        for query in self._queries:
+            self._in_flight.acquire()
+            if self._stopped.is_set():
+                return
+            yield query
+
+    def results(self, results: Iterable[_T]) -> Iterator[_T]:
+        """Yield the results as they come in, making room for new queries to be dispatched."""
+        start_time = last_log_time = time.monotonic()
+        count = 0
+        for result in results:
+            self._in_flight.release()
+            count += 1
+            yield result
+
+            now = time.monotonic()
+            if now - last_log_time >= PROGRESS_LOG_INTERVAL:
+                self._log_progress(count, now - start_time)
+                last_log_time = now
+        self._log_progress(count, time.monotonic() - start_time)
+
+    def stop(self) -> None:
+        """Stop dispatching queries, e.g. when the processing was interrupted."""
+        self._stopped.set()
+        self._in_flight.release()
+
+    def _log_progress(self, count: int, elapsed_time: float) -> None:
+        throughput = count / elapsed_time if elapsed_time > 0 else 0.0
+        if self._n_queries is None:
+            _log.info(f"Processed {count} queries ({throughput:.2f} queries/s).")
+            return
+        if throughput > 0:
+            eta = timedelta(seconds=round((self._n_queries - count) / throughput))
+        else:
+            eta = "unknown"
+        _log.info(f"Processed {count}/{self._n_queries} queries ({throughput:.2f} queries/s), estimated time remaining: {eta}.")
+
+
+def _get_entries_per_query(entry_names: list[str]) -> dict[str, list[str]]:
+    """Group the entries of an hdf5 file by query, where augmented grids (`{query_id}_000`, ...) belong to the entry of their query."""
+    entry_name_set = set(entry_names)
+    entries_per_query = {}
+    for entry_name in entry_names:
+        match = re.fullmatch(r"(.+)_\d{3,}", entry_name)
+        query_id = match.group(1) if match and match.group(1) in entry_name_set else entry_name
+        entries_per_query.setdefault(query_id, []).append(entry_name)
+    return entries_per_query
+
+
+def _write_manifest_entries(manifest: TextIO, written_queries: Iterable[tuple[str, list[str]]]) -> None:
+    """Write one line per query to a manifest file, holding the query id and the names of its hdf5 entries, separated by tabs."""
+    for query_id, entry_names in written_queries:
+        manifest.write("\t".join([query_id, *entry_names]) + "\n")
+    manifest.flush()
+    os.fsync(manifest.fileno())
+
+
 class QueryCollection:
     """Represents the collection of data queries that will be processed.
 
@@ -401,6 +520,7 @@ class QueryCollection:
         self._grid_settings: GridSettings | None = None
         self._grid_map_method: MapMethod | None = None
         self._grid_augmentation_count: int = 0
+        self._consolidate_features: bool = False
 
     def add(
         self,
@@ -453,29 +573,46 @@ class QueryCollection:
     def __len__(self) -> int:
         return len(self._queries)
 
-    def _process_one_query(self, query: Query) -> None:
-        """Only one process may access an hdf5 file at a time."""
-        try:
-            output_path = f"{self._prefix}-{os.getpid()}.hdf5"
-            graph = query.build(self._feature_modules)
-            graph.write_to_hdf5(output_path)
+    def _write_query(self, query: Query, output: str | BinaryIO) -> None:
+        """Build the graph (and grids) of a query and write them to `output`, which is an hdf5 file path or file-like object."""
+        graph = query.build(self._feature_modules)
+        graph.write_to_hdf5(output, self._consolidate_features)
 
-            if self._grid_settings is not None and self._grid_map_method is not None:
+        if self._grid_settings is not None and self._grid_map_method is not None:
+            graph.write_as_grid_to_hdf5(
+                output,
+                self._grid_settings,
+                self._grid_map_method,
+            )
+            for _ in range(self._grid_augmentation_count):
+                # repeat with random augmentation
+                axis, angle = pdb2sql.transform.get_rot_axis_angle(randrange(100))
+                augmentation = Augmentation(axis, angle)
                 graph.write_as_grid_to_hdf5(
-                    output_path,
+                    output,
                     self._grid_settings,
                     self._grid_map_method,
+                    augmentation,
                 )
-                for _ in range(self._grid_augmentation_count):
-                    # repeat with random augmentation
-                    axis, angle = pdb2sql.transform.get_rot_axis_angle(randrange(100))
-                    augmentation = Augmentation(axis, angle)
-                    graph.write_as_grid_to_hdf5(
-                        output_path,
-                        self._grid_settings,
-                        self._grid_map_method,
-                        augmentation,
-                    )
+
+    def _process_one_query(self, query: Query) -> None:
+        """Only one process may access an hdf5 file at a time."""
+        try:
+            output_path = f"{self._prefix}-{os.getpid()}.hdf5"
+            self._write_query(query, output_path)
+
+        except (ValueError, AttributeError, KeyError, TimeoutError) as e:
+            _log.warning(
+                f"\nGraph/Query with ID {query.get_query_id()} ran into an Exception ({e.__class__.__name__}: {e}),"
+                " and it has not been written to the hdf5 file. More details below:",
+            )
+            _log.exception(e)
+
+    def _serialize_one_query(self, query: Query) -> tuple[str, bytes | None]:
+        """Write a query to an in-memory hdf5 file and return its id and contents, to be appended to the output file by the writer."""
+        try:
+            buffer = io.BytesIO()
+            self._write_query(query, buffer)
 
         except (ValueError, AttributeError, KeyError, TimeoutError) as e:
             _log.warning(
@@ -483,8 +620,94 @@ class QueryCollection:
                 " and it has not been written to the hdf5 file. More details below:",
             )
             _log.exception(e)
+            return query.get_query_id(), None
+
+        return query.get_query_id(), buffer.getvalue()
 
-    def process(
+    @staticmethod
+    def _write_serialized_queries(
+        serialized_queries: Iterable[tuple[str, bytes | None]],
+        output_path: str,
+        manifest_path: str,
+    ) -> None:
+        """Append serialized queries to a single hdf5 file, which is kept open and flushed in batches.
+
+        After each flush, the ids of the flushed queries and the names of their entries are added to the manifest file,
+        such that an interrupted run can be resumed.
+        """
+        if os.path.isfile(output_path) and not os.path.isfile(manifest_path):
+            # list the entries of a file that was written without a manifest, such that resuming does not remove them
+            with h5py.File(output_path, "r") as f5, open(manifest_path, "w") as manifest:
+                _write_manifest_entries(manifest, _get_entries_per_query(list(f5.keys())).items())
+
+        written_queries = []
+        with h5py.File(output_path, "a") as f_dest, open(manifest_path, "a") as manifest:
+            for count, (query_id, serialized_query) in enumerate(serialized_queries, start=1):
+                if serialized_query is not None:
+                    with h5py.File(io.BytesIO(serialized_query), "r") as f_src:
+                        for key, value in f_src.items():
+                            if key in f_dest:
+                                _log.warning(f"\n{key} is already present in {output_path}, and it has not been written again.")
+                                continue
+                            _log.debug(f"write {key} to {output_path}")
+                            f_src.copy(value, f_dest)
+                        written_queries.append((query_id, list(f_src.keys())))
+                if count % HDF5_FLUSH_INTERVAL == 0:
+                    f_dest.flush()
+                    _write_manifest_entries(manifest, written_queries)
+                    written_queries = []
+        # the hdf5 file is closed, so the remaining queries are stored as well
+        with open(manifest_path, "a") as manifest:
+            _write_manifest_entries(manifest, written_queries)
+
+    @staticmethod
+    def _get_completed_queries(output_path: str, manifest_path: str) -> set[str]:
+        """Get the ids of the queries that are completely stored in the output file of a previous run.
+
+        Entries in the output file that do not belong to a completed query in the manifest were left by an interrupted run,
+        and are removed so that they can be written again. If there is no manifest (e.g. because the file was written before
+        manifests existed), all entries are kept and their queries are considered completed.
+        """
+        if not os.path.isfile(output_path):
+            return set()
+
+        if not os.path.isfile(manifest_path):
+            with h5py.File(output_path, "r") as f5:
+                completed_queries = _get_entries_per_query(list(f5.keys()))
+            _log.warning(f"\n{output_path} has no manifest, so its {len(completed_queries)} queries are considered completed without checking their entries.")
+        else:
+            manifest_entries = {}
+            with open(manifest_path) as manifest:
+                for line in manifest:
+                    if line.strip():
+                        query_id, *entry_names = line.rstrip("\n").split("\t")
+                        # a query that was written again by a later run is listed more than once
+                        query_entries = manifest_entries.setdefault(query_id, [])
+                        query_entries.extend(name for name in entry_names if name not in query_entries)
+
+            with h5py.File(output_path, "a") as f5:
+                completed_queries = {query_id: entry_names for query_id, entry_names in manifest_entries.items() if all(name in f5 for name in entry_names)}
+                completed_entries = {name for entry_names in completed_queries.values() for name in entry_names}
+                for entry_name in list(f5.keys()):
+                    if entry_name not in completed_entries:
+                        _log.warning(f"\nRemoving incomplete entry {entry_name} from {output_path}, it will be written again.")
+                        del f5[entry_name]
+
+        # only keep the completed queries in the manifest
+        with open(manifest_path, "w") as manifest:
+            _write_manifest_entries(manifest, completed_queries.items())
+
+        return set(completed_queries)
+
+    def _skip_completed_queries(self, queries: Iterable[Query], output_path: str, manifest_path: str) -> Iterable[Query]:
+        """Filter out the queries that were completed by a previous run."""
+        completed_queries = self._get_completed_queries(output_path, manifest_path)
+        _log.info(f"Resuming: {len(completed_queries)} queries were already completed and will be skipped.")
+        if isinstance(queries, Sized):
+            return [query for query in queries if query.get_query_id() not in completed_queries]
+        return (query for query in queries if query.get_query_id() not in completed_queries)
+
+    def process(  # noqa: PLR0915, C901
         self,
         prefix: str = "processed-queries",
         feature_modules: list[ModuleType, str] | ModuleType | str | None = None,
@@ -493,23 +716,53 @@ class QueryCollection:
         grid_settings: GridSettings | None = None,
         grid_map_method: MapMethod | None = None,
         grid_augmentation_count: int = 0,
+        chunksize: int = 1,
+        max_in_flight: int | None = None,
+        queries: Iterable[Query] | None = None,
+        resume: bool = False,
+        write_index: bool = False,
+        consolidate_features: bool = False,
     ) -> list[str]:
         """Render queries into graphs (and optionally grids).
 
+        Queries are dispatched to the processes in a streaming fashion and written as soon as they are done,
+        so the order of the entries in the output files may differ from the order of the queries.
+        The queries added to the collection are dispatched grouped by their pdb and pssm files, such that every process
+        parses a structure and runs the per-structure feature calculations (e.g. surface areas) only once for the whole group.
+
         Args:
             prefix: Prefix for naming the output files. Defaults to "processed-queries".
             feature_modules: Feature module or list of feature modules used to generate features (given as string or as an imported module).
                 Each module must implement the :py:func:`add_features` function, and all feature modules must exist inside `deeprank2.features` folder.
+                Modules that also implement `get_feature_columns` (see :mod:`deeprank2.utils.featurecolumns`) compute their features through it.
                 If set to 'all', all available modules in `deeprank2.features` are used to generate the features.
                 Defaults to the two primary feature modules `deeprank2.features.components` and `deeprank2.features.contact`.
             cpu_count: The number of processes to be run in parallel (i.e. number of CPUs used), capped by the number of CPUs available to the system.
                 Defaults to None, which takes all available cpu cores.
             combine_output:
-                If `True` (default): all processes are combined into a single HDF5 file.
+                If `True` (default): all processes send their data to a single writer, which stores it in a single HDF5 file.
                 If `False`: separate HDF5 files are created for each process (i.e. for each CPU used).
             grid_settings: If valid together with `grid_map_method`, the grid data will be stored as well. Defaults to None.
             grid_map_method: If valid together with `grid_settings`, the grid data will be stored as well. Defaults to None.
             grid_augmentation_count: Number of grid data augmentations (must be >= 0). Defaults to 0.
+            chunksize: Number of queries sent to a process at once. Larger chunks reduce the communication overhead
+                for many small queries. Defaults to 1.
+            max_in_flight: Maximum number of queries that are dispatched but not yet finished, which bounds the memory used by the
+                main process (must be >= `chunksize`). Defaults to None, which sets it to 4 times `cpu_count` times `chunksize`.
+            queries: Queries to process instead of the ones added to the collection. This can be any iterable, including a generator,
+                such that very large numbers of queries never need to be held in memory at once. Note that, unlike for added queries,
+                duplicate query ids are not renamed. Defaults to None, which processes the queries added to the collection.
+            resume: Only available if `combine_output` is `True`. If `True`, queries that were already completely written to the
+                output file by a previous (interrupted) run are skipped, and incomplete entries left by that run are written again.
+                Completed queries are tracked in a manifest file (`{prefix}.manifest`), which is created next to the output file.
+                If the output file has no manifest (e.g. because it was written before manifests existed), all its entries are
+                kept and their queries are considered completed.
+                Defaults to False.
+            write_index: If `True`, a sidecar index of the entries (see :mod:`deeprank2.utils.datasetindex`) is written next to
+                each generated HDF5 file, which lets datasets select entries without opening them. Defaults to False.
+            consolidate_features: If `True`, the node features and the edge features of each graph are stored as a single
+                matrix each, instead of as one dataset per feature (see :func:`deeprank2.utils.graph.write_features`).
+                This makes the files smaller and faster to load with :class:`deeprank2.dataset.GraphDataset`. Defaults to False.
 
         Returns:
             The list of paths of the generated HDF5 files.
@@ -534,23 +787,54 @@ class QueryCollection:
             msg = f"`grid_augmentation_count` cannot be negative, but was given as {grid_augmentation_count}"
             raise ValueError(msg)
         self._grid_augmentation_count = grid_augmentation_count
+        self._consolidate_features = consolidate_features
 
-        _log.info(f"Creating pool function to process {len(self)} queries...")
-        pool_function = partial(self._process_one_query)
+        if chunksize < 1:
+            msg = f"`chunksize` must be at least 1, but was given as {chunksize}"
+            raise ValueError(msg)
+        if max_in_flight is None:
+            max_in_flight = 4 * self._cpu_count * chunksize
+        elif max_in_flight < chunksize:
+            msg = f"`max_in_flight` cannot be smaller than `chunksize` ({chunksize}), but was given as {max_in_flight}"
+            raise ValueError(msg)
+
+        if resume and not combine_output:
+            msg = "`resume` is only available if `combine_output` is True."
+            raise ValueError(msg)
+
+        output_path = f"{self._prefix}.hdf5"
+        manifest_path = f"{self._prefix}.manifest"
+        if queries is None:
+            # keep queries on the same structure together, so that the workers can reuse the per-structure calculations
+            queries = sorted(self._queries, key=_get_group_key)
+        if resume:
+            queries = self._skip_completed_queries(queries, output_path, manifest_path)
+        dispatcher = _QueryDispatcher(queries, max_in_flight)
+
+        # the workers only need the processing settings, so don't pickle the added queries along with every task
+        worker = copy.copy(self)
+        worker._queries = []  # noqa: SLF001
+        worker._ids_count = {}  # noqa: SLF001
+
+        _log.info(f"Creating pool function to process {len(queries) if isinstance(queries, Sized) else 'streamed'} queries...")
         with Pool(self._cpu_count) as pool:
             _log.info("Starting pooling...\n")
-            pool.map(pool_function, self.queries)
-
-        output_paths = glob(f"{prefix}-*.hdf5")
-        if combine_output:
-            for output_path in output_paths:
-                with h5py.File(f"{prefix}.hdf5", "a") as f_dest, h5py.File(output_path, "r") as f_src:
-                    for key, value in f_src.items():
-                        _log.debug(f"copy {key} from {output_path} to {prefix}.hdf5")
-                        f_src.copy(value, f_dest)
-                os.remove(output_path)
-            return glob(f"{prefix}.hdf5")
-
+            try:
+                if combine_output:
+                    # workers only build the data, which is written by this process to a single file
+                    results = pool.imap_unordered(worker._serialize_one_query, dispatcher.queries(), chunksize)  # noqa: SLF001
+                    self._write_serialized_queries(dispatcher.results(results), output_path, manifest_path)
+                else:
+                    results = pool.imap_unordered(worker._process_one_query, dispatcher.queries(), chunksize)  # noqa: SLF001
+                    for _ in dispatcher.results(results):
+                        pass
+            finally:
+                dispatcher.stop()
+
+        output_paths = [output_path] if combine_output else glob(f"{self._prefix}-*.hdf5")
+        if write_index:
+            for path in output_paths:
+                build_index(path)
         return output_paths
 
     def _set_feature_modules(self, feature_modules: list[ModuleType, str] | ModuleType | str) -> list[str]:
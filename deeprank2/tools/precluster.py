@@ -0,0 +1,157 @@
+import glob
+import logging
+import os
+from functools import partial
+from multiprocessing import Pool
+
+import h5py
+import numpy as np
+import torch
+from torch_geometric.nn.pool.consecutive import consecutive_cluster
+from torch_geometric.nn.pool.pool import pool_edge
+from tqdm import tqdm
+
+from deeprank2.dataset import GraphDataset, close_hdf5_files
+from deeprank2.domain import edgestorage as Efeat
+from deeprank2.domain import nodestorage as Nfeat
+from deeprank2.utils.community_pooling import community_detection
+from deeprank2.utils.datasetindex import build_index, get_index_path
+
+_log = logging.getLogger(__name__)
+
+# number of entries that are clustered by the worker processes before their clusters are written
+PRECLUSTER_BLOCK_SIZE = 512
+# number of entries that a worker process clusters per task
+PRECLUSTER_CHUNK_SIZE = 8
+
+
+def precluster(
+    graphs: GraphDataset | str | list[str],
+    method: str = "mcl",
+    skip_existing: bool = True,
+    cpu_count: int | None = None,
+) -> None:
+    """Clusters the nodes of graphs in .HDF5 files, as needed by networks that use the `clustering_method` of :class:`GraphDataset`.
+
+    For each graph, the nodes are clustered into "depth_0", and the nodes of the graph that results from pooling these clusters
+    are clustered into "depth_1". Both are stored in the "clustering/{method}" group of the entry. The graphs are clustered
+    in parallel processes, which only read the .HDF5 files, and the clusters are written by the main process.
+    :class:`deeprank2.trainer.Trainer` runs this step for its datasets, which is fast once the clusters are present.
+
+    Args:
+        graphs: :class:`GraphDataset` whose entries are clustered, or either a directory containing .HDF5 files, a single .HDF5
+            file name or a list of .HDF5 file names, whose entries are all clustered.
+        method: "mcl" for Markov cluster algorithm, or "louvain" for Louvain method. Defaults to "mcl".
+        skip_existing: Whether to skip the entries that are already clustered with `method`. Defaults to True.
+        cpu_count: The number of processes to be run in parallel, capped by the number of CPUs available to the system.
+            Defaults to None, which uses all CPUs.
+    """
+    method = method.lower()
+    if method not in ("mcl", "louvain"):
+        msg = f"Invalid node clustering method: {method}. Please set the method to 'mcl' or 'louvain'."
+        raise ValueError(msg)
+
+    entries_per_file = _get_entries_per_file(graphs)
+    if skip_existing:
+        entries_per_file = {hdf5_path: _get_unclustered_entries(hdf5_path, entry_names, method) for hdf5_path, entry_names in entries_per_file.items()}
+        entries_per_file = {hdf5_path: entry_names for hdf5_path, entry_names in entries_per_file.items() if len(entry_names) > 0}
+    n_entries = sum(len(entry_names) for entry_names in entries_per_file.values())
+    if n_entries == 0:
+        return
+
+    max_cpus = os.cpu_count()
+    cpu_count = max_cpus if cpu_count is None else min(cpu_count, max_cpus)
+    pool = Pool(processes=cpu_count) if cpu_count > 1 and n_entries > PRECLUSTER_CHUNK_SIZE else None
+    try:
+        with tqdm(total=n_entries, desc=f"   Clustering ({method})") as progress:
+            for hdf5_path, entry_names in entries_per_file.items():
+                # the clusters are written while no process has the file open for reading
+                close_hdf5_files(hdf5_path)
+                for block_start in range(0, len(entry_names), PRECLUSTER_BLOCK_SIZE):
+                    block = entry_names[block_start : block_start + PRECLUSTER_BLOCK_SIZE]
+                    chunks = [block[i : i + PRECLUSTER_CHUNK_SIZE] for i in range(0, len(block), PRECLUSTER_CHUNK_SIZE)]
+                    cluster_chunk = partial(_cluster_entries, hdf5_path, method=method)
+                    results = pool.map(cluster_chunk, chunks) if pool is not None else map(cluster_chunk, chunks)
+                    _write_clusters(hdf5_path, method, [result for chunk_results in results for result in chunk_results])
+                    progress.update(len(block))
+
+                # keep the sidecar index up to date with the modified file
+                if os.path.isfile(get_index_path(hdf5_path)):
+                    build_index(hdf5_path)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _get_entries_per_file(graphs: GraphDataset | str | list[str]) -> dict[str, list[str]]:
+    if isinstance(graphs, GraphDataset):
+        entries_per_file = {}
+        for hdf5_path, entry_name in graphs.index_entries:
+            entries_per_file.setdefault(hdf5_path, []).append(entry_name)
+        return entries_per_file
+
+    if isinstance(graphs, list):
+        hdf5_paths = graphs
+    elif os.path.isdir(graphs):
+        hdf5_paths = glob.glob(f"{graphs}/*.hdf5")
+    elif os.path.isfile(graphs):
+        hdf5_paths = [graphs]
+    else:
+        msg = "Incorrect input passed."
+        raise TypeError(msg)
+
+    entries_per_file = {}
+    for hdf5_path in hdf5_paths:
+        if not os.path.isfile(hdf5_path):
+            msg = f"File {hdf5_path} not found."
+            raise FileNotFoundError(msg)
+        with h5py.File(hdf5_path, "r") as hdf5_file:
+            entries_per_file[hdf5_path] = list(hdf5_file.keys())
+    return entries_per_file
+
+
+def _get_unclustered_entries(hdf5_path: str, entry_names: list[str], method: str) -> list[str]:
+    """Gets the entries of an .HDF5 file that are not yet clustered with `method`."""
+    with h5py.File(hdf5_path, "r") as hdf5_file:
+        return [
+            entry_name
+            for entry_name in entry_names
+            if f"clustering/{method}/depth_0" not in hdf5_file[entry_name] or f"clustering/{method}/depth_1" not in hdf5_file[entry_name]
+        ]
+
+
+def _cluster_entries(hdf5_path: str, entry_names: list[str], method: str) -> list[tuple[str, np.ndarray, np.ndarray]]:
+    """Clusters the nodes of some entries of an .HDF5 file, which is only opened for reading."""
+    results = []
+    with h5py.File(hdf5_path, "r") as hdf5_file:
+        for entry_name in entry_names:
+            grp = hdf5_file[entry_name]
+            # the edges in both directions, as in the graphs loaded by GraphDataset
+            num_nodes = grp[f"{Nfeat.NODE}/{Nfeat.POSITION}"].shape[0]
+            if Efeat.INDEX in grp[Efeat.EDGE]:
+                ind = grp[f"{Efeat.EDGE}/{Efeat.INDEX}"][()]
+                edge_index = torch.tensor(np.vstack((ind, np.flip(ind, 1))).T, dtype=torch.long).contiguous()
+            else:
+                edge_index = torch.empty((2, 0), dtype=torch.long)
+
+            cluster0 = community_detection(edge_index, num_nodes, method=method)
+            # the graph of the pooled clusters, as made by community_pooling
+            pooled_cluster, _ = consecutive_cluster(cluster0)
+            pooled_edge_index, _ = pool_edge(pooled_cluster, edge_index)
+            cluster1 = community_detection(pooled_edge_index, int(pooled_cluster.max()) + 1, method=method)
+            results.append((entry_name, cluster0.cpu().numpy(), cluster1.cpu().numpy()))
+    return results
+
+
+def _write_clusters(hdf5_path: str, method: str, results: list[tuple[str, np.ndarray, np.ndarray]]) -> None:
+    if len(results) == 0:
+        return
+    with h5py.File(hdf5_path, "a") as hdf5_file:
+        for entry_name, cluster0, cluster1 in results:
+            clust_grp = hdf5_file[entry_name].require_group("clustering")
+            if method in clust_grp:
+                del clust_grp[method]
+            method_grp = clust_grp.create_group(method)
+            method_grp.create_dataset("depth_0", data=cluster0)
+            method_grp.create_dataset("depth_1", data=cluster1)
@@ -6,7 +6,9 @@ import h5py
 import numpy as np
 from pdb2sql import StructureSimilarity
 
+from deeprank2.dataset import close_hdf5_files
 from deeprank2.domain import targetstorage as targets
+from deeprank2.utils.datasetindex import build_index, get_index_path
 
 _log = logging.getLogger(__name__)
 MIN_IRMS_FOR_BINARY = 4
@@ -53,6 +55,7 @@ def add_target(  # noqa: C901
             msg = f"File {hdf5} not found."
             raise FileNotFoundError(msg)
 
+        close_hdf5_files(hdf5)
         try:
             f5 = h5py.File(hdf5, "a")
             for model in target_dict:
@@ -73,6 +76,10 @@ def add_target(  # noqa: C901
                     _log.info(f"no graph for {model}")
             f5.close()
 
+            # keep the sidecar index up to date with the new target values
+            if os.path.isfile(get_index_path(hdf5)):
+                build_index(hdf5)
+
         except BaseException:  # noqa: BLE001
             _log.info(f"no graph for {hdf5}")
 
@@ -9,20 +9,19 @@ from time import time
 from typing import Any
 
 import dill
-import h5py
 import numpy as np
 import torch
 from torch import nn
 from torch.nn.functional import softmax
 from torch_geometric.loader import DataLoader
-from tqdm import tqdm
 
-from deeprank2.dataset import GraphDataset, GridDataset
+from deeprank2.dataset import GraphDataset, GridDataset, PackedGraphDataset
 from deeprank2.domain import losstypes as losses
 from deeprank2.domain import targetstorage as targets
-from deeprank2.utils.community_pooling import community_detection, community_pooling
+from deeprank2.tools.precluster import precluster
 from deeprank2.utils.earlystopping import EarlyStopping
 from deeprank2.utils.exporters import HDF5OutputExporter, OutputExporter, OutputExporterCollection
+from deeprank2.utils.sampler import SizeAwareBatchSampler
 
 # ruff: noqa: PYI041 (usage depends on type in this module)
 _log = logging.getLogger(__name__)
@@ -317,35 +316,11 @@ class Trainer:
         self.model.load_state_dict(self.model_load_state_dict)
 
     def _precluster(self, dataset: GraphDataset) -> None:
-        """Pre-clusters nodes of the graphs."""
-        for fname, mol in tqdm(dataset.index_entries):
-            data = dataset.load_one_graph(fname, mol)
-
-            if data is None:
-                f5 = h5py.File(fname, "a")
-                try:
-                    _log.info(f"deleting {mol}")
-                    del f5[mol]
-                except BaseException:  # noqa: BLE001
-                    _log.info(f"{mol} not found")
-                f5.close()
-                continue
-
-            f5 = h5py.File(fname, "a")
-            grp = f5[mol]
-            clust_grp = grp.require_group("clustering")
-
-            if self.clustering_method.lower() in clust_grp:
-                del clust_grp[self.clustering_method.lower()]
-
-            method_grp = clust_grp.create_group(self.clustering_method.lower())
-            cluster = community_detection(data.edge_index, data.num_nodes, method=self.clustering_method)
-            method_grp.create_dataset("depth_0", data=cluster.cpu())
-            data = community_pooling(cluster, data)
-            cluster = community_detection(data.edge_index, data.num_nodes, method=self.clustering_method)
-            method_grp.create_dataset("depth_1", data=cluster.cpu())
-
-            f5.close()
+        """Pre-clusters nodes of the graphs that are not clustered yet, see :func:`deeprank2.tools.precluster.precluster`."""
+        if isinstance(dataset, PackedGraphDataset):
+            _log.info("Packed datasets contain the clusters of the graphs that were packed, so they are not clustered again.")
+            return
+        precluster(dataset, self.clustering_method)
 
     def _put_model_to_device(self, dataset: GraphDataset | GridDataset) -> None:
         """Puts the model on the available device.
@@ -512,6 +487,8 @@ class Trainer:
         num_workers: int = 0,
         best_model: bool = True,
         filename: str | None = "model.pth.tar",
+        max_nodes: int | None = None,
+        max_edges: int | None = None,
     ) -> None:
         """Performs the training of the model.
 
@@ -529,6 +506,10 @@ class Trainer:
                 If False, the last model tried is selected.
             filename: Name of the file where to save the selected model. If not None, the model is saved to `filename`.
                 If None, the model is not saved. Defaults to 'model.pth.tar'.
+            max_nodes: If set, batches are filled with graphs up to this total number of nodes instead of with `batch_size` graphs,
+                see :class:`deeprank2.utils.sampler.SizeAwareBatchSampler`. Only for graph datasets. Defaults to None.
+            max_edges: If set, batches are filled with graphs up to this total number of edges instead of with `batch_size` graphs,
+                see :class:`deeprank2.utils.sampler.SizeAwareBatchSampler`. Only for graph datasets. Defaults to None.
         """
         if self.dataset_train is None:
             msg = "No training dataset provided."
@@ -538,23 +519,11 @@ class Trainer:
         self.batch_size_train = batch_size
         self.shuffle = shuffle
 
-        self.train_loader = DataLoader(
-            self.dataset_train,
-            batch_size=self.batch_size_train,
-            shuffle=self.shuffle,
-            num_workers=num_workers,
-            pin_memory=self.cuda,
-        )
+        self.train_loader = self._create_loader(self.dataset_train, self.batch_size_train, self.shuffle, num_workers, max_nodes, max_edges)
         _log.info("Training set loaded\n")
 
         if self.dataset_val is not None:
-            self.valid_loader = DataLoader(
-                self.dataset_val,
-                batch_size=self.batch_size_train,
-                shuffle=self.shuffle,
-                num_workers=num_workers,
-                pin_memory=self.cuda,
-            )
+            self.valid_loader = self._create_loader(self.dataset_val, self.batch_size_train, self.shuffle, num_workers, max_nodes, max_edges)
             _log.info("Validation set loaded\n")
         else:
             self.valid_loader = None
@@ -566,10 +535,9 @@ class Trainer:
 
         # Assign weights to each class
         if self.task == targets.CLASSIF and self.class_weights:
-            targets_all = [batch.y for batch in self.train_loader]
-
-            targets_all = torch.cat(targets_all).squeeze().tolist()
-            self.weights = torch.tensor([targets_all.count(i) for i in self.classes], dtype=torch.float32)
+            # the targets are read from the files, without loading the training data
+            targets_all = torch.tensor(self.dataset_train.get_target_values(), dtype=torch.float32)
+            self.weights = torch.tensor([(targets_all == i).sum().item() for i in self.classes], dtype=torch.float32)
             _log.info(f"class occurences: {self.weights}")
             self.weights = 1.0 / self.weights
             self.weights = self.weights / self.weights.sum()
@@ -838,12 +806,18 @@ class Trainer:
         self,
         batch_size: int = 32,
         num_workers: int = 0,
+        max_nodes: int | None = None,
+        max_edges: int | None = None,
     ) -> None:
         """Performs the testing of the model.
 
         Args:
             batch_size: Sets the size of the batch. Defaults to 32.
             num_workers: How many subprocesses to use for data loading. 0 means that the data will be loaded in the main process. Defaults to 0.
+            max_nodes: If set, batches are filled with graphs up to this total number of nodes instead of with `batch_size` graphs,
+                see :class:`deeprank2.utils.sampler.SizeAwareBatchSampler`. Only for graph datasets. Defaults to None.
+            max_edges: If set, batches are filled with graphs up to this total number of edges instead of with `batch_size` graphs,
+                see :class:`deeprank2.utils.sampler.SizeAwareBatchSampler`. Only for graph datasets. Defaults to None.
         """
         if (not self.pretrained_model) and (not self.model_load_state_dict):
             msg = "No pretrained model provided and no training performed. Please provide a pretrained model or train the model before testing."
@@ -854,11 +828,13 @@ class Trainer:
         if self.dataset_test is not None:
             _log.info("Loading independent testing dataset...")
 
-            self.test_loader = DataLoader(
+            self.test_loader = self._create_loader(
                 self.dataset_test,
-                batch_size=self.batch_size_test,
+                self.batch_size_test,
+                shuffle=False,
                 num_workers=num_workers,
-                pin_memory=self.cuda,
+                max_nodes=max_nodes,
+                max_edges=max_edges,
             )
             _log.info("Testing set loaded\n")
         else:
@@ -870,6 +846,26 @@ class Trainer:
             # Run test
             self._eval(self.test_loader, self.epoch_saved_model, "testing")
 
+    def _create_loader(
+        self,
+        dataset: GraphDataset | GridDataset,
+        batch_size: int,
+        shuffle: bool,
+        num_workers: int,
+        max_nodes: int | None,
+        max_edges: int | None,
+    ) -> DataLoader:
+        """Creates a DataLoader that batches by number of items, or by number of nodes and/or edges if `max_nodes` or `max_edges` is set."""
+        if max_nodes is None and max_edges is None:
+            return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers, pin_memory=self.cuda)
+
+        if not isinstance(dataset, GraphDataset):
+            msg = "`max_nodes` and `max_edges` can only be used with graph datasets."
+            raise TypeError(msg)
+        node_counts, edge_counts = dataset.get_graph_sizes()
+        batch_sampler = SizeAwareBatchSampler(node_counts, edge_counts, max_nodes=max_nodes, max_edges=max_edges, shuffle=shuffle)
+        return DataLoader(dataset, batch_sampler=batch_sampler, num_workers=num_workers, pin_memory=self.cuda)
+
     def _load_params(self) -> None:
         """Loads the parameters of a pretrained model."""
         if torch.cuda.is_available():
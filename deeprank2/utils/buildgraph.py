@@ -1,5 +1,8 @@
+from __future__ import annotations
+
 import logging
 import os
+from typing import TYPE_CHECKING
 
 import numpy as np
 from pdb2sql import interface as pdb2sql_interface
@@ -11,6 +14,10 @@ from deeprank2.molstruct.atom import Atom, AtomicElement
 from deeprank2.molstruct.pair import Pair
 from deeprank2.molstruct.residue import Residue
 from deeprank2.molstruct.structure import Chain, PDBStructure
+from deeprank2.utils.cache import disk_array_cache
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
 
 _log = logging.getLogger(__name__)
 
@@ -28,6 +35,111 @@ def _add_atom_to_residue(atom: Atom, residue: Residue) -> None:
     residue.add_atom(atom)
 
 
+# the pdb2sql columns that are read for each atom, and the arrays that they are read into (see `_read_atom_arrays`)
+PDB2SQL_COLUMNS = "x,y,z,name,altLoc,occ,element,chainID,resSeq,resName,iCode"
+ATOM_ARRAY_KEYS = ("position", "name", "altloc", "occupancy", "element", "chain_id", "residue_number", "residue_name", "insertion_code")
+
+
+def _read_atom_arrays(pdb_obj: pdb2sql_object, **kwargs) -> dict[str, NDArray]:  # noqa: ANN003
+    """Reads the atoms from a `pdb2sql` object in a single query, into one array per column.
+
+    Args:
+        pdb_obj: The `pdb2sql` object to retrieve the data from.
+        kwargs: as required by the get function for the `pdb2sql` object.
+
+    Returns:
+        dict[str, NDArray]: The array of each key in `ATOM_ARRAY_KEYS`, with one row per atom in the order of pdb2sql.
+            Missing alternative locations and insertion codes are empty strings.
+    """
+    rows = pdb_obj.get(PDB2SQL_COLUMNS, **kwargs)
+    columns = list(zip(*rows, strict=True)) if len(rows) > 0 else [()] * len(PDB2SQL_COLUMNS.split(","))
+    x, y, z, name, altloc, occupancy, element, chain_id, residue_number, residue_name, insertion_code = columns
+    return {
+        "position": np.array([x, y, z], dtype=np.float64).T.reshape(-1, 3),
+        "name": np.array(name, dtype=str),
+        "altloc": np.array(["" if value is None else value for value in altloc], dtype=str),
+        "occupancy": np.array(occupancy, dtype=np.float64),
+        "element": np.array(element, dtype=str),
+        "chain_id": np.array(chain_id, dtype=str),
+        "residue_number": np.array(residue_number, dtype=np.int64),
+        "residue_name": np.array(residue_name, dtype=str),
+        "insertion_code": np.array(["" if value is None else value for value in insertion_code], dtype=str),
+    }
+
+
+def _add_atom_arrays_to_structure(structure: PDBStructure, atom_arrays: dict[str, NDArray]) -> None:
+    """Adds the chains, residues and atoms in the arrays of `_read_atom_arrays` to a `PDBStructure`.
+
+    The atoms are grouped into residues and chains with array operations. Only residues with several atoms of the same
+    name are built atom by atom, to choose between alternative locations (see `_add_atom_to_residue`).
+
+    Args:
+        structure: The structure to which the atoms should be added.
+        atom_arrays: The arrays of the atoms.
+    """
+    # atoms from the first alternative location other than "A" onwards are not part of the structure
+    other_altlocs = np.flatnonzero((atom_arrays["altloc"] != "") & (atom_arrays["altloc"] != "A"))
+    atom_count = other_altlocs[0] if len(other_altlocs) > 0 else len(atom_arrays["altloc"])
+    if atom_count == 0:
+        return
+    atom_arrays = {key: values[:atom_count] for key, values in atom_arrays.items()}
+
+    # chains and residues, in order of their first atom
+    chain_ids, atom_chains = _group_first_occurrence(atom_arrays["chain_id"])
+    residue_keys = np.rec.fromarrays((atom_chains, atom_arrays["residue_number"], atom_arrays["insertion_code"]))
+    residue_first_atoms, atom_residues = _group_first_occurrence(residue_keys, return_first=True)
+
+    chains = []
+    for chain_id in chain_ids.tolist():
+        chain = Chain(structure, chain_id)
+        structure.add_chain(chain)
+        chains.append(chain)
+
+    residues = []
+    for first_atom in residue_first_atoms.tolist():
+        chain = chains[atom_chains[first_atom]]
+        residue = Residue(
+            chain,
+            atom_arrays["residue_number"][first_atom].item(),
+            amino_acids_by_code.get(atom_arrays["residue_name"][first_atom].item()),
+            atom_arrays["insertion_code"][first_atom].item() or None,
+        )
+        chain.add_residue(residue)
+        residues.append(residue)
+
+    # only residues with several atoms of the same name need to choose between alternative locations
+    _, atom_names = np.unique(atom_arrays["name"], return_inverse=True)
+    residue_names, name_counts = np.unique(np.stack((atom_residues, atom_names.ravel()), axis=1), axis=0, return_counts=True)
+    has_altlocs = np.zeros(len(residues), dtype=bool)
+    has_altlocs[residue_names[name_counts > 1, 0]] = True
+
+    elements = {element: AtomicElement[element] for element in np.unique(atom_arrays["element"]).tolist()}
+    positions = atom_arrays["position"]
+    for atom_index, (residue_index, name, element, occupancy) in enumerate(
+        zip(atom_residues.tolist(), atom_arrays["name"].tolist(), atom_arrays["element"].tolist(), atom_arrays["occupancy"].tolist(), strict=True),
+    ):
+        residue = residues[residue_index]
+        atom = Atom(residue, name, elements[element], positions[atom_index], occupancy)
+        if has_altlocs[residue_index]:
+            _add_atom_to_residue(atom, residue)
+        else:
+            residue.add_atom(atom)
+
+
+def _group_first_occurrence(values: NDArray, return_first: bool = False) -> tuple[NDArray, NDArray]:
+    """Groups equal values, numbering the groups in order of their first occurrence.
+
+    Returns:
+        tuple[NDArray, NDArray]: The value of each group (or the index of its first occurrence, if `return_first`) and the group of each value.
+    """
+    _, first_occurrences, inverse = np.unique(values, return_index=True, return_inverse=True)
+    order = np.argsort(first_occurrences, kind="stable")
+    group_numbers = np.empty(len(order), dtype=np.int64)
+    group_numbers[order] = np.arange(len(order))
+    first_occurrences = first_occurrences[order]
+    return (first_occurrences if return_first else values[first_occurrences]), group_numbers[inverse.ravel()]
+
+
 def _add_atom_data_to_structure(
     structure: PDBStructure,
     pdb_obj: pdb2sql_object,
@@ -35,73 +147,74 @@ def _add_atom_data_to_structure(
 ) -> None:
     """This subroutine retrieves pdb2sql atomic data for `PDBStructure` objects as defined in DeepRank2.
 
-    This function should be called for one atom at a time.
-
     Args:
-        structure: The structure to which this atom should be added to.
+        structure: The structure to which the atoms should be added to.
         pdb_obj: The `pdb2sql` object to retrieve the data from.
         kwargs: as required by the get function for the `pdb2sql` object.
     """
-    pdb2sql_columns = "x,y,z,name,altLoc,occ,element,chainID,resSeq,resName,iCode"
-    data_keys = pdb2sql_columns.split(sep=",")
-    for data_values in pdb_obj.get(pdb2sql_columns, **kwargs):
-        atom_data = dict(zip(data_keys, data_values, strict=True))
-
-        # exit function if this atom is already part of the structure
-        if atom_data["altLoc"] not in (None, "", "A"):
-            return
+    _add_atom_arrays_to_structure(structure, _read_atom_arrays(pdb_obj, **kwargs))
 
-        atom_data["iCode"] = None if atom_data["iCode"] == "" else atom_data["iCode"]
 
-        try:
-            atom_data["aa"] = amino_acids_by_code[atom_data["resName"]]
-        except KeyError:
-            atom_data["aa"] = None
-        atom_data["coordinates"] = np.array(data_values[:3])
+def get_structure(pdb_obj: pdb2sql_object, id_: str) -> PDBStructure:
+    """Builds a structure from rows in a pdb file.
 
-        if not structure.has_chain(atom_data["chainID"]):
-            structure.add_chain(Chain(structure, atom_data["chainID"]))
-        chain = structure.get_chain(atom_data["chainID"])
+    Args:
+        pdb_obj: The pdb structure that we're investigating.
+        id_: Unique id for the pdb structure.
 
-        if not chain.has_residue(atom_data["resSeq"], atom_data["iCode"]):
-            chain.add_residue(Residue(chain, atom_data["resSeq"], atom_data["aa"], atom_data["iCode"]))
-        residue = chain.get_residue(atom_data["resSeq"], atom_data["iCode"])
+    Returns:
+        PDBStructure: The structure object, giving access to chains, residues, atoms.
+    """
+    structure = PDBStructure(id_)
+    _add_atom_data_to_structure(structure, pdb_obj, model=0)
+    return structure
 
-        atom = Atom(
-            residue,
-            atom_data["name"],
-            AtomicElement[atom_data["element"]],
-            atom_data["coordinates"],
-            atom_data["occ"],
-        )
-        _add_atom_to_residue(atom, residue)
 
+def load_structure(pdb_path: str, id_: str) -> PDBStructure:
+    """Builds a structure from a pdb file, like :func:`get_structure`.
 
-def get_structure(pdb_obj: pdb2sql_object, id_: str) -> PDBStructure:
-    """Builds a structure from rows in a pdb file.
+    The parsed atoms are stored in the disk cache, if it is enabled (see :mod:`deeprank2.utils.cache`), so that every
+    pdb file is only parsed once.
 
     Args:
-        pdb_obj: The pdb structure that we're investigating.
+        pdb_path: Path to the pdb file.
         id_: Unique id for the pdb structure.
 
     Returns:
         PDBStructure: The structure object, giving access to chains, residues, atoms.
     """
     structure = PDBStructure(id_)
-    _add_atom_data_to_structure(structure, pdb_obj, model=0)
+    _add_atom_arrays_to_structure(structure, _read_structure_arrays(pdb_path))
     return structure
 
 
+@disk_array_cache("structure")
+def _read_structure_arrays(pdb_path: str) -> dict[str, NDArray]:
+    pdb = pdb2sql_object(pdb_path)
+    try:
+        return _read_atom_arrays(pdb, model=0)
+    finally:
+        pdb._close()  # noqa: SLF001
+
+
 def get_contact_atoms(
     pdb_path: str,
     chain_ids: list[str],
     influence_radius: float,
 ) -> list[Atom]:
-    """Gets the contact atoms from pdb2sql and wraps them in python objects."""
-    interface = pdb2sql_interface(pdb_path)
+    """Gets the contact atoms from pdb2sql and wraps them in python objects.
+
+    The contact atoms are stored in the disk cache, if it is enabled (see :mod:`deeprank2.utils.cache`).
+    """
     pdb_name = os.path.splitext(os.path.basename(pdb_path))[0]
     structure = PDBStructure(f"contact_atoms_{pdb_name}")
+    _add_atom_arrays_to_structure(structure, _read_contact_atom_arrays(pdb_path, list(chain_ids), float(influence_radius)))
+    return structure.get_atoms()
+
 
+@disk_array_cache("contact_atoms")
+def _read_contact_atom_arrays(pdb_path: str, chain_ids: list[str], influence_radius: float) -> dict[str, NDArray]:
+    interface = pdb2sql_interface(pdb_path)
     try:
         atom_indexes = interface.get_contact_atoms(
             cutoff=influence_radius,
@@ -109,12 +222,10 @@ def get_contact_atoms(
             chain2=chain_ids[1],
         )
         pdb_rowID = atom_indexes[chain_ids[0]] + atom_indexes[chain_ids[1]]
-        _add_atom_data_to_structure(structure, interface, rowID=pdb_rowID)
+        return _read_atom_arrays(interface, rowID=pdb_rowID)
     finally:
         interface._close()  # noqa: SLF001
 
-    return structure.get_atoms()
-
 
 def get_residue_contact_pairs(
     pdb_path: str,
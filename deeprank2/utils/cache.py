@@ -0,0 +1,234 @@
+"""This module holds the caches that let queries on the same structure share the expensive per-structure calculations.
+
+Results are kept in memory per process by :func:`file_lru_cache`. Results of external tools (e.g. DSSP, freesasa, MSMS) can
+additionally be stored on disk by :func:`disk_cache`, and arrays (e.g. parsed structures) by :func:`disk_array_cache`, so
+that they are reused across runs. The disk cache is disabled unless a cache directory is set, either with
+:func:`configure_disk_cache` or with the `DEEPRANK2_CACHE_DIR` environment variable.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zipfile
+from functools import lru_cache, wraps
+from typing import TYPE_CHECKING, BinaryIO, TypeVar
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Hashable
+
+    from numpy.typing import NDArray
+
+_log = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+# number of structures for which results are kept in memory, per function and per process
+FILE_CACHE_SIZE = 4
+
+# the disk cache is configured through environment variables, such that it also applies to spawned worker processes
+CACHE_DIR_VARIABLE = "DEEPRANK2_CACHE_DIR"
+CACHE_MAX_SIZE_VARIABLE = "DEEPRANK2_CACHE_MAX_SIZE"
+DEFAULT_CACHE_MAX_SIZE = 10 * 1024**3  # 10 GiB
+# when the maximum size is exceeded, the cache is reduced to this fraction of it, so that it is only scanned once in many writes
+EVICTION_TARGET_FRACTION = 0.9
+
+# estimated total size of each cache directory: its size when last scanned plus the entries written since by this process
+_cache_sizes: dict[str, int] = {}
+
+
+def file_lru_cache(func: Callable[..., R]) -> Callable[..., R]:
+    """Memoise a function whose first argument is a file path, in memory of the current process.
+
+    The modification time of the file is part of the cache key, so results are recalculated when the file changes.
+    Any further arguments must be hashable. The cached results are shared between callers and must not be modified.
+
+    Args:
+        func: The function to memoise.
+
+    Returns:
+        The memoised function, with a `cache_clear` method to empty the cache.
+    """
+
+    # mtime is not used by the function, it is only part of the cache key
+    @lru_cache(maxsize=FILE_CACHE_SIZE)
+    def cached_func(path: str, mtime: float, *args: Hashable, **kwargs: Hashable) -> R:  # noqa: ARG001
+        return func(path, *args, **kwargs)
+
+    @wraps(func)
+    def wrapper(path: str, *args: Hashable, **kwargs: Hashable) -> R:
+        return cached_func(path, os.path.getmtime(path), *args, **kwargs)
+
+    wrapper.cache_clear = cached_func.cache_clear
+    return wrapper
+
+
+def configure_disk_cache(cache_dir: str | None, max_size: int = DEFAULT_CACHE_MAX_SIZE) -> None:
+    """Set the directory and the maximum size of the disk cache.
+
+    Args:
+        cache_dir: Directory to store the cached results in, which may be shared by multiple processes and runs.
+            If None, the disk cache is disabled.
+        max_size: Maximum total size of the cached results, in bytes. When it is exceeded, the least recently used
+            results are removed until the cache fits within 90% of it. Defaults to 10 GiB.
+    """
+    _cache_sizes.clear()
+    if cache_dir is None:
+        os.environ.pop(CACHE_DIR_VARIABLE, None)
+        return
+    if max_size <= 0:
+        msg = f"`max_size` must be positive, but was given as {max_size}"
+        raise ValueError(msg)
+    os.environ[CACHE_DIR_VARIABLE] = os.path.abspath(cache_dir)
+    os.environ[CACHE_MAX_SIZE_VARIABLE] = str(max_size)
+
+
+def _get_file_hash(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def _add_entry_size(cache_dir: str, entry_size: int, max_size: int) -> None:
+    """Add a written entry to the estimated size of the cache, and only scan the cache to evict entries when it exceeds `max_size`."""
+    cache_size = _cache_sizes.get(cache_dir)
+    if cache_size is not None:
+        cache_size += entry_size
+    # the first write of this process scans the cache as well, which also accounts for the entries written by other processes
+    if cache_size is None or cache_size > max_size:
+        cache_size = _evict(cache_dir, max_size)
+    _cache_sizes[cache_dir] = cache_size
+
+
+def _evict(cache_dir: str, max_size: int) -> int:
+    """Remove the least recently used entries if the cache exceeds `max_size`, until it fits within a fraction of `max_size`.
+
+    Returns:
+        int: The total size of the remaining entries.
+    """
+    entries = []
+    for dir_path, _, file_names in os.walk(cache_dir):
+        for file_name in file_names:
+            if file_name.endswith(_ENTRY_SUFFIXES):
+                path = os.path.join(dir_path, file_name)
+                with contextlib.suppress(FileNotFoundError):  # removed by another process
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    if total_size <= max_size:
+        return total_size
+    target_size = int(max_size * EVICTION_TARGET_FRACTION)
+    for _, size, path in sorted(entries):
+        if total_size <= target_size:
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total_size -= size
+    return total_size
+
+
+def _load_pickle(f: BinaryIO) -> object:
+    # only entries written by `disk_cache` are loaded
+    return pickle.load(f)  # noqa: S301
+
+
+def _load_arrays(f: BinaryIO) -> dict[str, NDArray]:
+    with np.load(f, allow_pickle=False) as npz_file:
+        return {key: npz_file[key] for key in npz_file.files}
+
+
+def _save_arrays(arrays: dict[str, NDArray], f: BinaryIO) -> None:
+    np.savez(f, **arrays)
+
+
+# file suffix, load and save function, and the errors raised when loading an unreadable entry, for each kind of entry
+_PICKLE_ENTRIES = (".pkl", _load_pickle, pickle.dump, (pickle.UnpicklingError, EOFError))
+_ARRAY_ENTRIES = (".npz", _load_arrays, _save_arrays, (zipfile.BadZipFile, ValueError, EOFError))
+_ENTRY_SUFFIXES = (_PICKLE_ENTRIES[0], _ARRAY_ENTRIES[0])
+
+
+def disk_cache(tool: str) -> Callable[[Callable[..., R]], Callable[..., R]]:
+    """Store the results of a function whose first argument is a file path on disk, if the disk cache is enabled.
+
+    Results are addressed by the hash of the file's content, the name of the tool and the further arguments,
+    so renamed or copied files hit the cache, while modified files do not. Any further arguments must have a stable `repr`.
+    Entries are written atomically, and the least recently used entries are removed when the cache exceeds its maximum size,
+    so the cache can safely be shared by multiple processes.
+
+    Args:
+        tool: Name of the tool that calculates the results, which is part of the cache key.
+
+    Returns:
+        Decorator for the function to cache. Its results must be picklable.
+    """
+    return _disk_cache(tool, *_PICKLE_ENTRIES)
+
+
+def disk_array_cache(tool: str) -> Callable[[Callable[..., dict[str, NDArray]]], Callable[..., dict[str, NDArray]]]:
+    """Like :func:`disk_cache`, for functions whose results are dictionaries of numpy arrays.
+
+    The arrays are stored in the binary .npz format instead of being pickled, which is compact and fast to load.
+    Entries of both kinds share the cache directory and its maximum size.
+
+    Args:
+        tool: Name of the tool that calculates the results, which is part of the cache key.
+
+    Returns:
+        Decorator for the function to cache. Its results must be dictionaries of numpy arrays that do not hold Python objects.
+    """
+    return _disk_cache(tool, *_ARRAY_ENTRIES)
+
+
+def _disk_cache(
+    tool: str,
+    suffix: str,
+    load: Callable[[BinaryIO], R],
+    save: Callable[[R, BinaryIO], None],
+    load_errors: tuple[type[Exception], ...],
+) -> Callable[[Callable[..., R]], Callable[..., R]]:
+    def decorator(func: Callable[..., R]) -> Callable[..., R]:
+        @wraps(func)
+        def wrapper(path: str, *args: Hashable, **kwargs: Hashable) -> R:
+            cache_dir = os.environ.get(CACHE_DIR_VARIABLE)
+            if not cache_dir:
+                return func(path, *args, **kwargs)
+
+            key = hashlib.sha256(f"{_get_file_hash(path)}:{tool}:{args!r}:{sorted(kwargs.items())!r}".encode()).hexdigest()
+            entry_path = os.path.join(cache_dir, key[:2], f"{key}{suffix}")
+            try:
+                with open(entry_path, "rb") as f:
+                    result = load(f)
+                os.utime(entry_path)  # mark as recently used
+            except FileNotFoundError:
+                pass
+            except load_errors as e:
+                _log.warning(f"Removing unreadable cache entry {entry_path}: {e}")
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry_path)
+            else:
+                return result
+
+            result = func(path, *args, **kwargs)
+
+            # write to a temporary file first, so that other processes never read a partially written entry
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(entry_path), suffix=".tmp", delete=False) as f:
+                save(result, f)
+                entry_size = f.tell()
+            os.replace(f.name, entry_path)
+            _add_entry_size(cache_dir, entry_size, int(os.environ.get(CACHE_MAX_SIZE_VARIABLE, DEFAULT_CACHE_MAX_SIZE)))
+
+            return result
+
+        return wrapper
+
+    return decorator
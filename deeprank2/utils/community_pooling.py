@@ -5,6 +5,7 @@ import markov_clustering as mc
 import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
+import scipy.sparse as sp
 import torch
 from torch_geometric.data import Batch, Data
 from torch_geometric.nn.pool.consecutive import consecutive_cluster
@@ -13,6 +14,18 @@ from torch_scatter import scatter_max, scatter_mean
 
 # ruff: noqa: ANN001, ANN201
 
+# graphs with at least this many nodes are clustered by MCL on a sparse matrix, smaller graphs on a dense matrix, which is faster for them
+MCL_SPARSE_MIN_NODES = 500
+
+
+def _run_mcl(graph: nx.Graph) -> list[tuple[int, ...]]:
+    """Runs MCL with default parameters on the adjacency matrix of the graph, and returns the clusters."""
+    matrix = nx.to_scipy_sparse_array(graph)
+    # markov_clustering only recognizes sparse matrices, not sparse arrays
+    matrix = sp.csr_matrix(matrix) if graph.number_of_nodes() >= MCL_SPARSE_MIN_NODES else matrix.toarray()
+    result = mc.run_mcl(matrix)
+    return mc.get_clusters(result)
+
 
 def plot_graph(graph, cluster) -> None:  # noqa:D103
     pos = nx.spring_layout(graph, iterations=200)
@@ -75,10 +88,7 @@ def community_detection_per_batch(
 
         # detect communities using MCL
         elif method == "mcl":
-            matrix = nx.to_scipy_sparse_array(subg)
-            # run MCL with default parameters
-            result = mc.run_mcl(matrix.toarray())
-            mc_clust = mc.get_clusters(result)  # get clusters
+            mc_clust = _run_mcl(subg)  # get clusters
 
             index = np.zeros(subg.number_of_nodes()).astype("int")
             for ic, c in enumerate(mc_clust):
@@ -144,13 +154,7 @@ def community_detection(
 
     # detect the communities using MCL detection
     if method == "mcl":
-        matrix = nx.to_scipy_sparse_array(g)
-
-        # run MCL with default parameters
-
-        result = mc.run_mcl(matrix.toarray())
-
-        clusters = mc.get_clusters(result)  # get clusters
+        clusters = _run_mcl(g)  # get clusters
 
         index = np.zeros(num_nodes).astype("int")
         for ic, c in enumerate(clusters):
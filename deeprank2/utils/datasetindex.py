@@ -0,0 +1,242 @@
+"""This module holds the sidecar index of the entries in a processed .HDF5 file.
+
+The index stores the entry names, the number of nodes and edges of each entry, the shapes of the features and all target
+values as compact arrays, next to the .HDF5 file. Datasets use it to select entries (by `subset` and `target_filter`)
+without opening any entry. The index is ignored when the .HDF5 file was modified after the index was built.
+"""
+
+from __future__ import annotations
+
+import logging
+import operator
+import os
+import re
+import tempfile
+from typing import TYPE_CHECKING
+
+import h5py
+import numpy as np
+
+from deeprank2.domain import edgestorage as Efeat
+from deeprank2.domain import gridstorage
+from deeprank2.domain import nodestorage as Nfeat
+from deeprank2.domain import targetstorage as targets
+from deeprank2.utils.graph import get_feature_names, read_features
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+_log = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".index.npz"
+
+# target conditions of the form "<operator><number>" are evaluated on all entries at once
+_CONDITION_PATTERN = re.compile(r"^\s*(<=|>=|==|!=|<|>)\s*([-+0-9.eE]+)\s*$")
+_CONDITION_OPERATORS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+
+class DatasetIndex:
+    """Index of the entries in a processed .HDF5 file.
+
+    Args:
+        entry_names: Names of the entries, in the order of the .HDF5 file.
+        node_counts: Number of nodes of each entry (0 for grid entries).
+        edge_counts: Number of edges of each entry, each stored once (0 for grid entries).
+        feature_shapes: Shape of each feature, keyed by `{feature_type}/{feature_name}`. For node and edge features the
+            first axis (nodes or edges) is left out.
+        target_values: Values of each target for each entry, with NaN for entries that lack the target.
+    """
+
+    def __init__(
+        self,
+        entry_names: NDArray,
+        node_counts: NDArray,
+        edge_counts: NDArray,
+        feature_shapes: dict[str, tuple[int, ...]],
+        target_values: dict[str, NDArray],
+    ):
+        self.entry_names = entry_names
+        self.node_counts = node_counts
+        self.edge_counts = edge_counts
+        self.feature_shapes = feature_shapes
+        self.target_values = target_values
+
+    def __len__(self) -> int:
+        return len(self.entry_names)
+
+    def filter_targets(self, target_filter: dict[str, str]) -> NDArray:
+        """Evaluates a target filter on all entries, with the same semantics as the `target_filter` of the datasets.
+
+        Args:
+            target_filter: Dictionary of type [target: cond].
+
+        Returns:
+            NDArray: Boolean mask of the entries that meet all conditions. Entries that lack a target are kept.
+
+        Raises:
+            ValueError: If an unsupported condition is provided.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        for target_name, target_condition in target_filter.items():
+            values = self.target_values.get(target_name)
+            if values is None or np.isnan(values).any():
+                _log.warning(f"   :Filter {target_name} not found for some entries\n   :Filter options are: {list(self.target_values)}")
+                if values is None:
+                    continue
+
+            if isinstance(target_condition, str):
+                present = ~np.isnan(values)
+                match = _CONDITION_PATTERN.match(target_condition)
+                if match:
+                    operator_string, threshold = match.groups()
+                    condition_met = _CONDITION_OPERATORS[operator_string](values, float(threshold))
+                else:
+                    condition_met = np.array([_eval_condition(target_condition, value) for value in values])
+                keep &= condition_met | ~present
+
+            elif target_condition is not None:
+                msg = "Conditions not supported"
+                raise ValueError(msg, target_condition)
+
+        return keep
+
+
+def _eval_condition(target_condition: str, target_value: float) -> bool:
+    """Evaluates a condition on a single value, as :meth:`DeeprankDataset._filter_targets` does."""
+    if np.isnan(target_value):
+        return True
+    operation = target_condition
+    for operator_string in [">", "<", "==", "<=", ">=", "!="]:
+        operation = operation.replace(operator_string, f"{target_value}" + operator_string)
+    return bool(eval(operation))  # noqa: S307, PGH001
+
+
+def get_index_path(hdf5_path: str) -> str:
+    """Gets the path of the index of an .HDF5 file."""
+    return hdf5_path + INDEX_SUFFIX
+
+
+def build_index(hdf5_path: str) -> str:
+    """Builds the index of a processed .HDF5 file and writes it next to the file.
+
+    The index must be built again after the .HDF5 file is modified, otherwise it is ignored.
+
+    Args:
+        hdf5_path: Path to the .HDF5 file.
+
+    Returns:
+        str: Path to the index file.
+    """
+    stat = os.stat(hdf5_path)
+    entry_names = []
+    node_counts = []
+    edge_counts = []
+    feature_shapes = {}
+    feature_types_done = set()
+    target_values = {}
+    with h5py.File(hdf5_path, "r") as hdf5_file:
+        for entry_idx, (entry_name, grp) in enumerate(hdf5_file.items()):
+            entry_names.append(entry_name)
+            node_counts.append(_get_count(grp, Nfeat.NODE))
+            edge_counts.append(_get_count(grp, Efeat.EDGE))
+
+            # the shapes of the features are taken from the first entry that has them
+            for feature_type in (Nfeat.NODE, Efeat.EDGE):
+                if feature_type in grp and feature_type not in feature_types_done:
+                    feature_names = get_feature_names(grp[feature_type])
+                    for feature_name, values in zip(feature_names, read_features(grp[feature_type], feature_names), strict=True):
+                        feature_shapes[f"{feature_type}/{feature_name}"] = values.shape[1:]
+                    feature_types_done.add(feature_type)
+            if gridstorage.MAPPED_FEATURES in grp:
+                for feature_name, dataset in grp[gridstorage.MAPPED_FEATURES].items():
+                    feature_shapes.setdefault(f"{gridstorage.MAPPED_FEATURES}/{feature_name}", dataset.shape)
+
+            if targets.VALUES in grp:
+                for target_name, dataset in grp[targets.VALUES].items():
+                    try:
+                        value = float(dataset[()])
+                    except (TypeError, ValueError):
+                        continue
+                    target_values.setdefault(target_name, np.full(len(hdf5_file), np.nan))[entry_idx] = value
+
+    arrays = {
+        "entry_names": np.array(entry_names, dtype=str),
+        "node_counts": np.array(node_counts, dtype=np.int64),
+        "edge_counts": np.array(edge_counts, dtype=np.int64),
+        "hdf5_mtime_ns": np.array(stat.st_mtime_ns),
+        "hdf5_size": np.array(stat.st_size),
+    }
+    arrays.update({f"shape/{name}": np.array(shape, dtype=np.int64) for name, shape in feature_shapes.items()})
+    arrays.update({f"target/{name}": values for name, values in target_values.items()})
+
+    # write to a temporary file first, so that datasets never read a partially written index
+    index_path = get_index_path(hdf5_path)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(index_path)), suffix=".tmp", delete=False) as f:
+        np.savez(f, **arrays)
+    os.replace(f.name, index_path)
+    return index_path
+
+
+def _get_count(grp: h5py.Group, feature_type: str) -> int:
+    if feature_type not in grp or len(grp[feature_type]) == 0:
+        return 0
+    first_dataset = next(iter(grp[feature_type].values()))
+    return first_dataset.shape[0] if first_dataset.ndim > 0 else 0
+
+
+def read_graph_sizes(hdf5_path: str, entry_names: list[str]) -> tuple[NDArray, NDArray]:
+    """Reads the number of nodes and edges of graph entries, from the index if it is up to date or else from the .HDF5 file.
+
+    Only the shapes of the datasets are read, not their values.
+
+    Args:
+        hdf5_path: Path to the .HDF5 file.
+        entry_names: Names of the entries.
+
+    Returns:
+        tuple[NDArray, NDArray]: Number of nodes and number of edges of each entry, with each edge counted once.
+    """
+    index = load_index(hdf5_path)
+    if index is not None:
+        positions = {entry_name: position for position, entry_name in enumerate(index.entry_names.tolist())}
+        entry_positions = [positions[entry_name] for entry_name in entry_names]
+        return index.node_counts[entry_positions], index.edge_counts[entry_positions]
+
+    with h5py.File(hdf5_path, "r") as hdf5_file:
+        node_counts = [_get_count(hdf5_file[entry_name], Nfeat.NODE) for entry_name in entry_names]
+        edge_counts = [_get_count(hdf5_file[entry_name], Efeat.EDGE) for entry_name in entry_names]
+    return np.array(node_counts, dtype=np.int64), np.array(edge_counts, dtype=np.int64)
+
+
+def load_index(hdf5_path: str) -> DatasetIndex | None:
+    """Loads the index of an .HDF5 file.
+
+    Args:
+        hdf5_path: Path to the .HDF5 file.
+
+    Returns:
+        :class:`DatasetIndex` | None: The index, or None if it does not exist or if the .HDF5 file was modified after the index was built.
+    """
+    index_path = get_index_path(hdf5_path)
+    if not os.path.isfile(index_path):
+        return None
+
+    stat = os.stat(hdf5_path)
+    with np.load(index_path, allow_pickle=False) as index_file:
+        if index_file["hdf5_mtime_ns"] != stat.st_mtime_ns or index_file["hdf5_size"] != stat.st_size:
+            _log.info(f"Ignoring the index of {hdf5_path}, because the file was modified after the index was built.")
+            return None
+        return DatasetIndex(
+            entry_names=index_file["entry_names"],
+            node_counts=index_file["node_counts"],
+            edge_counts=index_file["edge_counts"],
+            feature_shapes={key[len("shape/") :]: tuple(index_file[key].tolist()) for key in index_file.files if key.startswith("shape/")},
+            target_values={key[len("target/") :]: index_file[key] for key in index_file.files if key.startswith("target/")},
+        )
@@ -0,0 +1,159 @@
+"""This module holds the classes for feature modules that compute whole feature columns at once.
+
+Besides `add_features`, which sets the features of a :class:`Graph` node by node, a feature module can implement
+
+    get_feature_columns(pdb_path: str, graph_arrays: GraphArrays, single_amino_acid_variant: SingleResidueVariant | None) -> FeatureColumns
+
+which receives the nodes and edges of the graph as arrays (see :class:`GraphArrays`) and returns the values of each of its
+features for all nodes or edges. :meth:`deeprank2.query.Query.build` uses `get_feature_columns` when a module has it.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from deeprank2.molstruct.atom import Atom
+from deeprank2.molstruct.residue import Residue
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+    from deeprank2.molstruct.aminoacid import AminoAcid
+    from deeprank2.molstruct.atom import AtomicElement
+    from deeprank2.utils.graph import Graph
+
+
+@dataclass(kw_only=True)
+class GraphArrays:
+    """The nodes and edges of a graph, with the attributes of their residues and atoms as arrays.
+
+    Attributes that are shared by many nodes (such as the amino acid of a residue) are stored once in a list, and each
+    node refers to them by index. Use :func:`select_values` to get a feature column from such an index array.
+
+    Args:
+        node_type: "atom" or "residue".
+        edge_index: (2, E) array with the indices of the two nodes of each edge.
+        residues: The residues of the nodes, each listed once, in the order in which they first occur in the nodes.
+        node_residues: Index in `residues` of the residue of each node.
+        residue_chain_ids: Chain id of each residue.
+        residue_numbers: Number of each residue.
+        amino_acids: The amino acids of the residues, each listed once.
+        residue_amino_acids: Index in `amino_acids` of the amino acid of each residue.
+        atoms: The atoms of the nodes, or an empty list for residue nodes.
+        elements: The elements of the atoms, each listed once.
+        atom_elements: Index in `elements` of the element of each atom.
+        atom_occupancies: Occupancy of each atom.
+    """
+
+    node_type: str
+    edge_index: NDArray
+    residues: list[Residue]
+    node_residues: NDArray
+    residue_chain_ids: NDArray
+    residue_numbers: NDArray
+    amino_acids: list[AminoAcid]
+    residue_amino_acids: NDArray
+    atoms: list[Atom] = field(default_factory=list)
+    elements: list[AtomicElement] = field(default_factory=list)
+    atom_elements: NDArray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    atom_occupancies: NDArray = field(default_factory=lambda: np.zeros(0))
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> GraphArrays:
+        """Gets the arrays of the nodes and edges of a graph.
+
+        Raises:
+            TypeError: If the nodes are not all `Atom`s or all `Residue`s.
+        """
+        node_ids = graph.node_ids
+        if all(isinstance(node_id, Residue) for node_id in node_ids):
+            node_type = "residue"
+            atoms = []
+            node_residues = node_ids
+        elif all(isinstance(node_id, Atom) for node_id in node_ids):
+            node_type = "atom"
+            atoms = node_ids
+            node_residues = [atom.residue for atom in atoms]
+        else:
+            msg = f"Unexpected node types: {sorted({type(node_id).__name__ for node_id in node_ids})}"
+            raise TypeError(msg)
+
+        residues, node_residues = _index_values(node_residues)
+        amino_acids, residue_amino_acids = _index_values([residue.amino_acid for residue in residues])
+        elements, atom_elements = _index_values([atom.element for atom in atoms])
+        return cls(
+            node_type=node_type,
+            edge_index=graph.edge_index,
+            residues=residues,
+            node_residues=node_residues,
+            residue_chain_ids=np.array([residue.chain.id for residue in residues], dtype=str),
+            residue_numbers=np.array([residue.number for residue in residues], dtype=np.int64),
+            amino_acids=amino_acids,
+            residue_amino_acids=residue_amino_acids,
+            atoms=atoms,
+            elements=elements,
+            atom_elements=atom_elements,
+            atom_occupancies=np.array([atom.occupancy for atom in atoms]),
+        )
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_residues)
+
+    @property
+    def node_amino_acids(self) -> NDArray:
+        """Index in `amino_acids` of the amino acid of each node."""
+        return self.residue_amino_acids[self.node_residues]
+
+    def get_residue_mask(self, residue: Residue) -> NDArray:
+        """Boolean array that is True for the residues that are equal to `residue`."""
+        return np.array([other == residue for other in self.residues], dtype=bool)
+
+    def get_all_chains(self) -> list[str]:
+        """The chain ids of the nodes, as given by :meth:`Graph.get_all_chains`."""
+        return list({str(residue.chain).split()[1] for residue in self.residues})
+
+
+@dataclass
+class FeatureColumns:
+    """The values of features for all nodes and for all edges of a graph, with one row per node or edge."""
+
+    node_features: dict[str, NDArray] = field(default_factory=dict)
+    edge_features: dict[str, NDArray] = field(default_factory=dict)
+
+
+def select_values(values: list, indices: NDArray) -> NDArray:
+    """Gets an array of `values[index]` for each index in `indices`.
+
+    The array has the same dtype as an array made from a list of the selected values, so a column computed from
+    shared values is identical to one set node by node.
+
+    Args:
+        values: The values to select from, which can be scalars or arrays of the same shape.
+        indices: Index in `values` for each row.
+
+    Returns:
+        NDArray: The selected values, with one row per index.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    selected, inverse = np.unique(indices, return_inverse=True)
+    selected_values = np.asarray([values[index] for index in selected.tolist()])
+    return selected_values[inverse.reshape(indices.shape)]
+
+
+def add_feature_columns(graph: Graph, feature_columns: FeatureColumns) -> None:
+    """Sets the feature columns returned by a feature module on a graph."""
+    for feature_name, values in feature_columns.node_features.items():
+        graph.set_node_feature(feature_name, values)
+    for feature_name, values in feature_columns.edge_features.items():
+        graph.set_edge_feature(feature_name, values)
+
+
+def _index_values(values: list) -> tuple[list, NDArray]:
+    """Lists each distinct value once, in order of first occurrence, and gets the index in that list of each value."""
+    indices_by_value = {}
+    indices = np.array([indices_by_value.setdefault(value, len(indices_by_value)) for value in values], dtype=np.int64)
+    return list(indices_by_value), indices
@@ -2,12 +2,13 @@ from __future__ import annotations
 
 import logging
 import os
-from typing import TYPE_CHECKING
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, BinaryIO
 
 import h5py
 import numpy as np
 import pdb2sql.transform
-from scipy.spatial import distance_matrix
+from scipy.spatial import cKDTree, distance_matrix, minkowski_distance
 
 from deeprank2.domain import edgestorage as Efeat
 from deeprank2.domain import nodestorage as Nfeat
@@ -18,15 +19,147 @@ from deeprank2.molstruct.residue import Residue
 from deeprank2.utils.grid import Augmentation, Grid, GridSettings, MapMethod
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Iterator
 
     from numpy.typing import NDArray
 
 _log = logging.getLogger(__name__)
 
+# above this number of atoms, `Graph.build_graph` uses a KD-tree instead of a dense distance matrix to find neighbours
+KDTREE_MIN_ATOMS = 1000
+
+# name of the node and edge feature matrices in the consolidated hdf5 layout, and of their attributes
+FEATURE_MATRIX = Nfeat.FEATURE_MATRIX
+FEATURE_NAMES_ATTRIBUTE = "feature_names"
+FEATURE_OFFSETS_ATTRIBUTE = "feature_offsets"
+FEATURE_NDIMS_ATTRIBUTE = "feature_ndims"
+
+
+class _FeatureTable:
+    """Holds the features of the nodes or of the edges of a graph, as one array per feature with one row per node or edge.
+
+    Features can be set for a single row (via :class:`_FeatureRow`) or for all rows at once. A column is created when a
+    feature is first set, and its dtype is promoted when a value of a wider type is set, so that the column has the same
+    dtype as an array made from all values. Which rows have a value is tracked per feature.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._capacity = 0
+        self._columns: dict[str, NDArray] = {}
+        self._is_set: dict[str, NDArray] = {}
+
+    def add_rows(self, count: int) -> int:
+        """Adds empty rows and returns the index of the first one."""
+        first_row = self.size
+        self.size += count
+        if self.size > self._capacity:
+            self._capacity = max(self.size, 2 * self._capacity)
+            for name, column in self._columns.items():
+                self._columns[name] = self._resize(column)
+                self._is_set[name] = self._resize(self._is_set[name])
+        return first_row
+
+    def _resize(self, array: NDArray) -> NDArray:
+        resized = np.zeros((self._capacity, *array.shape[1:]), dtype=array.dtype)
+        resized[: len(array)] = array[: self._capacity]
+        return resized
+
+    def _get_column(self, name: str, value: NDArray) -> NDArray:
+        """Gets the column of a feature, created or promoted such that it can hold `value`."""
+        column = self._columns.get(name)
+        if column is None:
+            column = np.zeros((self._capacity, *value.shape), dtype=value.dtype)
+            self._is_set[name] = np.zeros(self._capacity, dtype=bool)
+        else:
+            if column.shape[1:] != value.shape:
+                msg = f"Feature {name} has values of shape {column.shape[1:]}, but was given a value of shape {value.shape}"
+                raise ValueError(msg)
+            dtype = np.result_type(column.dtype, value.dtype)
+            if dtype != column.dtype:
+                column = column.astype(dtype)
+        self._columns[name] = column
+        return column
+
+    def set(self, name: str, row: int, value: float | NDArray) -> None:
+        value = np.asarray(value)
+        self._get_column(name, value)[row] = value
+        self._is_set[name][row] = True
+
+    def unset(self, name: str, row: int) -> None:
+        if not self.is_set(name, row):
+            raise KeyError(name)
+        self._is_set[name][row] = False
+
+    def is_set(self, name: str, row: int) -> bool:
+        return name in self._is_set and bool(self._is_set[name][row])
+
+    def get(self, name: str, row: int) -> float | NDArray:
+        if not self.is_set(name, row):
+            raise KeyError(name)
+        return self._columns[name][row]
+
+    def names(self, row: int) -> list[str]:
+        return [name for name, is_set in self._is_set.items() if is_set[row]]
+
+    def set_column(self, name: str, values: NDArray) -> None:
+        values = np.asarray(values)
+        if len(values) != self.size:
+            msg = f"Expected {self.size} values for feature {name}, but got {len(values)}"
+            raise ValueError(msg)
+        column = np.zeros((self._capacity, *values.shape[1:]), dtype=values.dtype)
+        column[: self.size] = values
+        self._columns[name] = column
+        self._is_set[name] = np.zeros(self._capacity, dtype=bool)
+        self._is_set[name][: self.size] = True
+
+    def get_column(self, name: str) -> NDArray:
+        """Gets the values of a feature for all rows, which must all have a value."""
+        if name not in self._columns or not self._is_set[name][: self.size].all():
+            msg = f"Feature {name} is not set for all rows"
+            raise KeyError(msg)
+        return self._columns[name][: self.size]
+
+    def has_nan(self) -> bool:
+        return any(np.any(np.isnan(column[: self.size][self._is_set[name][: self.size]])) for name, column in self._columns.items())
+
+    def complete_names(self) -> list[str]:
+        """Names of the features that are set for all rows."""
+        return [name for name, is_set in self._is_set.items() if is_set[: self.size].all()]
+
+
+class _FeatureRow(MutableMapping):
+    """The features of a single node or edge of a graph, which are stored in the graph's :class:`_FeatureTable`."""
+
+    def __init__(self, table: _FeatureTable, row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, name: str) -> float | NDArray:
+        return self._table.get(name, self._row)
+
+    def __setitem__(self, name: str, value: float | NDArray) -> None:
+        self._table.set(name, self._row, value)
+
+    def __delitem__(self, name: str) -> None:
+        self._table.unset(name, self._row)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.names(self._row))
+
+    def __len__(self) -> int:
+        return len(self._table.names(self._row))
+
+    def __contains__(self, name: object) -> bool:
+        return self._table.is_set(name, self._row)
+
 
 class Edge:
-    """Graph edge."""
+    """Graph edge.
+
+    Until the edge is added to a graph, its features are kept in a dictionary. Afterwards, `features` gives access to
+    the edge's row in the feature arrays of the graph.
+    """
 
     def __init__(self, id_: Contact):
         self.id = id_
@@ -51,7 +184,11 @@ class Edge:
 
 
 class Node:
-    """Graph node."""
+    """Graph node.
+
+    Until the node is added to a graph, its features are kept in a dictionary. Afterwards, `features` gives access to
+    the node's row in the feature arrays of the graph.
+    """
 
     def __init__(self, id_: Atom | Residue):
         if isinstance(id_, Atom):
@@ -92,13 +229,29 @@ class Node:
 
 
 class Graph:
-    """Graph."""
+    """Graph.
+
+    The graph is stored as arrays: a table of node ids (`Atom`s or `Residue`s), the indices of the two nodes of each edge,
+    and one array per node or edge feature, with one row per node or edge. Feature modules can read and write whole
+    feature arrays with :meth:`get_node_feature`, :meth:`set_node_feature`, :meth:`get_edge_feature` and :meth:`set_edge_feature`.
+    The :class:`Node` and :class:`Edge` objects of `nodes`, `edges`, `get_node` and `get_edge` are views on these arrays.
+    """
 
     def __init__(self, id_: str):
         self.id = id_
 
-        self._nodes = {}
-        self._edges = {}
+        self._node_ids: list[Atom | Residue] = []
+        self._node_features = _FeatureTable()
+        self._node_views: list[Node | None] = []
+        self._node_rows: dict[Atom | Residue, int] | None = None  # built when nodes are looked up by id
+
+        self._edge_ids: list[Contact] = []
+        self._edge_features = _FeatureTable()
+        self._edge_views: list[Edge | None] = []
+        self._edge_rows: dict[Contact, int] | None = None  # built when edges are looked up by id
+        # the node rows of each edge (None until both nodes are in the graph), and whether they are in the reverse order of the edge's id
+        self._edge_node_rows: list[tuple[int, int] | None] = []
+        self._edge_flipped: list[bool] = []
 
         # targets are optional and may be set later
         self.targets = {}
@@ -106,43 +259,152 @@ class Graph:
         # the center only needs to be set when this graph should be mapped to a grid.
         self.center = np.array((0.0, 0.0, 0.0))
 
+    def _get_node_rows(self) -> dict[Atom | Residue, int]:
+        if self._node_rows is None:
+            self._node_rows = {node_id: row for row, node_id in enumerate(self._node_ids)}
+        return self._node_rows
+
+    def _get_edge_rows(self) -> dict[Contact, int]:
+        if self._edge_rows is None:
+            self._edge_rows = {}
+            for row, edge_id in enumerate(self._edge_ids):
+                self._edge_rows.setdefault(edge_id, row)
+        return self._edge_rows
+
     def add_node(self, node: Node) -> None:
-        self._nodes[node.id] = node
+        """Adds a node, or replaces the node with the same id, and moves its features into the graph."""
+        features = dict(node.features)
+        node_rows = self._get_node_rows()
+        row = node_rows.get(node.id)
+        if row is None:
+            row = self._node_features.add_rows(1)
+            node_rows[node.id] = row
+            self._node_ids.append(node.id)
+            self._node_views.append(None)
+        else:
+            self._node_ids[row] = node.id
+            for feature_name in self._node_features.names(row):
+                self._node_features.unset(feature_name, row)
+
+        for feature_name, feature_value in features.items():
+            self._node_features.set(feature_name, row, feature_value)
+        node.features = _FeatureRow(self._node_features, row)
+        self._node_views[row] = node
 
     def get_node(self, id_: Atom | Residue) -> Node:
-        return self._nodes[id_]
+        return self._get_node_view(self._get_node_rows()[id_])
+
+    def _get_node_view(self, row: int) -> Node:
+        if self._node_views[row] is None:
+            node = Node(self._node_ids[row])
+            node.features = _FeatureRow(self._node_features, row)
+            self._node_views[row] = node
+        return self._node_views[row]
 
     def add_edge(self, edge: Edge) -> None:
-        self._edges[edge.id] = edge
+        """Adds an edge, or replaces the edge between the same nodes, and moves its features into the graph."""
+        features = dict(edge.features)
+        edge_rows = self._get_edge_rows()
+        row = edge_rows.get(edge.id)
+        if row is None:
+            row = self._edge_features.add_rows(1)
+            edge_rows[edge.id] = row
+            self._edge_ids.append(edge.id)
+            self._edge_views.append(None)
+            self._edge_node_rows.append(None)
+            self._edge_flipped.append(False)
+        else:
+            # the nodes of the edge keep the order in which the edge was first added
+            self._edge_flipped[row] = self._edge_flipped[row] != (edge.id.item1 != self._edge_ids[row].item1)
+            self._edge_ids[row] = edge.id
+            for feature_name in self._edge_features.names(row):
+                self._edge_features.unset(feature_name, row)
+
+        for feature_name, feature_value in features.items():
+            self._edge_features.set(feature_name, row, feature_value)
+        edge.features = _FeatureRow(self._edge_features, row)
+        self._edge_views[row] = edge
 
     def get_edge(self, id_: Contact) -> Edge:
-        return self._edges[id_]
+        return self._get_edge_view(self._get_edge_rows()[id_])
+
+    def _get_edge_view(self, row: int) -> Edge:
+        if self._edge_views[row] is None:
+            edge = Edge(self._edge_ids[row])
+            edge.features = _FeatureRow(self._edge_features, row)
+            self._edge_views[row] = edge
+        return self._edge_views[row]
 
     @property
     def nodes(self) -> list[Node]:
-        return list(self._nodes.values())
+        return [self._get_node_view(row) for row in range(len(self._node_ids))]
 
     @property
     def edges(self) -> list[Node]:
-        return list(self._edges.values())
+        return [self._get_edge_view(row) for row in range(len(self._edge_ids))]
+
+    @property
+    def node_ids(self) -> list[Atom | Residue]:
+        """The `Atom`s or `Residue`s of the nodes, in the order of the rows of the node features."""
+        return list(self._node_ids)
+
+    @property
+    def edge_ids(self) -> list[Contact]:
+        """The contacts of the edges, in the order of the rows of the edge features."""
+        return list(self._edge_ids)
+
+    @property
+    def edge_index(self) -> NDArray:
+        """(2, E) array with the indices of the two nodes of each edge."""
+        node_rows = None
+        for row, edge_node_rows in enumerate(self._edge_node_rows):
+            if edge_node_rows is None:
+                node_rows = node_rows or self._get_node_rows()
+                edge_id = self._edge_ids[row]
+                id_node_rows = (node_rows[edge_id.item1], node_rows[edge_id.item2])
+                self._edge_node_rows[row] = id_node_rows[::-1] if self._edge_flipped[row] else id_node_rows
+        return np.array(self._edge_node_rows, dtype=np.int64).reshape(-1, 2).T
+
+    @property
+    def node_feature_names(self) -> list[str]:
+        """Names of the features that are set for all nodes."""
+        return self._node_features.complete_names()
+
+    @property
+    def edge_feature_names(self) -> list[str]:
+        """Names of the features that are set for all edges."""
+        return self._edge_features.complete_names()
+
+    def get_node_feature(self, feature_name: str) -> NDArray:
+        """Gets the values of a feature for all nodes, as an array with one row per node."""
+        return self._node_features.get_column(feature_name)
+
+    def set_node_feature(self, feature_name: str, values: NDArray) -> None:
+        """Sets the values of a feature for all nodes, from an array with one row per node."""
+        self._node_features.set_column(feature_name, values)
+
+    def get_edge_feature(self, feature_name: str) -> NDArray:
+        """Gets the values of a feature for all edges, as an array with one row per edge."""
+        return self._edge_features.get_column(feature_name)
+
+    def set_edge_feature(self, feature_name: str, values: NDArray) -> None:
+        """Sets the values of a feature for all edges, from an array with one row per edge."""
+        self._edge_features.set_column(feature_name, values)
 
     def has_nan(self) -> bool:
         """Whether there are any NaN values in the graph's features."""
-        for node in self._nodes.values():
-            if node.has_nan():
-                return True
-        return any(edge.has_nan() for edge in self._edges.values())
+        return self._node_features.has_nan() or self._edge_features.has_nan()
 
     def _map_point_features(
         self,
         grid: Grid,
         method: MapMethod,
-        feature_name: str,
-        points: list[NDArray],
-        values: list[float | NDArray],
+        points: NDArray,
+        feature_values: dict[str, NDArray],
         augmentation: Augmentation | None = None,
     ) -> None:
-        points = np.stack(points, axis=0)
+        if len(points) == 0:
+            return
 
         if augmentation is not None:
             points = pdb2sql.transform.rot_xyz_around_axis(
@@ -152,11 +414,7 @@ class Graph:
                 self.center,
             )
 
-        for point_index in range(points.shape[0]):
-            position = points[point_index]
-            value = values[point_index]
-
-            grid.map_feature(position, feature_name, value, method)
+        grid.map_features(points, feature_values, method)
 
     def map_to_grid(
         self,
@@ -164,99 +422,56 @@ class Graph:
         method: MapMethod,
         augmentation: Augmentation | None = None,
     ) -> None:
-        # order edge features by xyz point
-        points = []
-        feature_values = {}
-        for edge in self._edges.values():
-            points += [edge.position1, edge.position2]
-
-            for feature_name, feature_value in edge.features.items():
-                feature_values[feature_name] = feature_values.get(feature_name, []) + [  # noqa: RUF005
-                    feature_value,
-                    feature_value,
-                ]
-
-        # map edge features to grid
-        for feature_name, values in feature_values.items():
-            self._map_point_features(
-                grid,
-                method,
-                feature_name,
-                points,
-                values,
-                augmentation,
-            )
+        node_positions = np.array([node_id.position for node_id in self._node_ids]).reshape(-1, 3)
 
-        # order node features by xyz point
-        points = []
-        feature_values = {}
-        for node in self._nodes.values():
-            points.append(node.position)
+        # order edge features by xyz point: the positions of the two nodes of each edge, in the order of the edge's id
+        if len(self._edge_ids) > 0:
+            edge_node_rows = self.edge_index.T
+            flipped = np.array(self._edge_flipped)
+            edge_node_rows[flipped] = edge_node_rows[flipped, ::-1]
+            points = node_positions[edge_node_rows].reshape(-1, 3)
+            feature_values = {name: np.repeat(self.get_edge_feature(name), 2, axis=0) for name in self.edge_feature_names}
 
-            for feature_name, feature_value in node.features.items():
-                feature_values[feature_name] = feature_values.get(feature_name, []) + [feature_value]  # noqa: RUF005
+            # map edge features to grid
+            self._map_point_features(grid, method, points, feature_values, augmentation)
 
         # map node features to grid
-        for feature_name, values in feature_values.items():
-            self._map_point_features(
-                grid,
-                method,
-                feature_name,
-                points,
-                values,
-                augmentation,
-            )
+        feature_values = {name: self.get_node_feature(name) for name in self.node_feature_names}
+        self._map_point_features(grid, method, node_positions, feature_values, augmentation)
+
+    def write_to_hdf5(self, hdf5_path: str | BinaryIO, consolidate_features: bool = False) -> None:
+        """Write a featured graph to an hdf5 file, according to deeprank standards.
 
-    def write_to_hdf5(self, hdf5_path: str) -> None:
-        """Write a featured graph to an hdf5 file, according to deeprank standards."""
+        Args:
+            hdf5_path: Path to the hdf5 file, or an open binary file-like object.
+            consolidate_features: If True, all node features and all edge features are stored as a single matrix each
+                (see :func:`write_features`), instead of as one dataset per feature. Defaults to False.
+        """
         with h5py.File(hdf5_path, "a") as hdf5_file:
             # create groups to hold data
             graph_group = hdf5_file.require_group(self.id)
             node_features_group = graph_group.create_group(Nfeat.NODE)
             edge_feature_group = graph_group.create_group(Efeat.EDGE)
 
-            # store node names and chain_ids
-            node_names = np.array([str(key) for key in self._nodes]).astype("S")
-            node_features_group.create_dataset(Nfeat.NAME, data=node_names)
-            chain_ids = np.array([str(key).split()[1] for key in self._nodes]).astype("S")
+            # store node names and chain_ids, with every node id converted to a string once
+            node_names = [str(node_id) for node_id in self._node_ids]
+            node_features_group.create_dataset(Nfeat.NAME, data=np.array(node_names).astype("S"))
+            chain_ids = np.array([node_name.split()[1] for node_name in node_names]).astype("S")
             node_features_group.create_dataset(Nfeat.CHAINID, data=chain_ids)
 
-            # store node features
-            node_key_list = list(self._nodes.keys())
-            first_node_data = next(iter(self._nodes.values())).features
-            node_feature_names = list(first_node_data.keys())
-            for node_feature_name in node_feature_names:
-                node_feature_data = [node.features[node_feature_name] for node in self._nodes.values()]
-
-                node_features_group.create_dataset(node_feature_name, data=node_feature_data)
-
-            # identify edges
-            edge_indices = []
-            edge_names = []
-
-            first_edge_data = next(iter(self._edges.values())).features
-            edge_feature_names = list(first_edge_data.keys())
-
-            edge_feature_data = {name: [] for name in edge_feature_names}
-
-            for edge_id, edge in self._edges.items():
-                id1, id2 = edge_id
-                node_index1 = node_key_list.index(id1)
-                node_index2 = node_key_list.index(id2)
-
-                edge_indices.append((node_index1, node_index2))
-                edge_names.append(f"{id1}-{id2}")
-
-                for edge_feature_name in edge_feature_names:
-                    edge_feature_data[edge_feature_name].append(edge.features[edge_feature_name])
+            # store node features: those of the first node, which all nodes must have
+            node_feature_data = {name: self.get_node_feature(name) for name in self._node_features.names(0)}
+            write_features(node_features_group, node_feature_data, consolidate_features)
 
             # store edge names and indices
-            edge_feature_group.create_dataset(Efeat.NAME, data=np.array(edge_names).astype("S"))
+            edge_indices = self.edge_index.T
+            edge_names = np.array([f"{node_names[index1]}-{node_names[index2]}" for index1, index2 in edge_indices.tolist()]).astype("S")
+            edge_feature_group.create_dataset(Efeat.NAME, data=edge_names)
             edge_feature_group.create_dataset(Efeat.INDEX, data=edge_indices)
 
             # store edge features
-            for edge_feature_name in edge_feature_names:
-                edge_feature_group.create_dataset(edge_feature_name, data=edge_feature_data[edge_feature_name])
+            edge_feature_data = {name: self.get_edge_feature(name) for name in self._edge_features.names(0)}
+            write_features(edge_feature_group, edge_feature_data, consolidate_features)
 
             # store target values
             score_group = graph_group.create_group(targets.VALUES)
@@ -264,10 +479,11 @@ class Graph:
                 score_group.create_dataset(target_name, data=target_data)
 
     @staticmethod
-    def _find_unused_augmentation_name(unaugmented_id: str, hdf5_path: str) -> str:
+    def _find_unused_augmentation_name(unaugmented_id: str, hdf5_path: str | BinaryIO) -> str:
         prefix = f"{unaugmented_id}_"
 
-        if os.path.isfile(hdf5_path):
+        entry_names_taken = []
+        if not isinstance(hdf5_path, str) or os.path.isfile(hdf5_path):
             with h5py.File(hdf5_path, "r") as hdf5_file:
                 entry_names_taken = [entry_name for entry_name in hdf5_file if entry_name.startswith(prefix)]
 
@@ -281,11 +497,11 @@ class Graph:
 
     def write_as_grid_to_hdf5(
         self,
-        hdf5_path: str,
+        hdf5_path: str | BinaryIO,
         settings: GridSettings,
         method: MapMethod,
         augmentation: Augmentation | None = None,
-    ) -> str:
+    ) -> str | BinaryIO:
         id_ = self.id
         if augmentation is not None:
             id_ = self._find_unused_augmentation_name(id_, hdf5_path)
@@ -309,10 +525,10 @@ class Graph:
         return hdf5_path
 
     def get_all_chains(self) -> list[str]:
-        if isinstance(self.nodes[0].id, Residue):
-            chains = {str(res.chain).split()[1] for res in [node.id for node in self.nodes]}
-        elif isinstance(self.nodes[0].id, Atom):
-            chains = {str(res.chain).split()[1] for res in [node.id.residue for node in self.nodes]}
+        if isinstance(self._node_ids[0], Residue):
+            chains = {str(res.chain).split()[1] for res in self._node_ids}
+        elif isinstance(self._node_ids[0], Atom):
+            chains = {str(atom.residue.chain).split()[1] for atom in self._node_ids}
         else:
             return None
         return list(chains)
@@ -322,6 +538,7 @@ class Graph:
         nodes: list[Atom] | list[Residue],
         graph_id: str,
         max_edge_length: float,
+        kdtree_min_atoms: int | None = KDTREE_MIN_ATOMS,
     ) -> Graph:
         """Builds a graph.
 
@@ -329,6 +546,9 @@ class Graph:
             nodes: List of `Atom`s or `Residue`s to include in graph. All nodes must be of same type.
             graph_id: Human readable identifier for graph.
             max_edge_length: Maximum distance between two nodes to connect them with an edge.
+            kdtree_min_atoms: Minimum number of atoms from which neighbouring atoms are found using a KD-tree, rather than a dense distance matrix.
+                Both give identical edges, but the KD-tree only holds the pairs within `max_edge_length` in memory.
+                If None, the dense distance matrix is always used. Defaults to `KDTREE_MIN_ATOMS`.
 
         Returns:
             Graph: Containing nodes (with positions) and edges.
@@ -356,26 +576,150 @@ class Graph:
         positions = np.empty((len(atoms), 3))
         for atom_index, atom in enumerate(atoms):
             positions[atom_index] = atom.position
-        neighbours = max_edge_length > distance_matrix(positions, positions, p=2)
 
-        index_pairs = np.transpose(np.nonzero(neighbours))  # atom pairs
+        if kdtree_min_atoms is not None and len(atoms) >= kdtree_min_atoms:
+            index_pairs = _get_neighbour_pairs_kdtree(positions, max_edge_length)  # atom pairs
+        else:
+            neighbours = max_edge_length > distance_matrix(positions, positions, p=2)
+            index_pairs = np.transpose(np.nonzero(neighbours))  # atom pairs
         if NodeContact == ResidueContact:
             index_pairs = np.unique(atoms_residues[index_pairs], axis=0)  # residue pairs
+        index_pairs = index_pairs[index_pairs[:, 0] != index_pairs[:, 1]].reshape(-1, 2)
 
         graph = Graph(graph_id)
+        graph._add_pairs(nodes, index_pairs, NodeContact)  # noqa: SLF001
+        return graph
 
-        for index1, index2 in index_pairs:
-            if index1 != index2:
-                node1 = Node(nodes[index1])
-                node2 = Node(nodes[index2])
-                contact = NodeContact(node1.id, node2.id)
-
-                node1.features[Nfeat.POSITION] = node1.id.position
-                node2.features[Nfeat.POSITION] = node2.id.position
-
-                # The same node will be added multiple times, but the Graph class fixes this.
-                graph.add_node(node1)
-                graph.add_node(node2)
-                graph.add_edge(Edge(contact))
+    def _add_pairs(self, nodes: list[Atom] | list[Residue], index_pairs: NDArray, NodeContact: type[Contact]) -> None:
+        """Adds the nodes of pairs of indices in `nodes` (with their positions), and an edge for each pair.
 
-        return graph
+        The nodes and edges are in the same order, and the edges have the same ids, as when every pair would be added
+        one by one: the nodes in order of their first pair, the edges in order of their first pair with the nodes in
+        the order of that pair, and the ids of the edges from their last pair.
+        """
+        # nodes, in order of first occurrence
+        node_indices = index_pairs.ravel()
+        _, first_occurrences = np.unique(node_indices, return_index=True)
+        node_indices = node_indices[np.sort(first_occurrences)]
+        node_rows = np.zeros(len(nodes), dtype=np.int64)
+        node_rows[node_indices] = np.arange(len(node_indices))
+
+        # edges, in order of first occurrence of either direction
+        unordered_pairs = np.sort(index_pairs, axis=1)
+        _, first_occurrences, inverse = np.unique(unordered_pairs, axis=0, return_index=True, return_inverse=True)
+        last_occurrences = np.zeros(len(first_occurrences), dtype=np.int64)
+        last_occurrences[inverse.ravel()] = np.arange(len(index_pairs))
+        edge_order = np.argsort(first_occurrences)
+        first_pairs = index_pairs[first_occurrences[edge_order]]
+        last_pairs = index_pairs[last_occurrences[edge_order]]
+
+        self._node_ids = [nodes[index] for index in node_indices.tolist()]
+        self._node_views = [None] * len(self._node_ids)
+        self._node_rows = None
+        self._node_features.add_rows(len(self._node_ids))
+        self.set_node_feature(Nfeat.POSITION, np.array([node_id.position for node_id in self._node_ids]).reshape(-1, 3))
+
+        self._edge_ids = [NodeContact(nodes[index1], nodes[index2]) for index1, index2 in last_pairs.tolist()]
+        self._edge_views = [None] * len(self._edge_ids)
+        self._edge_rows = None
+        self._edge_node_rows = [tuple(rows) for rows in node_rows[first_pairs].tolist()]
+        self._edge_flipped = (first_pairs[:, 0] != last_pairs[:, 0]).tolist()
+        self._edge_features.add_rows(len(self._edge_ids))
+
+
+def write_features(features_group: h5py.Group, feature_data: dict[str, list], consolidate: bool = False) -> None:
+    """Write node or edge features to a group of an hdf5 file.
+
+    By default, every feature is stored as a separate dataset. In the consolidated layout, the features that are not
+    metafeatures (i.e. whose name does not start with "_") are stored as the columns of a single matrix, named
+    `FEATURE_MATRIX`. The names of the features, the column at which each feature starts and the number of dimensions
+    of each feature are stored in its attributes. Use :func:`get_feature_names` and :func:`read_features` to read either layout.
+
+    Args:
+        features_group: Group to write the features to, e.g. the node features group of an entry.
+        feature_data: Values of each feature, with one value per node or edge.
+        consolidate: Whether to use the consolidated layout. Defaults to False.
+    """
+    matrix_features = {}
+    # sorted like the names of separate datasets, such that both layouts list the features in the same order
+    for feature_name, data in sorted(feature_data.items()):
+        if consolidate and feature_name[0] != "_":
+            matrix_features[feature_name] = np.asarray(data, dtype=np.float64)
+        else:
+            features_group.create_dataset(feature_name, data=data)
+
+    if len(matrix_features) > 0:
+        columns = [values.reshape(len(values), -1) for values in matrix_features.values()]
+        matrix = features_group.create_dataset(FEATURE_MATRIX, data=np.hstack(columns))
+        matrix.attrs[FEATURE_NAMES_ATTRIBUTE] = np.array(list(matrix_features), dtype=h5py.string_dtype())
+        matrix.attrs[FEATURE_OFFSETS_ATTRIBUTE] = np.cumsum([0] + [column.shape[1] for column in columns])
+        matrix.attrs[FEATURE_NDIMS_ATTRIBUTE] = [values.ndim for values in matrix_features.values()]
+
+
+def get_feature_names(features_group: h5py.Group) -> list[str]:
+    """Get the names of the features stored in a group of an hdf5 file, in either layout (see :func:`write_features`)."""
+    feature_names = [name for name in features_group if name != FEATURE_MATRIX]
+    if FEATURE_MATRIX in features_group:
+        feature_names += features_group[FEATURE_MATRIX].attrs[FEATURE_NAMES_ATTRIBUTE].tolist()
+    return sorted(feature_names)
+
+
+def read_features(features_group: h5py.Group, feature_names: list[str]) -> list[NDArray]:
+    """Read features from a group of an hdf5 file, in either layout (see :func:`write_features`).
+
+    The consolidated matrix is read at most once, however many of its features are requested.
+
+    Args:
+        features_group: Group to read the features from, e.g. the node features group of an entry.
+        feature_names: Names of the features to read.
+
+    Returns:
+        list[NDArray]: Values of each feature, with the same shape as they were written in either layout.
+    """
+    feature_values = []
+    matrix = None
+    for feature_name in feature_names:
+        if feature_name in features_group:
+            feature_values.append(features_group[feature_name][()])
+            continue
+
+        if matrix is None:
+            if FEATURE_MATRIX not in features_group:
+                msg = f"Feature {feature_name} not found in {features_group.name}"
+                raise KeyError(msg)
+            matrix_dataset = features_group[FEATURE_MATRIX]
+            matrix = matrix_dataset[()]
+            matrix_names = matrix_dataset.attrs[FEATURE_NAMES_ATTRIBUTE].tolist()
+            offsets = matrix_dataset.attrs[FEATURE_OFFSETS_ATTRIBUTE]
+            ndims = matrix_dataset.attrs[FEATURE_NDIMS_ATTRIBUTE]
+            columns = {name: (offsets[idx], offsets[idx + 1], ndims[idx]) for idx, name in enumerate(matrix_names)}
+
+        if feature_name not in columns:
+            msg = f"Feature {feature_name} not found in {features_group.name}"
+            raise KeyError(msg)
+        start, end, ndim = columns[feature_name]
+        feature_values.append(matrix[:, start] if ndim == 1 else matrix[:, start:end])
+    return feature_values
+
+
+def _get_neighbour_pairs_kdtree(positions: NDArray, max_edge_length: float) -> NDArray:
+    """Finds all pairs of positions closer than `max_edge_length`, without building a dense distance matrix.
+
+    The pairs are returned in both directions and in the same (row-major) order as
+    `np.transpose(np.nonzero(max_edge_length > distance_matrix(positions, positions)))`, excluding self-pairs.
+
+    Args:
+        positions: (N, 3) array of xyz positions.
+        max_edge_length: Maximum distance between two positions to pair them.
+
+    Returns:
+        NDArray: (M, 2) array of index pairs.
+    """
+    # the tree search radius is widened slightly, so that the exact cutoff is decided by the same distance calculation as `distance_matrix`
+    candidate_pairs = cKDTree(positions).query_pairs(max_edge_length * (1.0 + 1e-6), p=2, output_type="ndarray")
+    distances = minkowski_distance(positions[candidate_pairs[:, 0]], positions[candidate_pairs[:, 1]], p=2)
+    pairs = candidate_pairs[max_edge_length > distances]
+
+    pairs = np.concatenate((pairs, pairs[:, ::-1]))
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order]
@@ -2,14 +2,13 @@
 
 from __future__ import annotations
 
-import itertools
 import logging
 from enum import Enum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, BinaryIO
 
 import h5py
 import numpy as np
-from scipy.interpolate import BSpline
+from scipy.sparse import csr_matrix
 
 from deeprank2.domain import gridstorage
 
@@ -19,6 +18,10 @@ if TYPE_CHECKING:
 _log = logging.getLogger(__name__)
 
 
+# number of points for which mapping weights are calculated at once, which bounds the memory use of the mapping
+MAPPING_BATCH_SIZE = 256
+
+
 class MapMethod(Enum):
     """This holds the value of either one of 4 grid mapping methods.
 
@@ -161,84 +164,141 @@ class Grid:
         else:
             self._features[feature_name] += data
 
-    def _get_mapped_feature_gaussian(
-        self,
-        position: NDArray,
-        value: float,
-    ) -> NDArray:
+    def _get_mapping_weights_gaussian(self, positions: NDArray) -> NDArray:
         beta = 1.0
 
-        fx, fy, fz = position
-        distances = np.sqrt((self.xgrid - fx) ** 2 + (self.ygrid - fy) ** 2 + (self.zgrid - fz) ** 2)
+        distances = self._get_distances(positions)
 
-        return value * np.exp(-beta * distances)
+        return np.exp(-beta * distances)
 
-    def _get_mapped_feature_fast_gaussian(self, position: NDArray, value: float) -> NDArray:
+    def _get_mapping_weights_fast_gaussian(self, positions: NDArray) -> csr_matrix:
         beta = 1.0
         cutoff = 5.0 * beta
 
-        fx, fy, fz = position
-        distances = np.sqrt((self.xgrid - fx) ** 2 + (self.ygrid - fy) ** 2 + (self.zgrid - fz) ** 2)
-
-        data = np.zeros(distances.shape)
-
-        data[distances < cutoff] = value * np.exp(-beta * distances[distances < cutoff])
-
-        return data
-
-    def _get_mapped_feature_bsp_line(
-        self,
-        position: NDArray,
-        value: float,
-    ) -> NDArray:
-        order = 4
+        # only the grid points in the box around the cutoff sphere are evaluated
+        indices_x, inside_x = self._get_stencil_indices(positions[:, 0], 0, cutoff)
+        indices_y, inside_y = self._get_stencil_indices(positions[:, 1], 1, cutoff)
+        indices_z, inside_z = self._get_stencil_indices(positions[:, 2], 2, cutoff)
 
-        fx, fy, fz = position
-        bsp_data = (
-            BSpline((self.xgrid - fx) / self._settings.resolutions[0], order)
-            * BSpline((self.ygrid - fy) / self._settings.resolutions[1], order)
-            * BSpline((self.zgrid - fz) / self._settings.resolutions[2], order)
+        distances = np.sqrt(
+            (self.xs[indices_x][:, :, np.newaxis, np.newaxis] - positions[:, 0, np.newaxis, np.newaxis, np.newaxis]) ** 2
+            + (self.ys[indices_y][:, np.newaxis, :, np.newaxis] - positions[:, 1, np.newaxis, np.newaxis, np.newaxis]) ** 2
+            + (self.zs[indices_z][:, np.newaxis, np.newaxis, :] - positions[:, 2, np.newaxis, np.newaxis, np.newaxis]) ** 2,
         )
+        close = (distances < cutoff) & _outer_and(inside_x, inside_y, inside_z)
 
-        return value * bsp_data
+        weights = np.zeros(distances.shape)
+        weights[close] = np.exp(-beta * distances[close])
 
-    def _get_mapped_feature_nearest_neighbour(
-        self,
-        position: NDArray,
-        value: float,
-    ) -> NDArray:
-        fx, _, _ = position
-        distances_x = np.abs(self.xs - fx)
-        distances_y = np.abs(self.ys - fx)
-        distances_z = np.abs(self.zs - fx)
+        return self._get_sparse_weights(indices_x, indices_y, indices_z, weights)
 
-        indices_x = np.argsort(distances_x)[:2]
-        indices_y = np.argsort(distances_y)[:2]
-        indices_z = np.argsort(distances_z)[:2]
+    def _get_mapping_weights_bsp_line(self, positions: NDArray) -> csr_matrix:
+        resolutions = self._settings.resolutions
+        support = 2.0  # in units of the grid resolution
 
-        sorted_x = distances_x[indices_x]
-        weights_x = sorted_x / np.sum(sorted_x)
+        # only the grid points within the support of the spline are evaluated
+        indices_x, inside_x = self._get_stencil_indices(positions[:, 0], 0, support * resolutions[0])
+        indices_y, inside_y = self._get_stencil_indices(positions[:, 1], 1, support * resolutions[1])
+        indices_z, inside_z = self._get_stencil_indices(positions[:, 2], 2, support * resolutions[2])
 
-        sorted_y = distances_y[indices_y]
-        weights_y = sorted_y / np.sum(sorted_y)
+        weights_x = _cubic_bspline((self.xs[indices_x] - positions[:, 0:1]) / resolutions[0]) * inside_x
+        weights_y = _cubic_bspline((self.ys[indices_y] - positions[:, 1:2]) / resolutions[1]) * inside_y
+        weights_z = _cubic_bspline((self.zs[indices_z] - positions[:, 2:3]) / resolutions[2]) * inside_z
 
-        sorted_z = distances_z[indices_z]
-        weights_z = sorted_z / np.sum(sorted_z)
+        weights = weights_x[:, :, np.newaxis, np.newaxis] * weights_y[:, np.newaxis, :, np.newaxis] * weights_z[:, np.newaxis, np.newaxis, :]
+        return self._get_sparse_weights(indices_x, indices_y, indices_z, weights)
 
-        indices = [indices_x, indices_y, indices_z]
-        points = list(itertools.product(*indices))
+    def _get_stencil_indices(self, coordinates: NDArray, axis: int, half_width: float) -> tuple[NDArray, NDArray]:
+        """Find the indices of the grid lines along an axis that lie within `half_width` of each of the given coordinates.
 
-        weight_products = list(itertools.product(weights_x, weights_y, weights_z))
-        weights = [np.sum(p) for p in weight_products]
+        The indices are found by arithmetic on the regularly spaced grid lines, rather than by comparing against all of them.
 
-        neighbour_data = np.zeros((self.xs.shape[0], self.ys.shape[0], self.zs.shape[0]))
+        Returns:
+            (number of coordinates, stencil size) arrays with the grid line indices, clipped to the grid,
+            and whether these indices were within the grid before clipping.
+        """
+        grid_lines = (self.xs, self.ys, self.zs)[axis]
+        resolution = self._settings.resolutions[axis]
+
+        # one extra grid line on either side, to be safe from rounding errors
+        stencil_size = int(np.ceil(2.0 * half_width / resolution)) + 4
+        first_indices = np.floor((coordinates - half_width - grid_lines[0]) / resolution).astype(np.int64) - 1
+        indices = first_indices[:, np.newaxis] + np.arange(stencil_size)[np.newaxis, :]
+
+        inside = (indices >= 0) & (indices < grid_lines.shape[0])
+        return np.clip(indices, 0, grid_lines.shape[0] - 1), inside
+
+    def _get_sparse_weights(self, indices_x: NDArray, indices_y: NDArray, indices_z: NDArray, weights: NDArray) -> csr_matrix:
+        """Collect the weights of the grid points in a stencil around each point into a (points, grid points) sparse matrix.
+
+        Args:
+            indices_x: (points, stencil size along x) array of grid line indices.
+            indices_y: (points, stencil size along y) array of grid line indices.
+            indices_z: (points, stencil size along z) array of grid line indices.
+            weights: (points, stencil size x, stencil size y, stencil size z) array of weights.
+                Grid points outside the stencil or outside the grid must have a weight of 0.
+        """
+        grid_indices = np.ravel_multi_index(
+            (indices_x[:, :, np.newaxis, np.newaxis], indices_y[:, np.newaxis, :, np.newaxis], indices_z[:, np.newaxis, np.newaxis, :]),
+            self._xgrid.shape,
+        )
+        point_indices = np.broadcast_to(np.arange(weights.shape[0])[:, np.newaxis, np.newaxis, np.newaxis], grid_indices.shape)
 
-        for point_index, point in enumerate(points):
-            weight = weights[point_index]
+        nonzero = weights != 0.0
+        return csr_matrix(
+            (weights[nonzero], (point_indices[nonzero], grid_indices[nonzero])),
+            shape=(weights.shape[0], self._xgrid.size),
+        )
 
-            neighbour_data[point] = weight * value
+    def _get_mapping_weights_nearest_neighbour(self, positions: NDArray) -> csr_matrix:
+        # NOTE: the distances along all three axes are measured from the point's x coordinate
+        fx = positions[:, 0:1]
+        distances_x = np.abs(self.xs[np.newaxis, :] - fx)
+        distances_y = np.abs(self.ys[np.newaxis, :] - fx)
+        distances_z = np.abs(self.zs[np.newaxis, :] - fx)
+
+        # the two closest grid lines along each axis, with weights proportional to their distances
+        indices_x = np.argsort(distances_x, axis=1)[:, :2]
+        indices_y = np.argsort(distances_y, axis=1)[:, :2]
+        indices_z = np.argsort(distances_z, axis=1)[:, :2]
+
+        sorted_x = np.take_along_axis(distances_x, indices_x, axis=1)
+        weights_x = sorted_x / np.sum(sorted_x, axis=1, keepdims=True)
+
+        sorted_y = np.take_along_axis(distances_y, indices_y, axis=1)
+        weights_y = sorted_y / np.sum(sorted_y, axis=1, keepdims=True)
+
+        sorted_z = np.take_along_axis(distances_z, indices_z, axis=1)
+        weights_z = sorted_z / np.sum(sorted_z, axis=1, keepdims=True)
+
+        # each of the 8 neighbouring grid points gets the sum of its three axis weights
+        weights = weights_x[:, :, np.newaxis, np.newaxis] + weights_y[:, np.newaxis, :, np.newaxis] + weights_z[:, np.newaxis, np.newaxis, :]
+        return self._get_sparse_weights(indices_x, indices_y, indices_z, weights)
+
+    def _get_distances(self, positions: NDArray) -> NDArray:
+        """Distances from each of the given positions (rows) to all grid points (columns)."""
+        return np.sqrt(
+            (self._xgrid.reshape(1, -1) - positions[:, 0:1]) ** 2
+            + (self._ygrid.reshape(1, -1) - positions[:, 1:2]) ** 2
+            + (self._zgrid.reshape(1, -1) - positions[:, 2:3]) ** 2,
+        )
 
-        return neighbour_data
+    def _get_mapping_weights(self, positions: NDArray, method: MapMethod) -> NDArray | csr_matrix:
+        """Get the weights with which values at the given positions are divided over the grid points.
+
+        Returns:
+            (number of positions, number of grid points) matrix, dense or sparse.
+        """
+        if method == MapMethod.GAUSSIAN:
+            return self._get_mapping_weights_gaussian(positions)
+        if method == MapMethod.FAST_GAUSSIAN:
+            return self._get_mapping_weights_fast_gaussian(positions)
+        if method == MapMethod.BSP_LINE:
+            return self._get_mapping_weights_bsp_line(positions)
+        if method == MapMethod.NEAREST_NEIGHBOURS:
+            return self._get_mapping_weights_nearest_neighbour(positions)
+        msg = f"Unknown grid mapping method: {method}"
+        raise ValueError(msg)
 
     def _get_atomic_density_koes(
         self,
@@ -269,6 +329,47 @@ class Grid:
 
         return density_data
 
+    def map_features(
+        self,
+        positions: NDArray,
+        feature_values: dict[str, list[NDArray | float]],
+        method: MapMethod,
+    ) -> None:
+        """Maps the features of a set of points to the grid, using the given method.
+
+        The mapping weights of each point are calculated once and applied to all feature channels together.
+
+        Args:
+            positions: (N, 3) array with the positions of the points.
+            feature_values: the values of the N points per feature name. The values of a feature should either be single numbers
+                or one-dimensional arrays, which are mapped to one grid per array index.
+            method: the method to divide the values over the grid points.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+
+        channel_names = []
+        channel_values = []
+        for feature_name, values in feature_values.items():
+            feature_array = np.asarray(values, dtype=np.float64)
+            if feature_array.ndim == 1:
+                channel_names.append(feature_name)
+                channel_values.append(feature_array[:, np.newaxis])
+            else:
+                channel_names += [f"{feature_name}_{index:03d}" for index in range(feature_array.shape[1])]
+                channel_values.append(feature_array)
+        if len(channel_names) == 0:
+            return
+        channel_values = np.concatenate(channel_values, axis=1)
+
+        grid_data = np.zeros((len(channel_names), self._xgrid.size))
+        for start in range(0, positions.shape[0], MAPPING_BATCH_SIZE):
+            end = start + MAPPING_BATCH_SIZE
+            weights = self._get_mapping_weights(positions[start:end], method)
+            grid_data += (weights.T @ channel_values[start:end]).T
+
+        for channel_name, channel_data in zip(channel_names, grid_data, strict=True):
+            self.add_feature_values(channel_name, channel_data.reshape(self._xgrid.shape))
+
     def map_feature(
         self,
         position: NDArray,
@@ -280,37 +381,9 @@ class Grid:
 
         The feature_value should either be a single number or a one-dimensional array.
         """
-        # determine whether we're dealing with a single number of multiple numbers:
-        index_names_values = []
-        if isinstance(feature_value, float):
-            index_names_values = [(feature_name, feature_value)]
+        self.map_features(np.asarray(position)[np.newaxis, :], {feature_name: [feature_value]}, method)
 
-        elif isinstance(feature_value, int):
-            index_names_values = [(feature_name, float(feature_value))]
-
-        else:
-            for index, value in enumerate(feature_value):
-                index_name = f"{feature_name}_{index:03d}"
-                index_names_values.append((index_name, value))
-
-        # map the data to the grid
-        for index_name, value in index_names_values:
-            if method == MapMethod.GAUSSIAN:
-                grid_data = self._get_mapped_feature_gaussian(position, value)
-
-            elif method == MapMethod.FAST_GAUSSIAN:
-                grid_data = self._get_mapped_feature_fast_gaussian(position, value)
-
-            elif method == MapMethod.BSP_LINE:
-                grid_data = self._get_mapped_feature_bsp_line(position, value)
-
-            elif method == MapMethod.NEAREST_NEIGHBOURS:
-                grid_data = self._get_mapped_feature_nearest_neighbour(position, value)
-
-            # set to grid
-            self.add_feature_values(index_name, grid_data)
-
-    def to_hdf5(self, hdf5_path: str) -> None:
+    def to_hdf5(self, hdf5_path: str | BinaryIO) -> None:
         """Write the grid data to hdf5, according to deeprank standards."""
         with h5py.File(hdf5_path, "a") as hdf5_file:
             # create a group to hold everything
@@ -332,3 +405,18 @@ class Grid:
                     compression="lzf",
                     chunks=True,
                 )
+
+
+def _outer_and(inside_x: NDArray, inside_y: NDArray, inside_z: NDArray) -> NDArray:
+    """Combine per-axis (points, stencil size) masks into a (points, stencil x, stencil y, stencil z) mask."""
+    return inside_x[:, :, np.newaxis, np.newaxis] & inside_y[:, np.newaxis, :, np.newaxis] & inside_z[:, np.newaxis, np.newaxis, :]
+
+
+def _cubic_bspline(u: NDArray) -> NDArray:
+    """The cubic (order 4) cardinal B-spline, centered at 0 with support [-2, 2]."""
+    u = np.abs(u)
+    return np.where(
+        u < 1.0,
+        (4.0 - 6.0 * u**2 + 3.0 * u**3) / 6.0,
+        np.where(u < 2.0, (2.0 - u) ** 3 / 6.0, 0.0),  # noqa: PLR2004
+    )
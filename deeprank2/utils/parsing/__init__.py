@@ -1,6 +1,9 @@
 import logging
 import os
 
+import numpy as np
+from numpy.typing import NDArray
+
 from deeprank2.molstruct.atom import Atom
 from deeprank2.molstruct.residue import Residue
 from deeprank2.utils.parsing.patch import PatchActionType, PatchParser
@@ -31,38 +34,71 @@ class AtomicForcefield:  # noqa: D101
         with open(param_path, encoding="utf-8") as f:
             self._vanderwaals_parameters = ParamParser.parse(f)
 
-    def _find_matching_residue_class(self, residue: Residue) -> str | None:
-        for criterium in self._residue_class_criteria:
-            if criterium.matches(
-                residue.amino_acid.three_letter_code,
-                [atom.name for atom in residue.atoms],
-            ):
-                return criterium.class_name
-
-        return None
-
-    def get_vanderwaals_parameters(self, atom: Atom) -> VanderwaalsParam:
-        atom_name = atom.name
+        # lookup tables, filled as residues and atoms are encountered
+        self._residue_classes = {}
+        self._vanderwaals_types = {}
+        self._charges = {}
 
+    def _find_matching_residue_class(self, residue: Residue) -> str | None:
+        # the residue class only depends on the amino acid and the names of its atoms, so it is resolved once per combination
+        residue_key = (residue.amino_acid.three_letter_code, tuple(atom.name for atom in residue.atoms))
+        if residue_key not in self._residue_classes:
+            self._residue_classes[residue_key] = None
+            for criterium in self._residue_class_criteria:
+                if criterium.matches(residue_key[0], list(residue_key[1])):
+                    self._residue_classes[residue_key] = criterium.class_name
+                    break
+
+        return self._residue_classes[residue_key]
+
+    def _resolve_vanderwaals_type(self, residue_name: str, atom_name: str, residue_class: str | None) -> str | None:
+        type_key = (residue_name, atom_name, residue_class)
+        if type_key not in self._vanderwaals_types:
+            type_ = None
+
+            # check top
+            top_key = (residue_name, atom_name)
+            if top_key in self._top_rows:
+                type_ = self._top_rows[top_key]["type"]
+
+            # check patch, which overrides top
+            if residue_class is not None:
+                for action in self._patch_actions:
+                    if action.type in [PatchActionType.MODIFY, PatchActionType.ADD] and residue_class == action.selection.residue_type and "TYPE" in action:
+                        type_ = action["TYPE"]
+
+            self._vanderwaals_types[type_key] = type_
+
+        return self._vanderwaals_types[type_key]
+
+    def _resolve_charge(self, residue_name: str, atom_name: str, residue_class: str | None) -> float | None:
+        charge_key = (residue_name, atom_name, residue_class)
+        if charge_key not in self._charges:
+            charge = None
+
+            # check top
+            top_key = (residue_name, atom_name)
+            if top_key in self._top_rows:
+                charge = float(self._top_rows[top_key]["charge"])
+
+            # check patch, which overrides top
+            if residue_class is not None:
+                for action in self._patch_actions:
+                    if action.type in [PatchActionType.MODIFY, PatchActionType.ADD] and residue_class == action.selection.residue_type:
+                        charge = float(action["CHARGE"])
+
+            self._charges[charge_key] = charge
+
+        return self._charges[charge_key]
+
+    def _get_vanderwaals_parameters(self, atom: Atom, residue_class: str | None) -> VanderwaalsParam:
         if atom.residue.amino_acid is None:
             _log.warning(f"no amino acid for {atom}; three letter code set to XXX")
             residue_name = "XXX"
         else:
             residue_name = atom.residue.amino_acid.three_letter_code
 
-        type_ = None
-
-        # check top
-        top_key = (residue_name, atom_name)
-        if top_key in self._top_rows:
-            type_ = self._top_rows[top_key]["type"]
-
-        # check patch, which overrides top
-        residue_class = self._find_matching_residue_class(atom.residue)
-        if residue_class is not None:
-            for action in self._patch_actions:
-                if action.type in [PatchActionType.MODIFY, PatchActionType.ADD] and residue_class == action.selection.residue_type and "TYPE" in action:
-                    type_ = action["TYPE"]
+        type_ = self._resolve_vanderwaals_type(residue_name, atom.name, residue_class)
 
         if type_ is None:
             _log.warning(
@@ -73,6 +109,21 @@ class AtomicForcefield:  # noqa: D101
             return VanderwaalsParam(0.0, 0.0, 0.0, 0.0)
         return self._vanderwaals_parameters[type_]
 
+    def _get_charge(self, atom: Atom, residue_class: str | None) -> float:
+        charge = self._resolve_charge(atom.residue.amino_acid.three_letter_code, atom.name, residue_class)
+
+        if charge is None:
+            _log.warning(
+                f"Atom {atom} is unknown to the forcefield, `electrostatic` and `atom_charge` charge is set to 0.0.\n"
+                "   This will affect `electrostatic` and `atom_charge` features.\n"
+                "       Check https://deeprank2.readthedocs.io/en/latest/features.html#nonbond-energies for more details.",
+            )
+            return 0.0
+        return charge
+
+    def get_vanderwaals_parameters(self, atom: Atom) -> VanderwaalsParam:
+        return self._get_vanderwaals_parameters(atom, self._find_matching_residue_class(atom.residue))
+
     def get_charge(self, atom: Atom) -> float:
         """Get the charge of a given `Atom`.
 
@@ -82,31 +133,45 @@ class AtomicForcefield:  # noqa: D101
         Returns:
             the charge of the given atom.
         """
-        atom_name = atom.name
-        amino_acid_code = atom.residue.amino_acid.three_letter_code
+        return self._get_charge(atom, self._find_matching_residue_class(atom.residue))
 
-        charge = None
+    def _get_residue_classes(self, atoms: list[Atom]) -> list[str | None]:
+        """Looks up the residue class of each atom's residue, visiting each residue only once."""
+        residue_classes = {}
+        for atom in atoms:
+            if id(atom.residue) not in residue_classes:
+                residue_classes[id(atom.residue)] = self._find_matching_residue_class(atom.residue)
+        return [residue_classes[id(atom.residue)] for atom in atoms]
 
-        # check top
-        top_key = (amino_acid_code, atom_name)
-        if top_key in self._top_rows:
-            charge = float(self._top_rows[top_key]["charge"])
+    def get_charges(self, atoms: list[Atom]) -> NDArray[np.float64]:
+        """Get the charges of a list of `Atom`s in one call.
 
-        # check patch, which overrides top
-        residue_class = self._find_matching_residue_class(atom.residue)
-        if residue_class is not None:
-            for action in self._patch_actions:
-                if action.type in [PatchActionType.MODIFY, PatchActionType.ADD] and residue_class == action.selection.residue_type:
-                    charge = float(action["CHARGE"])
+        Args:
+            atoms: the atoms to get the charges for
 
-        if charge is None:
-            _log.warning(
-                f"Atom {atom} is unknown to the forcefield, `electrostatic` and `atom_charge` charge is set to 0.0.\n"
-                "   This will affect `electrostatic` and `atom_charge` features.\n"
-                "       Check https://deeprank2.readthedocs.io/en/latest/features.html#nonbond-energies for more details.",
-            )
-            return 0.0
-        return charge
+        Returns:
+            array with the charge of each atom, in the same order as `atoms`.
+        """
+        residue_classes = self._get_residue_classes(atoms)
+        return np.array([self._get_charge(atom, residue_class) for atom, residue_class in zip(atoms, residue_classes, strict=True)], dtype=np.float64)
+
+    def get_vanderwaals_parameter_arrays(self, atoms: list[Atom]) -> VanderwaalsParam:
+        """Get the Van der Waals parameters of a list of `Atom`s in one call.
+
+        Args:
+            atoms: the atoms to get the parameters for
+
+        Returns:
+            the Van der Waals parameters, where each parameter is an array with one value per atom, in the same order as `atoms`.
+        """
+        residue_classes = self._get_residue_classes(atoms)
+        parameters = [self._get_vanderwaals_parameters(atom, residue_class) for atom, residue_class in zip(atoms, residue_classes, strict=True)]
+        return VanderwaalsParam(
+            np.array([vdw.epsilon_main for vdw in parameters], dtype=np.float64),
+            np.array([vdw.sigma_main for vdw in parameters], dtype=np.float64),
+            np.array([vdw.epsilon_14 for vdw in parameters], dtype=np.float64),
+            np.array([vdw.sigma_14 for vdw in parameters], dtype=np.float64),
+        )
 
 
 atomic_forcefield = AtomicForcefield()
@@ -0,0 +1,96 @@
+"""This module holds the batch sampler that batches graphs by their size rather than by their number."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+from torch.utils.data import Sampler
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from numpy.typing import NDArray
+
+# number of graphs that are sorted by size together before they are batched
+DEFAULT_BUCKET_SIZE = 1024
+
+
+class SizeAwareBatchSampler(Sampler[list[int]]):
+    """Batch sampler that fills each batch with graphs up to a maximum total number of nodes and/or edges.
+
+    The graphs are divided into buckets, which are sorted by graph size before they are split into batches, such that
+    graphs of similar size are batched together and batches are filled evenly. A graph that exceeds the budget by itself
+    forms a batch of its own. When shuffling, the buckets are drawn randomly and the batches are yielded in random order.
+
+    Args:
+        node_counts: Number of nodes of each graph.
+        edge_counts: Number of edges of each graph.
+        max_nodes: Maximum total number of nodes in a batch. If None, the number of nodes is not limited. Defaults to None.
+        max_edges: Maximum total number of edges in a batch. If None, the number of edges is not limited. Defaults to None.
+        shuffle: Whether to reshuffle the graphs at every epoch. Defaults to False.
+        bucket_size: Number of graphs that are sorted by size together. Defaults to 1024.
+    """
+
+    def __init__(
+        self,
+        node_counts: NDArray,
+        edge_counts: NDArray,
+        max_nodes: int | None = None,
+        max_edges: int | None = None,
+        shuffle: bool = False,
+        bucket_size: int = DEFAULT_BUCKET_SIZE,
+    ):
+        if max_nodes is None and max_edges is None:
+            msg = "At least one of `max_nodes` and `max_edges` must be set."
+            raise ValueError(msg)
+        if len(node_counts) != len(edge_counts):
+            msg = f"`node_counts` and `edge_counts` must have the same length, but have lengths {len(node_counts)} and {len(edge_counts)}."
+            raise ValueError(msg)
+        self.node_counts = np.asarray(node_counts, dtype=np.int64)
+        self.edge_counts = np.asarray(edge_counts, dtype=np.int64)
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        # batches of the next epoch, made in advance when the length is asked for
+        self._batches = None
+
+    def __iter__(self) -> Iterator[list[int]]:
+        batches = self._batches if self._batches is not None else self._make_batches()
+        self._batches = None
+        yield from batches
+
+    def __len__(self) -> int:
+        if self._batches is None:
+            self._batches = self._make_batches()
+        return len(self._batches)
+
+    def _make_batches(self) -> list[list[int]]:
+        rng = np.random.default_rng()
+        order = rng.permutation(len(self.node_counts)) if self.shuffle else np.arange(len(self.node_counts))
+        sizes = self.node_counts if self.max_nodes is not None else self.edge_counts
+        max_nodes = np.inf if self.max_nodes is None else self.max_nodes
+        max_edges = np.inf if self.max_edges is None else self.max_edges
+
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            bucket = order[start : start + self.bucket_size]
+            bucket = bucket[np.argsort(sizes[bucket], kind="stable")]
+            batch = []
+            batch_nodes = batch_edges = 0
+            for idx in bucket.tolist():
+                n_nodes, n_edges = self.node_counts[idx], self.edge_counts[idx]
+                if batch and (batch_nodes + n_nodes > max_nodes or batch_edges + n_edges > max_edges):
+                    batches.append(batch)
+                    batch = []
+                    batch_nodes = batch_edges = 0
+                batch.append(idx)
+                batch_nodes += n_nodes
+                batch_edges += n_edges
+            if batch:
+                batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
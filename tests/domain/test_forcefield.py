@@ -27,3 +27,24 @@ def test_atomic_forcefield() -> None:
     o = next(a for a in oxt.residue.atoms if a.name == "O")
     assert atomic_forcefield.get_charge(oxt) == -0.800
     assert atomic_forcefield.get_charge(o) == -0.800
+
+
+def test_bulk_lookup_matches_single_atom_lookup() -> None:
+    pdb = pdb2sql("tests/data/pdb/101M/101M.pdb")
+    try:
+        structure = get_structure(pdb, "101M")
+    finally:
+        pdb._close()
+
+    atoms = structure.get_atoms()
+    charges = atomic_forcefield.get_charges(atoms)
+    vdw_parameters = atomic_forcefield.get_vanderwaals_parameter_arrays(atoms)
+
+    assert charges.shape == (len(atoms),)
+    for index, atom in enumerate(atoms):
+        assert charges[index] == atomic_forcefield.get_charge(atom)
+        vdw = atomic_forcefield.get_vanderwaals_parameters(atom)
+        assert vdw_parameters.epsilon_main[index] == vdw.epsilon_main
+        assert vdw_parameters.sigma_main[index] == vdw.sigma_main
+        assert vdw_parameters.epsilon_14[index] == vdw.epsilon_14
+        assert vdw_parameters.sigma_14[index] == vdw.sigma_14
@@ -174,3 +174,19 @@ def test_residue_contact() -> None:
     assert res_edge.features[Efeat.ELEC] != 0.0, "electrostatic == 0"
     assert res_edge.features[Efeat.VDW] != 0.0, "vanderwaals == 0"
     assert res_edge.features[Efeat.COVALENT] == 1.0, "neighboring residues not seen as covalent"
+
+
+def test_residue_contact_aggregates_atom_pairs() -> None:
+    """Check that residue contact features equal the aggregates of all its atomic contacts."""
+    res_edge = _get_contact("101M", 0, "", 5, "", residue_level=True)
+    residue1, residue2 = res_edge.id.residue1, res_edge.id.residue2
+
+    graph = Graph(uuid4().hex)
+    atom_edges = [Edge(AtomicContact(atom1, atom2)) for atom1 in residue1.atoms for atom2 in residue2.atoms]
+    for edge in atom_edges:
+        graph.add_edge(edge)
+    add_features("", graph)
+
+    assert np.isclose(res_edge.features[Efeat.DISTANCE], min(edge.features[Efeat.DISTANCE] for edge in atom_edges))
+    assert np.isclose(res_edge.features[Efeat.ELEC], sum(edge.features[Efeat.ELEC] for edge in atom_edges))
+    assert np.isclose(res_edge.features[Efeat.VDW], sum(edge.features[Efeat.VDW] for edge in atom_edges))
@@ -1,8 +1,10 @@
 import os
+import pickle
 import unittest
 import warnings
 from shutil import rmtree
 from tempfile import mkdtemp
+from unittest.mock import patch
 
 import h5py
 import numpy as np
@@ -11,7 +13,7 @@ import torch
 from numpy.typing import NDArray
 from torch_geometric.loader import DataLoader
 
-from deeprank2.dataset import GraphDataset, GridDataset, save_hdf5_keys
+from deeprank2.dataset import GraphDataset, GridDataset, PackedGraphDataset, _hdf5_files, close_hdf5_files, pack_graph_dataset, save_hdf5_keys
 from deeprank2.domain import edgestorage as Efeat
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.domain import targetstorage as targets
@@ -1305,6 +1307,128 @@ class TestDataSet(unittest.TestCase):
                 train_source=pretrained_graph_model,
             )
 
+    def test_compute_mean_std_graphdataset(self) -> None:
+        hdf5_paths = ["tests/data/hdf5/test.hdf5", "tests/data/hdf5/valid.hdf5"]
+        features_transform = {"all": {"transform": lambda t: np.log(np.abs(t) + 1), "standardize": True}}
+        # by default, the statistics are computed without starting any processes
+        with patch("deeprank2.dataset.Pool", None):
+            dataset = GraphDataset(
+                hdf5_path=hdf5_paths,
+                target="binary",
+                features_transform=features_transform,
+            )
+
+        # the statistics computed in parallel are the same
+        parallel_dataset = GraphDataset(hdf5_path=hdf5_paths, target="binary", features_transform=features_transform, cpu_count=2)
+        assert parallel_dataset.means == dataset.means
+        assert parallel_dataset.devs == dataset.devs
+
+        # the streaming statistics equal those of all values loaded at once
+        dataset.hdf5_to_pandas()
+        assert list(dataset.means) == list(dataset.df.columns[1:])
+        for col in dataset.df.columns[1:]:
+            values = np.hstack(dataset.df[col].to_numpy()).astype(float)
+            assert dataset.means[col] == round(np.nanmean(values), 1)
+            assert dataset.devs[col] == round(np.nanstd(values), 1)
+
+    def test_packed_graphdataset(self) -> None:
+        hdf5_path = "tests/data/hdf5/test.hdf5"
+        dataset = GraphDataset(
+            hdf5_path=hdf5_path,
+            target=targets.BINARY,
+            features_transform={"bsa": {"transform": lambda t: np.log(t + 1), "standardize": True}},
+        )
+        packed_path = mkdtemp()
+        try:
+            packed_dataset = PackedGraphDataset(pack_graph_dataset(dataset, packed_path))
+            assert len(packed_dataset) == len(dataset)
+            assert packed_dataset.node_features == dataset.node_features
+            assert packed_dataset.means == dataset.means
+            for idx in range(len(dataset)):
+                data = dataset.get(idx)
+                packed_data = packed_dataset.get(idx)
+                assert packed_data.entry_names == data.entry_names
+                for key in ["x", "edge_index", "edge_attr", "pos", "y"]:
+                    assert torch.equal(packed_data[key], data[key]), key
+            for packed_counts, counts in zip(packed_dataset.get_graph_sizes(), dataset.get_graph_sizes(), strict=True):
+                assert np.array_equal(packed_counts, counts)
+            assert np.array_equal(packed_dataset.get_target_values(), dataset.get_target_values())
+
+            # subset
+            entry_names = [entry_name for _, entry_name in dataset.index_entries[::-2]]
+            packed_subset = PackedGraphDataset(packed_path, subset=entry_names)
+            assert [packed_subset.get(idx).entry_names for idx in range(len(packed_subset))] == entry_names
+
+            # inheritance by a testing dataset
+            test_dataset = GraphDataset(hdf5_path=hdf5_path, train_source=packed_dataset)
+            assert test_dataset.means == dataset.means
+            assert torch.equal(test_dataset.get(0).x, dataset.get(0).x)
+        finally:
+            rmtree(packed_path)
+
+    def test_get_graph_sizes(self) -> None:
+        dataset = GraphDataset(hdf5_path="tests/data/hdf5/test.hdf5", target=targets.BINARY)
+        node_counts, edge_counts = dataset.get_graph_sizes()
+        for idx in range(len(dataset)):
+            data = dataset.get(idx)
+            assert node_counts[idx] == data.num_nodes
+            assert edge_counts[idx] == data.num_edges
+
+    def test_get_target_values(self) -> None:
+        dataset = GraphDataset(hdf5_path="tests/data/hdf5/test.hdf5", target=targets.BINARY)
+        target_values = dataset.get_target_values()
+        assert target_values.tolist() == [dataset.get(idx).y.item() for idx in range(len(dataset))]
+
+    def test_item_cache(self) -> None:
+        dataset = GraphDataset(hdf5_path="tests/data/hdf5/test.hdf5", target=targets.BINARY)
+        graphs = [dataset.get(idx) for idx in range(len(dataset))]
+
+        dataset.enable_cache(2**28)
+        for _ in range(2):
+            for data in DataLoader(dataset, batch_size=1, num_workers=2):
+                graph = graphs[[g.entry_names for g in graphs].index(data.entry_names[0])]
+                assert torch.equal(data.x, graph.x)
+        # items loaded by the workers in the first epoch are reused by the workers in the second epoch
+        assert dataset._item_cache.misses == len(dataset)
+        assert dataset._item_cache.hits == len(dataset)
+        for idx, graph in enumerate(graphs):
+            data = dataset.get(idx)
+            assert data.entry_names == graph.entry_names
+            for key in ["x", "edge_index", "edge_attr", "pos", "y"]:
+                assert torch.equal(data[key], graph[key]), key
+
+        # a cache that holds one item evicts it when the next one is loaded
+        dataset.enable_cache(int(len(pickle.dumps(graphs[0])) * 1.5))
+        dataset.get(0)
+        assert torch.equal(dataset.get(1).x, graphs[1].x)
+        assert dataset.get(0).entry_names == graphs[0].entry_names
+        assert dataset._item_cache.hits == 0
+
+        with pytest.raises(ValueError):
+            dataset.enable_cache(0)
+
+    def test_hdf5_file_pool(self) -> None:
+        hdf5_path = "tests/data/hdf5/test.hdf5"
+        dataset = GraphDataset(hdf5_path=hdf5_path, target=targets.BINARY)
+
+        close_hdf5_files()
+        first_graph = dataset.get(0)
+        assert list(_hdf5_files._files) == [hdf5_path]
+        hdf5_file, _ = _hdf5_files._files[hdf5_path]
+
+        # the open file is reused for the next entries
+        for idx in range(1, len(dataset)):
+            dataset.get(idx)
+        assert _hdf5_files._files[hdf5_path][0] is hdf5_file
+        assert torch.equal(dataset.get(0).x, first_graph.x)
+
+        # the file is reopened after it has been closed
+        close_hdf5_files()
+        assert not hdf5_file.id.valid
+        assert torch.equal(dataset.get(0).x, first_graph.x)
+        assert _hdf5_files._files[hdf5_path][0].id.valid
+        close_hdf5_files()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,7 @@
 import os
 import shutil
 from tempfile import mkdtemp, mkstemp
+from types import ModuleType
 
 import h5py
 import numpy as np
@@ -17,6 +18,7 @@ from deeprank2.query import (
     QueryCollection,
     SingleResidueVariantQuery,
 )
+from deeprank2.utils.featurecolumns import FeatureColumns, GraphArrays
 from deeprank2.utils.graph import Graph
 from deeprank2.utils.grid import GridSettings, MapMethod
 
@@ -491,3 +493,30 @@ def test_variant_query_multiple_chains() -> None:
     q.influence_radius = 7.0
     graph = q.build(conservation)
     assert "B" not in graph.get_all_chains()
+
+
+def test_build_feature_columns() -> None:
+    """Test that modules with `get_feature_columns` are used through it, and other modules through `add_features`."""
+
+    def get_feature_columns(pdb_path: str, graph_arrays: GraphArrays, variant: None) -> FeatureColumns:  # noqa: ARG001
+        return FeatureColumns(node_features={"node_test": graph_arrays.residue_numbers[graph_arrays.node_residues]})
+
+    def add_features(pdb_path: str, graph: Graph, variant: None) -> None:  # noqa: ARG001
+        msg = "add_features should not be called if a module has get_feature_columns"
+        raise AssertionError(msg)
+
+    column_module = ModuleType("column_module")
+    column_module.get_feature_columns = get_feature_columns
+    column_module.add_features = add_features
+
+    query = ProteinProteinInterfaceQuery(
+        pdb_path="tests/data/pdb/3C8P/3C8P.pdb",
+        resolution="atom",
+        chain_ids=["A", "B"],
+        influence_radius=5.0,
+        max_edge_length=5.0,
+    )
+    g = query.build([column_module, contact])
+
+    assert [node.features["node_test"] for node in g.nodes] == [atom.residue.number for atom in g.node_ids]
+    assert Efeat.DISTANCE in g.edge_feature_names
@@ -1,4 +1,6 @@
+import os
 import warnings
+from collections.abc import Iterator
 from os.path import join
 from shutil import rmtree
 from tempfile import mkdtemp
@@ -9,11 +11,14 @@ import h5py
 import pytest
 
 from deeprank2.domain import edgestorage as Efeat
+from deeprank2.domain import gridstorage
 from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.domain.aminoacidlist import alanine, phenylalanine
 from deeprank2.features import components, contact, surfacearea
 from deeprank2.query import ProteinProteinInterfaceQuery, Query, QueryCollection, SingleResidueVariantQuery
 from deeprank2.tools.target import compute_ppi_scores
+from deeprank2.utils.datasetindex import load_index
+from deeprank2.utils.grid import GridSettings, MapMethod
 
 
 def _querycollection_tester(
@@ -230,6 +235,170 @@ def test_querycollection_process_combine_output_false() -> None:
         rmtree(output_directory)
 
 
+def test_querycollection_process_grids() -> None:
+    """Tests that graphs, grids and grid augmentations all end up in the combined hdf5 file."""
+    output_directory = mkdtemp()
+    collection = QueryCollection()
+    collection.add(
+        SingleResidueVariantQuery(
+            pdb_path="tests/data/pdb/101M/101M.pdb",
+            resolution="residue",
+            chain_ids="A",
+            variant_residue_number=25,
+            insertion_code=None,
+            wildtype_amino_acid=alanine,
+            variant_amino_acid=phenylalanine,
+            pssm_paths={"A": "tests/data/pssm/101M/101M.A.pdb.pssm"},
+        ),
+    )
+    try:
+        output_paths = collection.process(
+            join(output_directory, "test-process-grids"),
+            [components],
+            cpu_count=1,
+            grid_settings=GridSettings([20, 20, 20], [20.0, 20.0, 20.0]),
+            grid_map_method=MapMethod.GAUSSIAN,
+            grid_augmentation_count=2,
+        )
+        assert len(output_paths) == 1
+
+        query_id = collection.queries[0].get_query_id()
+        with h5py.File(output_paths[0], "r") as f5:
+            assert list(f5.keys()) == [query_id, f"{query_id}_000", f"{query_id}_001"]
+            assert Nfeat.NODE in f5[query_id]
+            for entry_name in f5:
+                assert gridstorage.MAPPED_FEATURES in f5[entry_name]
+    finally:
+        rmtree(output_directory)
+
+
+def test_querycollection_process_query_generator() -> None:
+    """Tests processing of queries given as a generator, in chunks."""
+    output_directory = mkdtemp()
+    query_ids = []
+
+    def query_generator() -> Iterator[Query]:
+        for residue_number in range(1, 6):
+            query = SingleResidueVariantQuery(
+                pdb_path="tests/data/pdb/101M/101M.pdb",
+                resolution="residue",
+                chain_ids="A",
+                variant_residue_number=residue_number,
+                insertion_code=None,
+                wildtype_amino_acid=alanine,
+                variant_amino_acid=phenylalanine,
+                pssm_paths={"A": "tests/data/pssm/101M/101M.A.pdb.pssm"},
+            )
+            query_ids.append(query.get_query_id())
+            yield query
+
+    try:
+        output_paths = QueryCollection().process(
+            join(output_directory, "test-process-generator"),
+            [components],
+            cpu_count=1,
+            chunksize=2,
+            max_in_flight=2,
+            queries=query_generator(),
+            write_index=True,
+        )
+        with h5py.File(output_paths[0], "r") as f5:
+            assert sorted(f5.keys()) == sorted(query_ids)
+        assert len(query_ids) == 5
+        assert sorted(load_index(output_paths[0]).entry_names.tolist()) == sorted(query_ids)
+    finally:
+        rmtree(output_directory)
+
+
+def test_querycollection_process_invalid_in_flight() -> None:
+    with pytest.raises(ValueError, match="max_in_flight"):
+        QueryCollection().process(cpu_count=1, chunksize=4, max_in_flight=2)
+
+
+def _resume_queries() -> list[SingleResidueVariantQuery]:
+    return [
+        SingleResidueVariantQuery(
+            pdb_path="tests/data/pdb/101M/101M.pdb",
+            resolution="residue",
+            chain_ids="A",
+            variant_residue_number=residue_number,
+            insertion_code=None,
+            wildtype_amino_acid=alanine,
+            variant_amino_acid=phenylalanine,
+        )
+        for residue_number in range(1, 6)
+    ]
+
+
+def test_querycollection_process_resume() -> None:
+    """Tests that resuming skips completed queries and rewrites incomplete entries."""
+    output_directory = mkdtemp()
+    prefix = join(output_directory, "test-process-resume")
+    queries = _resume_queries()
+    query_ids = [query.get_query_id() for query in queries]
+
+    try:
+        # a first run that crashed after its last manifest update, leaving an empty group for the query that came after it
+        QueryCollection().process(prefix, [components], cpu_count=1, queries=queries[:3])
+        with open(f"{prefix}.manifest") as manifest:
+            lines = manifest.readlines()
+        assert len(lines) == 3
+        with open(f"{prefix}.manifest", "w") as manifest:
+            manifest.writelines(lines[:2])
+        crashed_id = lines[2].split("\t")[0].strip()
+        with h5py.File(f"{prefix}.hdf5", "a") as f5:
+            del f5[crashed_id]
+            f5.create_group(crashed_id)
+
+        output_paths = QueryCollection().process(prefix, [components], cpu_count=1, queries=queries, resume=True)
+        with h5py.File(output_paths[0], "r") as f5:
+            assert sorted(f5.keys()) == sorted(query_ids)
+            for query_id in query_ids:
+                assert Nfeat.NODE in f5[query_id]
+        with open(f"{prefix}.manifest") as manifest:
+            assert sorted(line.split("\t")[0].strip() for line in manifest) == sorted(query_ids)
+    finally:
+        rmtree(output_directory)
+
+
+def test_querycollection_process_resume_without_manifest() -> None:
+    """Tests that resuming keeps the entries of an output file that has no manifest, and considers them completed."""
+    output_directory = mkdtemp()
+    prefix = join(output_directory, "test-process-resume")
+    queries = _resume_queries()
+    query_ids = [query.get_query_id() for query in queries]
+
+    try:
+        QueryCollection().process(prefix, [components], cpu_count=1, queries=queries[:3])
+        os.remove(f"{prefix}.manifest")
+        with h5py.File(f"{prefix}.hdf5", "a") as f5:
+            for query_id in query_ids[:3]:
+                f5[query_id].attrs["first_run"] = True
+            f5.create_group(f"{query_ids[0]}_000")  # an augmented grid
+            f5.create_group("other-query")
+
+        output_paths = QueryCollection().process(prefix, [components], cpu_count=1, queries=queries, resume=True)
+        with h5py.File(output_paths[0], "r") as f5:
+            assert sorted(f5.keys()) == sorted([*query_ids, f"{query_ids[0]}_000", "other-query"])
+            for query_id in query_ids[:3]:
+                assert f5[query_id].attrs["first_run"]
+            for query_id in query_ids[3:]:
+                assert "first_run" not in f5[query_id].attrs
+        with open(f"{prefix}.manifest") as manifest:
+            manifest_entries = {line.split("\t")[0].strip(): line.strip().split("\t")[1:] for line in manifest}
+        assert sorted(manifest_entries) == sorted([*query_ids, "other-query"])
+        assert manifest_entries[query_ids[0]] == [query_ids[0], f"{query_ids[0]}_000"]
+
+        # a run without resume lists the entries that were already in the file, such that resuming does not remove them
+        os.remove(f"{prefix}.manifest")
+        QueryCollection().process(prefix, [components], cpu_count=1, queries=queries[:1])
+        QueryCollection().process(prefix, [components], cpu_count=1, queries=queries, resume=True)
+        with h5py.File(output_paths[0], "r") as f5:
+            assert sorted(f5.keys()) == sorted([*query_ids, f"{query_ids[0]}_000", "other-query"])
+    finally:
+        rmtree(output_directory)
+
+
 def test_querycollection_duplicates_add() -> None:
     """Tests add method of QueryCollection class."""
     ref_path = "tests/data/ref/1ATN/1ATN.pdb"
@@ -4,6 +4,7 @@ import unittest
 import warnings
 
 import pytest
+import torch
 from torch import nn
 
 from deeprank2.dataset import GraphDataset
@@ -94,6 +95,23 @@ class TestLosses(unittest.TestCase):
         assert isinstance(trainer_pretrained.lossfunction, lossfunction)
         assert trainer_pretrained.class_weights
 
+    def test_classif_weights(self) -> None:
+        dataset = GraphDataset(
+            hdf5_path,
+            target=targets.BINARY,
+        )
+        trainer = Trainer(
+            neuralnet=VanillaNetwork,
+            dataset_train=dataset,
+            class_weights=True,
+        )
+        trainer.train(nepoch=1, filename=None)
+
+        # the weights are computed from the targets of the training data
+        targets_train = [trainer.dataset_train.get(idx).y.item() for idx in range(len(trainer.dataset_train))]
+        counts = torch.tensor([targets_train.count(class_) for class_ in trainer.classes], dtype=torch.float32)
+        assert torch.allclose(trainer.weights, (1.0 / counts) / (1.0 / counts).sum())
+
     def test_classif_invalid_weighted(self) -> None:
         dataset = GraphDataset(
             hdf5_path,
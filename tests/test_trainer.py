@@ -450,6 +450,31 @@ class TestTrainer(unittest.TestCase):
         assert len(trainer.train_loader) == len(dataset)
         assert trainer.valid_loader is None
 
+    def test_size_aware_batches(self) -> None:
+        dataset = GraphDataset(
+            hdf5_path="tests/data/hdf5/test.hdf5",
+            clustering_method="mcl",
+            target=targets.BINARY,
+        )
+        trainer = Trainer(
+            neuralnet=GINet,
+            dataset_train=dataset,
+            dataset_test=GraphDataset(hdf5_path="tests/data/hdf5/test.hdf5", train_source=dataset, clustering_method="mcl"),
+            val_size=0,
+        )
+        node_counts, _ = dataset.get_graph_sizes()
+        max_nodes = int(node_counts.max() + node_counts.min())
+        trainer.train(nepoch=1, best_model=False, filename=None, max_nodes=max_nodes)
+        for batch in trainer.train_loader:
+            assert batch.num_graphs == 1 or batch.num_nodes <= max_nodes
+        trainer.test(max_edges=1)
+        assert len(trainer.test_loader) == len(dataset)
+
+        grid_dataset = GridDataset(hdf5_path="tests/data/hdf5/1ATN_ppi.hdf5", target=targets.BINARY)
+        trainer = Trainer(neuralnet=CnnClassification, dataset_train=grid_dataset, val_size=0)
+        with pytest.raises(TypeError):
+            trainer.train(nepoch=1, filename=None, max_nodes=max_nodes)
+
     def test_optim(self) -> None:
         dataset = GraphDataset(
             hdf5_path="tests/data/hdf5/test.hdf5",
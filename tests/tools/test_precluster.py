@@ -0,0 +1,65 @@
+import os
+import shutil
+from tempfile import mkdtemp
+
+import h5py
+import numpy as np
+import pytest
+
+from deeprank2.dataset import GraphDataset
+from deeprank2.domain import targetstorage as targets
+from deeprank2.tools.precluster import precluster
+from deeprank2.utils.community_pooling import community_detection, community_pooling
+
+
+@pytest.fixture()
+def hdf5_path() -> str:
+    """Copy of a processed .HDF5 file without clusters."""
+    tmp_dir = mkdtemp()
+    hdf5_path = os.path.join(tmp_dir, "test.hdf5")
+    shutil.copy("tests/data/hdf5/test.hdf5", hdf5_path)
+    with h5py.File(hdf5_path, "a") as f5:
+        for grp in f5.values():
+            if "clustering" in grp:
+                del grp["clustering"]
+    yield hdf5_path
+    shutil.rmtree(tmp_dir)
+
+
+def test_precluster(hdf5_path: str) -> None:
+    precluster(hdf5_path, "mcl", cpu_count=2)
+
+    dataset = GraphDataset(hdf5_path=hdf5_path, target=targets.BINARY, clustering_method="mcl")
+    with h5py.File(hdf5_path, "r") as f5:
+        for idx in range(len(dataset)):
+            data = dataset.get(idx)
+            cluster0 = community_detection(data.edge_index, data.num_nodes, method="mcl")
+            cluster1 = community_detection(community_pooling(cluster0, data).edge_index, int(cluster0.max()) + 1, method="mcl")
+            assert np.array_equal(f5[f"{data.entry_names}/clustering/mcl/depth_0"][()], cluster0.numpy())
+            assert np.array_equal(f5[f"{data.entry_names}/clustering/mcl/depth_1"][()], cluster1.numpy())
+            assert np.array_equal(data.cluster0.numpy(), cluster0.numpy())
+
+
+def test_precluster_skip_existing(hdf5_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    dataset = GraphDataset(hdf5_path=hdf5_path, target=targets.BINARY)
+    entry_name = dataset.index_entries[0][1]
+    precluster(dataset, "louvain")
+    with h5py.File(hdf5_path, "a") as f5:
+        f5[f"{entry_name}/clustering/louvain/depth_0"][0] = -1
+
+    # no processes are started and no work is dispatched when all entries are clustered already
+    with monkeypatch.context() as m:
+        m.setattr("deeprank2.tools.precluster.Pool", None)
+        m.setattr("deeprank2.tools.precluster._cluster_entries", None)
+        precluster(dataset, "louvain", cpu_count=2)
+    with h5py.File(hdf5_path, "r") as f5:
+        assert f5[f"{entry_name}/clustering/louvain/depth_0"][0] == -1
+
+    precluster(dataset, "louvain", skip_existing=False)
+    with h5py.File(hdf5_path, "r") as f5:
+        assert f5[f"{entry_name}/clustering/louvain/depth_0"][0] != -1
+
+
+def test_precluster_invalid_method(hdf5_path: str) -> None:
+    with pytest.raises(ValueError):
+        precluster(hdf5_path, "kmeans")
@@ -1,8 +1,12 @@
+import os
+from pathlib import Path
+
 from pdb2sql import pdb2sql
 
-from deeprank2.domain.aminoacidlist import valine
+from deeprank2.domain.aminoacidlist import alanine, glycine, valine
 from deeprank2.molstruct.atom import AtomicElement
-from deeprank2.utils.buildgraph import get_residue_contact_pairs, get_structure, get_surrounding_residues
+from deeprank2.utils.buildgraph import get_contact_atoms, get_residue_contact_pairs, get_structure, get_surrounding_residues, load_structure
+from deeprank2.utils.cache import configure_disk_cache
 
 
 def test_get_structure_complete() -> None:
@@ -46,6 +50,65 @@ def test_get_structure_from_nmr_with_dna() -> None:
     assert structure.chains[0].residues[0].amino_acid is None  # DNA
 
 
+def _atom_line(serial: int, name: str, altloc: str, resname: str, chain: str, resseq: int, icode: str, x: float, occupancy: float) -> str:
+    coordinates = f"{x:8.3f}{0.0:8.3f}{0.0:8.3f}"
+    return f"ATOM  {serial:5d}  {name:<3}{altloc:1}{resname:3} {chain:1}{resseq:4d}{icode:1}   {coordinates}{occupancy:6.2f}{0.0:6.2f}           {name[0]}\n"
+
+
+def test_get_structure_grouping(tmp_path: Path) -> None:
+    """Test how atoms are grouped into residues and chains, and how alternative locations are chosen."""
+    pdb_path = str(tmp_path / "altlocs.pdb")
+    with open(pdb_path, "w", encoding="utf-8") as f:
+        f.writelines(
+            [
+                _atom_line(1, "N", "", "ALA", "A", 1, "", 1.0, 1.0),
+                _atom_line(2, "CA", "", "ALA", "A", 1, "", 2.0, 0.4),
+                _atom_line(3, "CA", "A", "ALA", "A", 1, "", 3.0, 0.6),  # replaces the position of the CA with lower occupancy
+                _atom_line(4, "N", "", "GLY", "A", 2, "A", 4.0, 1.0),
+                _atom_line(5, "N", "", "SER", "B", 1, "", 5.0, 1.0),
+                _atom_line(6, "CB", "", "ALA", "A", 1, "", 6.0, 1.0),  # added to the first residue
+                _atom_line(7, "CA", "B", "SER", "B", 1, "", 7.0, 0.5),  # ends the structure
+                _atom_line(8, "C", "", "SER", "B", 1, "", 8.0, 1.0),
+            ],
+        )
+    pdb = pdb2sql(pdb_path)
+    try:
+        structure = get_structure(pdb, "altlocs")
+    finally:
+        pdb._close()
+
+    assert [chain.id for chain in structure.chains] == ["A", "B"]
+    residue1, residue2 = structure.chains[0].residues
+    assert (residue1.number, residue1.insertion_code, residue1.amino_acid) == (1, None, alanine)
+    assert (residue2.number, residue2.insertion_code, residue2.amino_acid) == (2, "A", glycine)
+    assert [(atom.name, atom.position[0], atom.occupancy) for atom in residue1.atoms] == [("N", 1.0, 1.0), ("CA", 3.0, 0.6), ("CB", 6.0, 1.0)]
+    assert [atom.name for atom in structure.chains[1].residues[0].atoms] == ["N"]
+
+
+def test_load_structure_disk_cache(tmp_path: Path) -> None:
+    """Test that structures and contact atoms loaded from the disk cache are the same as those parsed from the pdb file."""
+
+    def describe(atoms: list) -> list[tuple]:
+        return [(str(atom), atom.residue.amino_acid, atom.element, atom.position.tolist(), atom.occupancy) for atom in atoms]
+
+    pdb_path = "tests/data/pdb/1ATN/1ATN_1w.pdb"
+    pdb = pdb2sql(pdb_path)
+    try:
+        atoms = describe(get_structure(pdb, "1ATN").get_atoms())
+    finally:
+        pdb._close()
+    contact_atoms = describe(get_contact_atoms(pdb_path, ["A", "B"], 8.5))
+
+    try:
+        configure_disk_cache(str(tmp_path))
+        for _ in range(2):  # parsed and stored, then loaded from the cache
+            assert describe(load_structure(pdb_path, "1ATN").get_atoms()) == atoms
+            assert describe(get_contact_atoms(pdb_path, ["A", "B"], 8.5)) == contact_atoms
+        assert len([file_name for _, _, file_names in os.walk(tmp_path) for file_name in file_names]) == 2
+    finally:
+        configure_disk_cache(None)
+
+
 def test_residue_contact_pairs() -> None:
     pdb_path = "tests/data/pdb/1ATN/1ATN_1w.pdb"
     pdb = pdb2sql(pdb_path)
@@ -0,0 +1,174 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+import pytest
+
+from deeprank2.utils import cache
+from deeprank2.utils.cache import configure_disk_cache, disk_array_cache, disk_cache, file_lru_cache
+
+
+def test_file_lru_cache() -> None:
+    """Tests that results are reused until the file is modified."""
+    calls = []
+
+    @file_lru_cache
+    def read_file(path: str, n_chars: int) -> str:
+        calls.append(path)
+        with open(path) as f:
+            return f.read(n_chars)
+
+    tmp_dir = mkdtemp()
+    path = os.path.join(tmp_dir, "test.txt")
+    try:
+        with open(path, "w") as f:
+            f.write("abcdef")
+
+        assert read_file(path, 3) == "abc"
+        assert read_file(path, 3) == "abc"
+        assert len(calls) == 1
+        assert read_file(path, 2) == "ab"
+        assert len(calls) == 2
+
+        with open(path, "w") as f:
+            f.write("uvwxyz")
+        mtime = os.path.getmtime(path) + 1.0
+        os.utime(path, (mtime, mtime))
+        assert read_file(path, 3) == "uvw"
+        assert len(calls) == 3
+    finally:
+        rmtree(tmp_dir)
+
+
+def test_disk_cache() -> None:
+    """Tests that results are stored by file content, and that the least recently used results are evicted."""
+    calls = []
+
+    @disk_cache("test_tool")
+    def read_file(path: str, n_chars: int) -> str:
+        calls.append(path)
+        with open(path) as f:
+            return f.read(n_chars)
+
+    tmp_dir = mkdtemp()
+    cache_dir = os.path.join(tmp_dir, "cache")
+    path = os.path.join(tmp_dir, "test.txt")
+    copied_path = os.path.join(tmp_dir, "copy.txt")
+    for file_path in (path, copied_path):
+        with open(file_path, "w") as f:
+            f.write("abcdef")
+
+    try:
+        # disabled by default
+        configure_disk_cache(None)
+        assert read_file(path, 3) == "abc"
+        assert not os.path.exists(cache_dir)
+
+        configure_disk_cache(cache_dir)
+        assert read_file(path, 3) == "abc"
+        assert read_file(copied_path, 3) == "abc"
+        assert len(calls) == 2  # the first call ran without the cache
+
+        assert read_file(path, 4) == "abcd"
+        assert len(calls) == 3
+
+        # only room for a single entry
+        configure_disk_cache(cache_dir, max_size=1)
+        assert read_file(path, 5) == "abcde"
+        assert read_file(path, 3) == "abc"
+        assert len(calls) == 5
+    finally:
+        configure_disk_cache(None)
+        rmtree(tmp_dir)
+
+
+def test_disk_array_cache() -> None:
+    """Tests that arrays are stored and loaded as .npz entries, which share the maximum size with the other entries."""
+    calls = []
+
+    @disk_array_cache("test_arrays")
+    def read_arrays(path: str, n_chars: int) -> dict[str, np.ndarray]:
+        calls.append(path)
+        with open(path) as f:
+            text = f.read(n_chars)
+        return {"chars": np.array(list(text), dtype=str), "codes": np.array([ord(char) for char in text])}
+
+    tmp_dir = mkdtemp()
+    cache_dir = os.path.join(tmp_dir, "cache")
+    path = os.path.join(tmp_dir, "test.txt")
+    with open(path, "w") as f:
+        f.write("abcdef")
+
+    try:
+        configure_disk_cache(cache_dir)
+        arrays = read_arrays(path, 3)
+        cached_arrays = read_arrays(path, 3)
+        assert len(calls) == 1
+        assert cached_arrays.keys() == arrays.keys()
+        for key, values in arrays.items():
+            assert cached_arrays[key].dtype == values.dtype
+            assert np.array_equal(cached_arrays[key], values)
+        entry_names = [file_name for _, _, file_names in os.walk(cache_dir) for file_name in file_names]
+        assert len(entry_names) == 1
+        assert entry_names[0].endswith(".npz")
+
+        # an unreadable entry is calculated again
+        entry_path = next(os.path.join(dir_path, file_name) for dir_path, _, file_names in os.walk(cache_dir) for file_name in file_names)
+        with open(entry_path, "wb") as f:
+            f.write(b"not an npz file")
+        assert np.array_equal(read_arrays(path, 3)["codes"], [97, 98, 99])
+        assert len(calls) == 2
+
+        # only room for a single entry
+        configure_disk_cache(cache_dir, max_size=1)
+        read_arrays(path, 4)
+        read_arrays(path, 3)
+        assert len(calls) == 4
+    finally:
+        configure_disk_cache(None)
+        rmtree(tmp_dir)
+
+
+def test_disk_cache_eviction_scans(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Tests that the cache directory is only scanned on the first write and when the estimated size exceeds the maximum size."""
+    evict_calls = []
+    evict = cache._evict
+
+    def counting_evict(cache_dir: str, max_size: int) -> int:
+        evict_calls.append(max_size)
+        return evict(cache_dir, max_size)
+
+    monkeypatch.setattr(cache, "_evict", counting_evict)
+
+    @disk_cache("test_tool")
+    def read_file(path: str, n_chars: int) -> str:
+        with open(path) as f:
+            return f.read(n_chars)
+
+    tmp_dir = mkdtemp()
+    cache_dir = os.path.join(tmp_dir, "cache")
+    path = os.path.join(tmp_dir, "test.txt")
+    with open(path, "w") as f:
+        f.write("abcdef" * 100)
+
+    def get_cache_size() -> int:
+        return sum(os.path.getsize(os.path.join(dir_path, file_name)) for dir_path, _, file_names in os.walk(cache_dir) for file_name in file_names)
+
+    try:
+        configure_disk_cache(cache_dir)
+        for n_chars in range(500, 510):
+            read_file(path, n_chars)
+        assert len(evict_calls) == 1
+
+        # room for about 50 entries, so that the cache is scanned once every few writes when it is full
+        max_size = get_cache_size() * 5
+        configure_disk_cache(cache_dir, max_size=max_size)
+        evict_calls.clear()
+        for n_chars in range(510, 610):
+            read_file(path, n_chars)
+            assert get_cache_size() <= max_size
+        assert 1 < len(evict_calls) < 25
+    finally:
+        configure_disk_cache(None)
+        rmtree(tmp_dir)
@@ -0,0 +1,68 @@
+import os
+import shutil
+from tempfile import mkdtemp
+
+import h5py
+import numpy as np
+import pytest
+
+from deeprank2.dataset import GraphDataset
+from deeprank2.domain import targetstorage as targets
+from deeprank2.utils.datasetindex import build_index, get_index_path, load_index
+
+
+@pytest.fixture()
+def hdf5_path() -> str:
+    """Copy of a processed .HDF5 file, which can be indexed and modified."""
+    tmp_dir = mkdtemp()
+    hdf5_path = os.path.join(tmp_dir, "test.hdf5")
+    shutil.copy("tests/data/hdf5/test.hdf5", hdf5_path)
+    yield hdf5_path
+    shutil.rmtree(tmp_dir)
+
+
+def test_build_index(hdf5_path: str) -> None:
+    assert load_index(hdf5_path) is None
+    assert build_index(hdf5_path) == get_index_path(hdf5_path)
+    index = load_index(hdf5_path)
+
+    with h5py.File(hdf5_path, "r") as f5:
+        assert index.entry_names.tolist() == list(f5.keys())
+        for entry_idx, entry_name in enumerate(f5):
+            assert index.node_counts[entry_idx] == f5[f"{entry_name}/node_features/bsa"].shape[0]
+            assert index.edge_counts[entry_idx] == f5[f"{entry_name}/edge_features/_index"].shape[0]
+            assert index.target_values[targets.BINARY][entry_idx] == f5[f"{entry_name}/target_values/binary"][()]
+        assert index.feature_shapes["node_features/pssm"] == f5[f"{entry_name}/node_features/pssm"].shape[1:]
+
+
+def test_index_ignored_after_modification(hdf5_path: str) -> None:
+    build_index(hdf5_path)
+    with h5py.File(hdf5_path, "a") as f5:
+        del f5[next(iter(f5.keys()))]
+    assert load_index(hdf5_path) is None
+
+
+@pytest.mark.parametrize("target_filter", [None, {targets.BINARY: "==0"}, {targets.BINARY: ">0.5"}, {targets.BINARY: "<1 and True"}])
+def test_dataset_with_index(hdf5_path: str, target_filter: dict | None) -> None:
+    with h5py.File(hdf5_path, "r") as f5:
+        subset = list(f5.keys())[::-1][:3]
+
+    datasets = []
+    for with_index in (False, True):
+        if with_index:
+            build_index(hdf5_path)
+        datasets.append(
+            GraphDataset(
+                hdf5_path=hdf5_path,
+                subset=subset,
+                target=targets.BINARY,
+                target_filter=target_filter,
+                check_integrity=False,
+            ),
+        )
+    assert datasets[0].index_entries == datasets[1].index_entries
+
+    values = np.array([datasets[1].get(idx).y.item() for idx in range(len(datasets[1]))])
+    assert np.array_equal(datasets[1].get_target_values(), values)
+    if target_filter == {targets.BINARY: "==0"}:
+        assert np.all(values == 0)
@@ -0,0 +1,72 @@
+import numpy as np
+
+from deeprank2.domain import nodestorage as Nfeat
+from deeprank2.domain.aminoacidlist import serine
+from deeprank2.features import components
+from deeprank2.utils.featurecolumns import FeatureColumns, GraphArrays, add_feature_columns, select_values
+from tests.features import build_testgraph
+
+
+def test_graph_arrays_atom() -> None:
+    graph, _ = build_testgraph(
+        pdb_path="tests/data/pdb/101M/101M.pdb",
+        detail="atom",
+        influence_radius=8.5,
+        max_edge_length=4.5,
+        central_res=25,
+    )
+    graph_arrays = GraphArrays.from_graph(graph)
+
+    assert graph_arrays.node_type == "atom"
+    assert graph_arrays.atoms == graph.node_ids
+    assert np.array_equal(graph_arrays.edge_index, graph.edge_index)
+    assert len(set(graph_arrays.residues)) == len(graph_arrays.residues)
+    for node_index, atom in enumerate(graph.node_ids):
+        residue_index = graph_arrays.node_residues[node_index]
+        assert graph_arrays.residues[residue_index] == atom.residue
+        assert graph_arrays.residue_chain_ids[residue_index] == atom.residue.chain.id
+        assert graph_arrays.residue_numbers[residue_index] == atom.residue.number
+        assert graph_arrays.amino_acids[graph_arrays.node_amino_acids[node_index]] == atom.residue.amino_acid
+        assert graph_arrays.elements[graph_arrays.atom_elements[node_index]] == atom.element
+        assert graph_arrays.atom_occupancies[node_index] == atom.occupancy
+    assert sorted(graph_arrays.get_all_chains()) == sorted(graph.get_all_chains())
+
+
+def test_select_values() -> None:
+    # the dtype is that of the selected values only
+    assert select_values([0, 1.5], np.array([0, 0])).dtype == np.int64
+    assert select_values([0, 1.5], np.array([0, 1])).dtype == np.float64
+
+    onehots = select_values([np.array([1.0, 0.0]), np.array([0.0, 1.0])], np.array([1, 1, 0]))
+    assert np.array_equal(onehots, [[0.0, 1.0], [0.0, 1.0], [1.0, 0.0]])
+
+
+def test_feature_columns_match_nodes() -> None:
+    pdb_path = "tests/data/pdb/101M/101M.pdb"
+    graph, variant = build_testgraph(
+        pdb_path=pdb_path,
+        detail="residue",
+        influence_radius=10,
+        max_edge_length=10,
+        central_res=25,
+        variant=serine,
+    )
+    feature_columns = components.get_feature_columns(pdb_path, GraphArrays.from_graph(graph), variant)
+    assert feature_columns.edge_features == {}
+
+    for node_index, residue in enumerate(graph.node_ids):
+        is_variant = residue == variant.residue
+        assert np.array_equal(feature_columns.node_features[Nfeat.RESTYPE][node_index], residue.amino_acid.onehot)
+        assert feature_columns.node_features[Nfeat.RESMASS][node_index] == residue.amino_acid.mass
+        assert np.array_equal(
+            feature_columns.node_features[Nfeat.VARIANTRES][node_index],
+            serine.onehot if is_variant else residue.amino_acid.onehot,
+        )
+        assert feature_columns.node_features[Nfeat.DIFFSIZE][node_index] == (serine.size - residue.amino_acid.size if is_variant else 0)
+
+    add_feature_columns(graph, feature_columns)
+    assert np.array_equal(graph.get_node_feature(Nfeat.RESCHARGE), feature_columns.node_features[Nfeat.RESCHARGE])
+    assert graph.nodes[0].features[Nfeat.RESSIZE] == feature_columns.node_features[Nfeat.RESSIZE][0]
+
+    add_feature_columns(graph, FeatureColumns(edge_features={"edge_test": np.arange(len(graph.edges))}))
+    assert graph.edges[-1].features["edge_test"] == len(graph.edges) - 1
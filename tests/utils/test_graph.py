@@ -15,7 +15,7 @@ from deeprank2.domain import nodestorage as Nfeat
 from deeprank2.domain import targetstorage as targets
 from deeprank2.molstruct.pair import ResidueContact
 from deeprank2.utils.buildgraph import get_structure
-from deeprank2.utils.graph import Edge, Graph, Node
+from deeprank2.utils.graph import FEATURE_MATRIX, Edge, Graph, Node, get_feature_names, read_features
 from deeprank2.utils.grid import Augmentation, GridSettings, MapMethod
 
 entry_id = "test"
@@ -108,6 +108,37 @@ def test_graph_write_to_hdf5(graph: Graph) -> None:
         shutil.rmtree(tmp_dir_path)  # clean up after the test
 
 
+def test_graph_write_consolidated_features_to_hdf5(graph: Graph) -> None:
+    """Test that the consolidated layout stores one matrix per feature type and reads back the same features."""
+    tmp_dir_path = tempfile.mkdtemp()
+
+    separate_path = os.path.join(tmp_dir_path, "separate.hdf5")
+    consolidated_path = os.path.join(tmp_dir_path, "consolidated.hdf5")
+
+    try:
+        graph.write_to_hdf5(separate_path)
+        graph.write_to_hdf5(consolidated_path, consolidate_features=True)
+
+        with h5py.File(separate_path, "r") as f5_separate, h5py.File(consolidated_path, "r") as f5:
+            for feature_type, metafeatures in [
+                (Nfeat.NODE, [Nfeat.CHAINID, Nfeat.NAME, Nfeat.POSITION]),
+                (Efeat.EDGE, [Efeat.INDEX, Efeat.NAME]),
+            ]:
+                group = f5[entry_id][feature_type]
+                assert sorted(group.keys()) == sorted([*metafeatures, FEATURE_MATRIX])
+
+                assert get_feature_names(group) == get_feature_names(f5_separate[entry_id][feature_type])
+                feature_names = [name for name in get_feature_names(group) if name[0] != "_"]
+                expected_values = read_features(f5_separate[entry_id][feature_type], feature_names)
+                for name, values, expected in zip(feature_names, read_features(group, feature_names), expected_values, strict=True):
+                    assert values.shape == expected.shape, name
+                    assert np.array_equal(values, expected.astype(float)), name
+
+            assert f5[entry_id][Nfeat.NODE][FEATURE_MATRIX].shape == (2, 3 + 1)
+    finally:
+        shutil.rmtree(tmp_dir_path)  # clean up after the test
+
+
 def test_graph_write_as_grid_to_hdf5(graph: Graph) -> None:
     """Test that the graph is correctly written to hdf5 file as a grid."""
     # create a temporary hdf5 file to write to
@@ -213,3 +244,58 @@ def test_graph_augmented_write_as_grid_to_hdf5(graph: Graph) -> None:
 
     finally:
         shutil.rmtree(tmp_dir_path)  # clean up after the test
+
+
+@pytest.mark.parametrize("resolution", ["atom", "residue"])
+def test_build_graph_kdtree(resolution: str) -> None:
+    """Test that the KD-tree neighbour search gives the same graph as the dense distance matrix."""
+    pdb = pdb2sql("tests/data/pdb/101M/101M.pdb")
+    try:
+        structure = get_structure(pdb, entry_id)
+    finally:
+        pdb._close()
+
+    residues = structure.chains[0].residues[:30]
+    nodes = [atom for residue in residues for atom in residue.atoms] if resolution == "atom" else residues
+    max_edge_length = 4.5 if resolution == "atom" else 10.0
+
+    graph_dense = Graph.build_graph(nodes, entry_id, max_edge_length, kdtree_min_atoms=None)
+    graph_kdtree = Graph.build_graph(nodes, entry_id, max_edge_length, kdtree_min_atoms=0)
+
+    assert len(graph_kdtree.edges) > 0
+    assert [str(node_id) for node_id in graph_kdtree.node_ids] == [str(node_id) for node_id in graph_dense.node_ids]
+    assert np.array_equal(graph_kdtree.edge_index, graph_dense.edge_index)
+    assert [str(edge.id) for edge in graph_kdtree.edges] == [str(edge.id) for edge in graph_dense.edges]
+
+
+def test_graph_feature_arrays(graph: Graph) -> None:
+    """Test that features set per node or edge and features set for all nodes or edges at once are the same arrays."""
+    assert graph.node_feature_names == [node_feature_narray, node_feature_singleton, Nfeat.POSITION]
+    assert np.array_equal(graph.get_node_feature(node_feature_narray), [[0.1, 0.1, 0.5], [1.0, 0.9, 0.5]])
+    assert graph.get_node_feature(node_feature_singleton).dtype == np.float64
+    assert np.array_equal(graph.edge_index, [[0], [1]])
+    assert graph.edge_ids == [edge.id for edge in graph.edges]
+
+    # a feature set for all nodes is seen by each node, and the other way around
+    graph.set_node_feature(Nfeat.BSA, np.array([3.0, 4.0]))
+    assert graph.nodes[1].features[Nfeat.BSA] == 4.0
+    graph.nodes[0].features[Nfeat.BSA] = 5.0
+    assert np.array_equal(graph.get_node_feature(Nfeat.BSA), [5.0, 4.0])
+    graph.get_edge(graph.edge_ids[0]).features[Efeat.DISTANCE] = 3.5
+    assert np.array_equal(graph.get_edge_feature(Efeat.DISTANCE), [3.5])
+
+    # a feature that is not set for all nodes cannot be read as an array
+    graph.nodes[0].features[Nfeat.SASA] = 1.0
+    assert Nfeat.SASA not in graph.node_feature_names
+    with pytest.raises(KeyError):
+        graph.get_node_feature(Nfeat.SASA)
+    with pytest.raises(KeyError):
+        graph.nodes[1].features[Nfeat.SASA]
+    with pytest.raises(ValueError):
+        graph.set_node_feature(Nfeat.SASA, np.array([1.0]))
+    with pytest.raises(ValueError):
+        graph.nodes[1].features[node_feature_narray] = np.array([1.0, 2.0])
+
+    assert not graph.has_nan()
+    graph.nodes[1].features[Nfeat.SASA] = np.nan
+    assert graph.has_nan()
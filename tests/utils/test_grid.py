@@ -1,5 +1,7 @@
 import h5py
 import numpy as np
+import pytest
+from scipy.interpolate import BSpline
 
 from deeprank2.query import VALID_RESOLUTIONS, ProteinProteinInterfaceQuery
 from deeprank2.utils.grid import Grid, GridSettings, MapMethod
@@ -47,3 +49,59 @@ def test_grid_orientation() -> None:
 
         assert grid.zs.shape == target_zs.shape
         assert np.all(np.abs(grid.zs - target_zs) < coord_error_margin), f"\n{grid.zs} != \n{target_zs}"
+
+
+@pytest.mark.parametrize("map_method", list(MapMethod))
+def test_map_features_all_channels_at_once(map_method: MapMethod) -> None:
+    """Tests that mapping many points and channels together equals mapping them one by one."""
+    rng = np.random.default_rng(0)
+    grid_settings = GridSettings([12, 10, 8], [12.0, 15.0, 8.0])
+    positions = rng.uniform(-4.0, 4.0, (50, 3))
+    scalar_values = rng.uniform(size=50)
+    array_values = rng.uniform(size=(50, 3))
+
+    grid = Grid("all_at_once", [0.0, 0.0, 0.0], grid_settings)
+    grid.map_features(positions, {"scalar": list(scalar_values), "array": list(array_values)}, map_method)
+
+    reference_grid = Grid("one_by_one", [0.0, 0.0, 0.0], grid_settings)
+    for position, scalar_value, array_value in zip(positions, scalar_values, array_values, strict=True):
+        reference_grid.map_feature(position, "scalar", float(scalar_value), map_method)
+        reference_grid.map_feature(position, "array", array_value, map_method)
+
+    assert list(grid.features) == ["scalar", "array_000", "array_001", "array_002"]
+    for feature_name, reference_data in reference_grid.features.items():
+        assert reference_data.shape == (12, 10, 8)
+        assert np.allclose(grid.features[feature_name], reference_data)
+
+
+def test_map_feature_gaussian() -> None:
+    grid = Grid("gaussian", [0.0, 0.0, 0.0], GridSettings([10, 10, 10], [10.0, 10.0, 10.0]))
+    position = np.array([0.3, -1.2, 2.0])
+    grid.map_feature(position, "feature", 2.0, MapMethod.GAUSSIAN)
+
+    distances = np.sqrt((grid.xgrid - position[0]) ** 2 + (grid.ygrid - position[1]) ** 2 + (grid.zgrid - position[2]) ** 2)
+    assert np.allclose(grid.features["feature"], 2.0 * np.exp(-distances))
+
+
+def test_map_feature_bsp_line() -> None:
+    grid = Grid("bsp_line", [0.0, 0.0, 0.0], GridSettings([10, 10, 10], [10.0, 10.0, 10.0]))
+    position = np.array([0.3, -1.2, 2.0])
+    grid.map_feature(position, "feature", 2.0, MapMethod.BSP_LINE)
+
+    cubic_bspline = BSpline.basis_element(np.arange(-2, 3), extrapolate=False)
+    expected = 2.0
+    for grid_coordinates, coordinate in zip((grid.xgrid, grid.ygrid, grid.zgrid), position, strict=True):
+        expected = expected * np.nan_to_num(cubic_bspline(grid_coordinates - coordinate))
+    assert np.allclose(grid.features["feature"], expected)
+    assert np.isclose(np.sum(grid.features["feature"]), 2.0)
+
+
+def test_map_feature_fast_gaussian() -> None:
+    """Tests that the local stencil gives the same result as the cutoff applied to the full grid, also near and beyond the edges."""
+    grid = Grid("fast_gaussian", [0.0, 0.0, 0.0], GridSettings([10, 12, 14], [10.0, 6.0, 14.0]))
+    for position in ([0.3, -1.2, 2.0], [4.9, 2.5, -7.5], [9.0, 0.0, 0.0], [20.0, 20.0, 20.0]):
+        grid.map_feature(np.array(position), str(position), 2.0, MapMethod.FAST_GAUSSIAN)
+
+        distances = np.sqrt((grid.xgrid - position[0]) ** 2 + (grid.ygrid - position[1]) ** 2 + (grid.zgrid - position[2]) ** 2)
+        expected = np.where(distances < 5.0, 2.0 * np.exp(-distances), 0.0)
+        assert np.allclose(grid.features[str(position)], expected)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from deeprank2.utils.sampler import SizeAwareBatchSampler
+
+rng = np.random.default_rng(42)
+node_counts = rng.integers(50, 5000, size=200)
+edge_counts = 8 * node_counts
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+@pytest.mark.parametrize(("max_nodes", "max_edges"), [(10000, None), (None, 40000), (10000, 40000)])
+def test_batches_within_budget(shuffle: bool, max_nodes: int | None, max_edges: int | None) -> None:
+    sampler = SizeAwareBatchSampler(node_counts, edge_counts, max_nodes=max_nodes, max_edges=max_edges, shuffle=shuffle, bucket_size=64)
+    n_batches = len(sampler)
+    batches = list(sampler)
+    assert len(batches) == n_batches
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(node_counts)))
+    for batch in batches:
+        if len(batch) > 1:
+            assert max_nodes is None or node_counts[batch].sum() <= max_nodes
+            assert max_edges is None or edge_counts[batch].sum() <= max_edges
+
+
+def test_oversized_graph() -> None:
+    sampler = SizeAwareBatchSampler(np.array([10, 500, 20, 30]), np.zeros(4), max_nodes=100)
+    assert list(sampler) == [[0, 2, 3], [1]]
+
+
+def test_no_budget() -> None:
+    with pytest.raises(ValueError):
+        SizeAwareBatchSampler(node_counts, edge_counts)